@@ -0,0 +1,144 @@
+import asyncio
+import atexit
+import concurrent.futures
+import contextvars
+import queue
+import threading
+from typing import Any, AsyncIterator, Callable, Coroutine, Iterator, Optional
+
+_END = object()
+
+
+class BackgroundLoop:
+    """
+    One asyncio event loop running forever in a daemon thread.
+
+    Synchronous code (the Streamlit script thread, atexit hooks) hands
+    coroutines to it with ``submit``/``run``/``stream``, so async resources
+    created on it (MCP sessions, Ollama/HTTP clients) survive between reruns
+    instead of dying with a per-call ``asyncio.run`` loop. Every call carries
+    the caller's contextvars (e.g. the current trace).
+    """
+
+    def __init__(self, name: str = "background-event-loop"):
+        self.name = name
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    @property
+    def loop(self) -> asyncio.AbstractEventLoop:
+        """The running loop, started on first use"""
+        with self._lock:
+            if self._loop is None or self._loop.is_closed():
+                loop = asyncio.new_event_loop()
+                thread = threading.Thread(target=loop.run_forever, name=self.name, daemon=True)
+                thread.start()
+                self._loop, self._thread = loop, thread
+            return self._loop
+
+    def in_loop(self) -> bool:
+        """True when called from a coroutine running on this loop"""
+        try:
+            return asyncio.get_running_loop() is self._loop
+        except RuntimeError:
+            return False
+
+    def submit(self, coro: Coroutine) -> concurrent.futures.Future:
+        """Schedule ``coro`` on the loop and return a thread-safe future"""
+        loop = self.loop
+        return contextvars.copy_context().run(asyncio.run_coroutine_threadsafe, coro, loop)
+
+    def run(self, coro: Coroutine, timeout: Optional[float] = None) -> Any:
+        """Run ``coro`` on the loop and block until it finishes (not callable from the loop itself)"""
+        if self.in_loop():
+            coro.close()
+            raise RuntimeError("BackgroundLoop.run() would deadlock when called from its own loop")
+        future = self.submit(coro)
+        try:
+            return future.result(timeout)
+        except BaseException:
+            future.cancel()
+            raise
+
+    async def run_async(self, coro: Coroutine) -> Any:
+        """Await ``coro`` on the loop from any other event loop"""
+        if self.in_loop():
+            return await coro
+        return await asyncio.wrap_future(self.submit(coro))
+
+    def stream(self, agen: AsyncIterator, idle: Optional[Callable[[], None]] = None,
+               idle_interval: float = 0.25) -> Iterator:
+        """
+        Iterate an async generator from synchronous code. The generator runs as
+        one task on the loop (so its contextvars persist across items) and
+        items are handed over through a queue; leaving the loop early cancels it.
+
+        ``idle()`` is called every ``idle_interval`` seconds while no item
+        arrives; an exception raised by it (e.g. Streamlit stopping the script
+        for a rerun) also cancels the generator.
+        """
+        items: queue.SimpleQueue = queue.SimpleQueue()
+
+        async def pump():
+            try:
+                async for item in agen:
+                    items.put((item, None))
+            except BaseException as e:
+                items.put((_END, e))
+                raise
+            items.put((_END, None))
+
+        future = self.submit(pump())
+        try:
+            while True:
+                if idle is None:
+                    item, error = items.get()
+                else:
+                    try:
+                        item, error = items.get(timeout=idle_interval)
+                    except queue.Empty:
+                        idle()
+                        continue
+                if item is _END:
+                    if error is not None and not isinstance(error, asyncio.CancelledError):
+                        raise error
+                    return
+                yield item
+        finally:
+            future.cancel()
+
+    def stop(self, timeout: float = 5):
+        """Cancel pending tasks and stop the loop thread"""
+        with self._lock:
+            loop, thread, self._loop = self._loop, self._thread, None
+        if loop is None or loop.is_closed():
+            return
+
+        async def cancel_pending():
+            tasks = [t for t in asyncio.all_tasks() if t is not asyncio.current_task()]
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+        try:
+            asyncio.run_coroutine_threadsafe(cancel_pending(), loop).result(timeout)
+        except Exception:
+            pass
+        loop.call_soon_threadsafe(loop.stop)
+        if thread is not None:
+            thread.join(timeout)
+
+
+_background_loop: Optional[BackgroundLoop] = None
+_background_lock = threading.Lock()
+
+
+def get_background_loop() -> BackgroundLoop:
+    """Return the process-wide background loop"""
+    global _background_loop
+    with _background_lock:
+        if _background_loop is None:
+            _background_loop = BackgroundLoop()
+            atexit.register(_background_loop.stop)
+        return _background_loop
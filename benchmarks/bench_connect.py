@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+"""
+Connect latency benchmark: cold MCP session vs. prewarmed warm spare.
+
+Run from the project root so config.json is found:
+
+    python benchmarks/bench_connect.py filesystem --runs 3
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from mcpclient_manager import load_config  # noqa: E402
+from mcpsession_pool import MCPSessionPool  # noqa: E402
+
+
+async def _first_list_tools(pool, server):
+    started = time.perf_counter()
+    await pool.list_tools(server)
+    return (time.perf_counter() - started) * 1000
+
+
+def bench_cold(server, config_path):
+    pool = MCPSessionPool(config_path)
+    try:
+        return asyncio.run(_first_list_tools(pool, server))
+    finally:
+        pool.shutdown()
+
+
+def bench_prewarmed(server, config_path):
+    pool = MCPSessionPool(config_path)
+    try:
+        pool.start_prewarm([server]).result(timeout=120)
+        return asyncio.run(_first_list_tools(pool, server))
+    finally:
+        pool.shutdown()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("server", nargs="?", help="MCP server name (default: default_server_type)")
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--config", default="config.json")
+    args = parser.parse_args()
+    server = args.server or load_config(args.config).get("default_server_type")
+
+    cold = [bench_cold(server, args.config) for _ in range(args.runs)]
+    warm = [bench_prewarmed(server, args.config) for _ in range(args.runs)]
+
+    print(f"server: {server}  runs: {args.runs}")
+    print(f"{'mode':<12}{'min ms':>10}{'avg ms':>10}{'max ms':>10}")
+    for label, samples in (("cold", cold), ("prewarmed", warm)):
+        print(f"{label:<12}{min(samples):>10.1f}{sum(samples) / len(samples):>10.1f}{max(samples):>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
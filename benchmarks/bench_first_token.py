@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+"""
+First-token latency benchmark: cold model vs. model preloaded at connect time.
+
+Each cold run unloads the model first (keep_alive=0). Run with Ollama up:
+
+    python benchmarks/bench_first_token.py llama3.2:latest --runs 3
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+import ollama
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from model_preload import keep_alive_for, preload_model  # noqa: E402
+
+PROMPT = [{"role": "user", "content": "Reply with the single word: ok"}]
+
+
+async def _first_token_ms(client, model, keep_alive):
+    started = time.perf_counter()
+    elapsed = None
+    # 讀完整個串流，避免下一次量測被未結束的生成影響
+    async for part in await client.chat(model=model, messages=PROMPT, stream=True, keep_alive=keep_alive):
+        if elapsed is None and (part.message.content or part.done):
+            elapsed = (time.perf_counter() - started) * 1000
+    return elapsed
+
+
+async def bench_cold(model):
+    client = ollama.AsyncClient()
+    await client.chat(model=model, messages=[], keep_alive=0)
+    return await _first_token_ms(client, model, keep_alive_for(model))
+
+
+async def bench_preloaded(model):
+    client = ollama.AsyncClient()
+    await client.chat(model=model, messages=[], keep_alive=0)
+    await preload_model(model, client)
+    return await _first_token_ms(client, model, keep_alive_for(model))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("model", help="Ollama model name, e.g. llama3.2:latest")
+    parser.add_argument("--runs", type=int, default=3)
+    args = parser.parse_args()
+
+    cold = [asyncio.run(bench_cold(args.model)) for _ in range(args.runs)]
+    warm = [asyncio.run(bench_preloaded(args.model)) for _ in range(args.runs)]
+
+    print(f"model: {args.model}  runs: {args.runs}")
+    print(f"{'mode':<12}{'min ms':>10}{'avg ms':>10}{'max ms':>10}")
+    for label, samples in (("cold", cold), ("preloaded", warm)):
+        print(f"{label:<12}{min(samples):>10.1f}{sum(samples) / len(samples):>10.1f}{max(samples):>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+"""
+HTTP transport benchmark: tool calls per second against a local streamable HTTP MCP server.
+
+Starts a stand-in FastMCP server (one ``echo`` tool) on localhost and compares
+
+  - new session per call, new connections  (connect per call, nothing reused)
+  - new session per call, keep-alive       (reconnects through the shared HTTP pool)
+  - pooled session                         (MCPSessionPool, session + connections reused)
+
+No Ollama or external MCP server needed:
+
+    python benchmarks/bench_http_transport.py --calls 200
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import socket
+import sys
+import tempfile
+import threading
+import logging
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import uvicorn  # noqa: E402
+from mcp.server.fastmcp import FastMCP  # noqa: E402
+
+from background_loop import get_background_loop  # noqa: E402
+from http_transport import get_http_client_pool  # noqa: E402
+from mcpclient_manager import MCPClientManager  # noqa: E402
+from mcpsession_pool import MCPSessionPool  # noqa: E402
+
+SERVER = "bench_http"
+
+
+def start_server():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        port = s.getsockname()[1]
+    mcp = FastMCP("bench", log_level="WARNING")
+
+    @mcp.tool()
+    def echo(text: str) -> str:
+        """Return the text unchanged"""
+        return text
+
+    server = uvicorn.Server(uvicorn.Config(mcp.streamable_http_app(), host="127.0.0.1", port=port, log_level="error"))
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.05)
+    return server, f"http://127.0.0.1:{port}/mcp"
+
+
+def write_config(url):
+    config = {"MCP_Servers": {SERVER: {"type": "http", "mode": "http", "connection": {"url": url}}}}
+    fd, path = tempfile.mkstemp(suffix=".json")
+    with os.fdopen(fd, "w") as f:
+        json.dump(config, f)
+    return path
+
+
+async def _connect_per_call(config_path, calls, keep_alive):
+    http_pool = get_http_client_pool(config_path)
+    for i in range(calls):
+        async with MCPClientManager(SERVER, config_path) as client:
+            await client.call_tool("echo", {"text": str(i)})
+        if not keep_alive:
+            await http_pool.aclose(SERVER)
+
+
+def bench_connect_per_call(config_path, calls, keep_alive):
+    started = time.perf_counter()
+    # 跟 session pool 一樣在背景 loop 上跑，共用的 keep-alive 連線綁在那個 loop
+    get_background_loop().run(_connect_per_call(config_path, calls, keep_alive))
+    return calls / (time.perf_counter() - started)
+
+
+async def _pooled_calls(pool, calls):
+    for i in range(calls):
+        await pool.call_tool(SERVER, "echo", {"text": str(i)})
+
+
+def bench_pooled(config_path, calls):
+    pool = MCPSessionPool(config_path)
+    try:
+        pool.start_prewarm([SERVER]).result(timeout=30)
+        started = time.perf_counter()
+        asyncio.run(_pooled_calls(pool, calls))
+        return calls / (time.perf_counter() - started)
+    finally:
+        pool.shutdown()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--calls", type=int, default=200)
+    args = parser.parse_args()
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+
+    server, url = start_server()
+    config_path = write_config(url)
+    try:
+        results = [
+            ("new session, new connections", bench_connect_per_call(config_path, args.calls, keep_alive=False)),
+            ("new session, keep-alive", bench_connect_per_call(config_path, args.calls, keep_alive=True)),
+            ("pooled session", bench_pooled(config_path, args.calls)),
+        ]
+    finally:
+        server.should_exit = True
+        os.unlink(config_path)
+
+    print(f"server: {url}  calls: {args.calls}")
+    print(f"{'mode':<32}{'calls/s':>10}")
+    for label, rate in results:
+        print(f"{label:<32}{rate:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+"""
+Tool spec benchmark: rebuilding + serializing specs per request vs. the cached specs.
+
+Per request the agent needs the spec list (for ollama.chat) and its JSON
+(for the debug log / token estimate). No Ollama or MCP server needed:
+
+    python benchmarks/bench_tool_specs.py --sizes 10 100 1000
+"""
+
+import argparse
+import json
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ollama_toolmanager import OllamaToolManager  # noqa: E402
+
+
+async def _noop(name, arguments):
+    return None
+
+
+def make_manager(size):
+    manager = OllamaToolManager()
+    for i in range(size):
+        manager.register_tool(
+            name=f"tool_{i}",
+            function=_noop,
+            description=f"Tool number {i}: reads, writes or lists files under a directory",
+            inputSchema={
+                "type": "object",
+                "properties": {
+                    "path": {"type": "string", "description": "Absolute path"},
+                    "recursive": {"type": "boolean", "default": False},
+                    "pattern": {"type": "string", "description": "Glob pattern"},
+                },
+                "required": ["path"],
+            },
+        )
+    return manager
+
+
+def rebuild_per_request(manager):
+    specs = [manager._compile_spec(name, tool) for name, tool in manager.tools.items()]
+    return specs, json.dumps(specs, ensure_ascii=False)
+
+
+def cached(manager):
+    return manager.get_tools(), manager.get_tools_json()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 100, 1000])
+    parser.add_argument("--number", type=int, default=200, help="requests per measurement")
+    args = parser.parse_args()
+
+    print(f"{'tools':>6}{'rebuild us':>14}{'cached us':>12}{'speedup':>10}")
+    for size in args.sizes:
+        manager = make_manager(size)
+        rebuild = min(timeit.repeat(lambda: rebuild_per_request(manager), number=args.number, repeat=3))
+        hit = min(timeit.repeat(lambda: cached(manager), number=args.number, repeat=3))
+        rebuild_us = rebuild / args.number * 1e6
+        hit_us = hit / args.number * 1e6
+        print(f"{size:>6}{rebuild_us:>14.1f}{hit_us:>12.1f}{rebuild_us / hit_us:>9.0f}x")
+
+
+if __name__ == "__main__":
+    main()
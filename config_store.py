@@ -0,0 +1,118 @@
+import copy
+import json
+import os
+import tempfile
+import threading
+from contextlib import contextmanager
+from typing import Any, Dict, Optional
+
+
+class ConfigStore:
+    """
+    Process-wide cache of one JSON config file.
+
+    ``get()`` parses the file once and only re-parses it when its mtime or size
+    changes, so hot paths can call it freely. The returned dict is shared and
+    must be treated as read-only; change the config through ``batch()``, which
+    applies every change made inside the block with a single atomic write
+    (temp file + rename), so concurrent readers never see a half-written file.
+    """
+
+    def __init__(self, path: str = "config.json"):
+        self.path = path
+        self._lock = threading.RLock()
+        self._config: Dict[str, Any] = {}
+        self._signature = None
+        self._pending: Optional[Dict[str, Any]] = None
+        self._depth = 0
+        self.stats = {"loads": 0, "writes": 0}
+
+    def _stat_signature(self):
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return (st.st_mtime_ns, st.st_size)
+
+    @property
+    def exists(self) -> bool:
+        return self._stat_signature() is not None
+
+    def get(self) -> Dict[str, Any]:
+        """Return the parsed config, reloading it only if the file changed"""
+        signature = self._stat_signature()
+        with self._lock:
+            if self._pending is not None:
+                return self._pending
+            if signature != self._signature:
+                if signature is None:
+                    self._config = {}
+                else:
+                    with open(self.path, "r", encoding="utf-8") as f:
+                        self._config = json.load(f)
+                    self.stats["loads"] += 1
+                self._signature = signature
+            return self._config
+
+    def section(self, name: str) -> Dict[str, Any]:
+        """Shortcut for ``get().get(name, {})``"""
+        return self.get().get(name, {})
+
+    @contextmanager
+    def batch(self):
+        """
+        Yield a mutable copy of the config. Nested ``batch()`` blocks share the
+        same copy; the outermost block writes it once if anything changed.
+        If the block raises, nothing is written and the copy is discarded.
+        """
+        with self._lock:
+            if self._depth == 0:
+                self._pending = copy.deepcopy(self.get())
+            self._depth += 1
+            failed = False
+            try:
+                yield self._pending
+            except BaseException:
+                failed = True
+                raise
+            finally:
+                self._depth -= 1
+                if self._depth == 0:
+                    pending, self._pending = self._pending, None
+                    if not failed and pending != self._config:
+                        self._write(pending)
+
+    def save(self, config: Dict[str, Any]):
+        """Replace the whole config with one atomic write"""
+        with self._lock:
+            self._write(copy.deepcopy(config))
+
+    def _write(self, config: Dict[str, Any]):
+        directory = os.path.dirname(os.path.abspath(self.path))
+        fd, tmp_path = tempfile.mkstemp(prefix=".config-", suffix=".json.tmp", dir=directory)
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(config, f, ensure_ascii=False, indent=2)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        self._config = config
+        self._signature = self._stat_signature()
+        self.stats["writes"] += 1
+
+
+_stores: Dict[str, ConfigStore] = {}
+_stores_lock = threading.Lock()
+
+
+def get_config_store(path: str = "config.json") -> ConfigStore:
+    """Return the shared ConfigStore for ``path``"""
+    key = os.path.abspath(path)
+    with _stores_lock:
+        if key not in _stores:
+            _stores[key] = ConfigStore(path)
+        return _stores[key]
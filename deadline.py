@@ -0,0 +1,83 @@
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, Optional
+
+from config_store import get_config_store
+
+# 目前這段工作的截止時間（time.monotonic()）；經 contextvars 傳到背景 loop 上的 MCP 呼叫
+_deadline: ContextVar[Optional[float]] = ContextVar("deadline", default=None)
+
+
+@contextmanager
+def deadline(seconds: Optional[float]):
+    """
+    Run the block with a deadline ``seconds`` from now. A nested deadline can
+    only shorten the outer one; ``None`` or 0 leaves the current deadline as is.
+    """
+    if not seconds:
+        yield
+        return
+    new = time.monotonic() + seconds
+    current = _deadline.get()
+    token = _deadline.set(new if current is None else min(current, new))
+    try:
+        yield
+    finally:
+        try:
+            _deadline.reset(token)
+        except ValueError:
+            # async generator 在不同 context 結束時無法 reset
+            _deadline.set(current)
+
+
+def remaining() -> Optional[float]:
+    """Seconds left before the current deadline (may be negative), or None"""
+    current = _deadline.get()
+    return None if current is None else current - time.monotonic()
+
+
+def timeout_for(seconds: Optional[float] = None) -> Optional[float]:
+    """``seconds`` capped by the current deadline, for ``asyncio.timeout``; None means no limit"""
+    left = remaining()
+    if not seconds:
+        return left
+    return seconds if left is None else min(seconds, left)
+
+
+class TimeoutPolicy:
+    """
+    Timeouts in seconds from the ``Timeouts`` section of config.json.
+    ``turn`` bounds a whole agent turn, ``llm`` each model request, and a
+    tool call uses ``PER_TOOL_TIMEOUT[name]``, then ``SERVER_TOOL_TIMEOUT[server]``,
+    then ``TOOL_TIMEOUT``. 0 or null means no limit.
+    """
+
+    def __init__(self, turn: Optional[float] = None, llm: Optional[float] = None, tool: Optional[float] = None,
+                 servers: Optional[Dict[str, float]] = None, tools: Optional[Dict[str, float]] = None):
+        self.turn = turn
+        self.llm = llm
+        self.tool = tool
+        self.servers = servers or {}
+        self.tools = tools or {}
+
+    @classmethod
+    def from_settings(cls, settings: Dict[str, Any]):
+        return cls(
+            turn=settings.get("TURN_TIMEOUT"),
+            llm=settings.get("LLM_TIMEOUT"),
+            tool=settings.get("TOOL_TIMEOUT"),
+            servers=settings.get("SERVER_TOOL_TIMEOUT"),
+            tools=settings.get("PER_TOOL_TIMEOUT"),
+        )
+
+    def for_tool(self, server: Optional[str], name: str) -> Optional[float]:
+        if name in self.tools:
+            return self.tools[name]
+        if server in self.servers:
+            return self.servers[server]
+        return self.tool
+
+
+def timeout_policy_from_config(config_path: str = "config.json") -> TimeoutPolicy:
+    return TimeoutPolicy.from_settings(get_config_store(config_path).section("Timeouts"))
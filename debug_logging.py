@@ -0,0 +1,151 @@
+import atexit
+import json
+import logging
+import logging.handlers
+import queue
+import threading
+from typing import Any, Optional
+
+from pydantic import BaseModel
+
+from config_store import get_config_store
+
+# 預設值，可由 config.json 的 "Logging" 區段覆寫
+DEFAULT_LOG_FILE = "debug.log"
+DEFAULT_MAX_BYTES = 5 * 1024 * 1024
+DEFAULT_BACKUP_COUNT = 3
+DEFAULT_MAX_PAYLOAD_CHARS = 2000
+
+_listener: Optional[logging.handlers.QueueListener] = None
+_queue: Optional[queue.SimpleQueue] = None
+_lock = threading.Lock()
+
+
+def _settings():
+    try:
+        return get_config_store().section("Logging")
+    except Exception:
+        return {}
+
+
+def _ensure_listener() -> queue.SimpleQueue:
+    """Start the single background thread that writes every log record to disk"""
+    global _listener, _queue
+    with _lock:
+        if _listener is None:
+            settings = _settings()
+            handler = logging.handlers.RotatingFileHandler(
+                settings.get("LOG_FILE", DEFAULT_LOG_FILE),
+                maxBytes=settings.get("MAX_BYTES", DEFAULT_MAX_BYTES),
+                backupCount=settings.get("BACKUP_COUNT", DEFAULT_BACKUP_COUNT),
+                encoding="utf-8",
+                delay=True,
+            )
+            handler.setFormatter(logging.Formatter('%(asctime)s %(levelname)s %(name)s %(message)s'))
+            _queue = queue.SimpleQueue()
+            _listener = logging.handlers.QueueListener(_queue, handler)
+            _listener.start()
+            atexit.register(_listener.stop)
+        return _queue
+
+
+class _DeferredQueueHandler(logging.handlers.QueueHandler):
+    """
+    QueueHandler that leaves formatting to the listener thread. The stdlib
+    ``prepare()`` merges the message on the calling thread, which would render
+    every Payload on the event loop.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+
+def get_logger(name: str) -> logging.Logger:
+    """
+    Return a logger whose records are handed to a queue and written to the
+    rotating log file by a background thread, so callers never block on disk.
+    The level comes from ``Logging.LEVEL`` (default DEBUG); set it to INFO to
+    keep only the cheap per-turn timing records.
+    """
+    logger = logging.getLogger(name)
+    if not any(isinstance(h, logging.handlers.QueueHandler) for h in logger.handlers):
+        logger.handlers = [_DeferredQueueHandler(_ensure_listener())]
+        logger.propagate = False
+    logger.setLevel(_settings().get("LEVEL", "DEBUG"))
+    return logger
+
+
+def payload_logging_enabled() -> bool:
+    return _settings().get("LOG_PAYLOADS", True)
+
+
+def _truncate(text: str, limit: int) -> str:
+    if len(text) > limit:
+        return f"{text[:max(limit, 0)]}...[{len(text) - max(limit, 0)} more chars]"
+    return text
+
+
+def _items(obj: Any):
+    """``(open, close, total, (prefix, value) pairs)`` for containers rendered item by item, else None"""
+    if isinstance(obj, dict):
+        return "{", "}", len(obj), ((json.dumps(str(k), ensure_ascii=False) + ": ", v) for k, v in obj.items())
+    if isinstance(obj, (list, tuple)):
+        return "[", "]", len(obj), (("", v) for v in obj)
+    if isinstance(obj, BaseModel):
+        # CallToolResult 等 pydantic 物件：逐欄位輸出，不先 model_dump 整個物件
+        fields = type(obj).model_fields
+        return f"{type(obj).__name__}(", ")", len(fields), ((f"{name}=", getattr(obj, name, None)) for name in fields)
+    return None
+
+
+def _render(obj: Any, limit: int, nested: bool = False) -> str:
+    """
+    Render ``obj`` to at most about ``limit`` chars. Containers and pydantic
+    models are walked item by item and long strings are sliced, so a big
+    payload is never stringified in full.
+    """
+    if isinstance(obj, str):
+        if nested:
+            return json.dumps(obj[:limit], ensure_ascii=False) + (f"...[{len(obj) - limit} more chars]" if len(obj) > limit else "")
+        return _truncate(obj, limit)
+    if obj is None or isinstance(obj, (bool, int, float)):
+        return json.dumps(obj) if nested else repr(obj)
+    container = _items(obj)
+    if container is None:
+        return _truncate(repr(obj), limit)
+    open_, close, total, items = container
+    parts, size = [], 0
+    for i, (prefix, value) in enumerate(items):
+        if size > limit:
+            parts.append(f"...{total - i} more items")
+            break
+        part = prefix + _render(value, max(limit - size, 0), nested=True)
+        parts.append(part)
+        size += len(part) + 2
+    return _truncate(open_ + ", ".join(parts) + close, limit)
+
+
+class Payload:
+    """
+    Log argument for large data (messages, tool schemas, tool results).
+
+    Rendering happens only if the record is actually emitted, runs on the log
+    writer thread, is truncated to ``Logging.MAX_PAYLOAD_CHARS``, and is
+    skipped entirely when ``Logging.LOG_PAYLOADS`` is false. Use with %-style logging:
+    ``logger.debug("messages: %s", Payload(self.messages))``.
+    """
+    __slots__ = ("obj", "limit")
+
+    def __init__(self, obj: Any, limit: Optional[int] = None):
+        self.obj = obj
+        self.limit = limit
+
+    def __str__(self) -> str:
+        if not payload_logging_enabled():
+            return f"<{type(self.obj).__name__} omitted>"
+        limit = self.limit or _settings().get("MAX_PAYLOAD_CHARS", DEFAULT_MAX_PAYLOAD_CHARS)
+        try:
+            return _render(self.obj, limit)
+        except RuntimeError as e:
+            # 在 listener thread 上渲染，物件可能正被呼叫端修改
+            return f"<{type(self.obj).__name__} changed while logging: {e}>"
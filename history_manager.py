@@ -0,0 +1,148 @@
+from typing import Any, Dict, List, Optional, Tuple
+
+# 粗估：平均 4 個字元約 1 個 token，每則訊息另加固定開銷
+CHARS_PER_TOKEN = 4
+MESSAGE_OVERHEAD_TOKENS = 4
+OMITTED_NOTE = "[{count} earlier conversation turns omitted to fit the context budget]"
+
+
+def estimate_tokens(message: Dict[str, Any]) -> int:
+    """Rough token estimate for one chat message"""
+    chars = len(message.get('content') or '')
+    for tool_call in message.get('tool_calls') or []:
+        function = tool_call['function'] if isinstance(tool_call, dict) else tool_call.function
+        name = function['name'] if isinstance(function, dict) else function.name
+        arguments = function['arguments'] if isinstance(function, dict) else function.arguments
+        chars += len(name) + len(str(arguments))
+    return chars // CHARS_PER_TOKEN + MESSAGE_OVERHEAD_TOKENS
+
+
+def _elide(message: Dict[str, Any], keep_chars: int) -> Dict[str, Any]:
+    content = message.get('content') or ''
+    if len(content) <= keep_chars:
+        return message
+    elided = dict(message)
+    elided['content'] = f"{content[:keep_chars]}\n...[{len(content) - keep_chars} chars of earlier tool output elided]"
+    return elided
+
+
+class ConversationHistory:
+    """
+    Builds the message list sent to the model from the full transcript so it
+    fits a token budget. The transcript itself (``OllamaAgent.messages``) is
+    never modified.
+
+    Compaction order, stopping as soon as the budget is met:
+      1. tool outputs older than the last ``keep_recent_turns`` turns are elided
+      2. those older turns are dropped, oldest first, and replaced by a short note
+      3. only if ``elide_recent_tool_output`` is set: tool outputs of the recent
+         turns (all but the current one) are elided
+      4. recent turns are dropped, oldest first
+    The system prompt and the current turn are always sent verbatim; recent
+    turns stay verbatim unless the older history alone cannot meet the budget.
+    """
+
+    def __init__(self, system_prompt: Optional[str] = None, token_budget: int = 6000,
+                 keep_recent_turns: int = 3, elided_tool_output_chars: int = 300,
+                 elide_recent_tool_output: bool = False):
+        self.system_prompt = system_prompt
+        self.token_budget = token_budget
+        self.keep_recent_turns = max(1, keep_recent_turns)
+        self.elided_tool_output_chars = elided_tool_output_chars
+        self.elide_recent_tool_output = elide_recent_tool_output
+        self.last_stats: Dict[str, int] = {}
+
+    @classmethod
+    def from_settings(cls, model: str, system_prompt: Optional[str], settings: Dict[str, Any]):
+        """Create from the ``History_Settings`` section of config.json"""
+        budgets = settings.get("MODEL_TOKEN_BUDGETS", {})
+        return cls(
+            system_prompt=system_prompt,
+            token_budget=budgets.get(model, settings.get("DEFAULT_TOKEN_BUDGET", 6000)),
+            keep_recent_turns=settings.get("KEEP_RECENT_TURNS", 3),
+            elided_tool_output_chars=settings.get("ELIDED_TOOL_OUTPUT_CHARS", 300),
+            elide_recent_tool_output=settings.get("ELIDE_RECENT_TOOL_OUTPUT", False),
+        )
+
+    @staticmethod
+    def _split_turns(messages: List[Dict[str, Any]]) -> List[List[Dict[str, Any]]]:
+        turns = []
+        for message in messages:
+            if message.get('role') == 'user' or not turns:
+                turns.append([])
+            turns[-1].append(message)
+        return turns
+
+    def _elide_turns(self, turns, start: int, stop: int) -> int:
+        """Elide tool outputs in ``turns[start:stop]``; return how many were elided"""
+        count = 0
+        for i in range(max(start, 0), max(stop, 0)):
+            compacted = [
+                _elide(m, self.elided_tool_output_chars) if m.get('role') == 'tool' else m
+                for m in turns[i]
+            ]
+            count += sum(1 for a, b in zip(turns[i], compacted) if a is not b)
+            turns[i] = compacted
+        return count
+
+    def build(self, messages: List[Dict[str, Any]]) -> Tuple[List[Dict[str, Any]], Dict[str, int]]:
+        """
+        Return ``(request_messages, stats)``. ``stats`` reports the estimated
+        tokens kept and dropped and how many messages were elided or turns dropped.
+        """
+        system = [{'role': 'system', 'content': self.system_prompt}] if self.system_prompt else []
+        original_tokens = sum(estimate_tokens(m) for m in system + messages)
+        turns = self._split_turns(messages)
+        costs = [sum(estimate_tokens(m) for m in turn) for turn in turns]
+        total = sum(costs) + sum(estimate_tokens(m) for m in system)
+        elided = 0
+        dropped_turns = 0
+
+        def recount(i):
+            nonlocal total
+            cost = sum(estimate_tokens(m) for m in turns[i])
+            total += cost - costs[i]
+            costs[i] = cost
+
+        def elide(start, stop):
+            nonlocal elided
+            if total <= self.token_budget:
+                return
+            elided += self._elide_turns(turns, start, stop)
+            for i in range(max(start, 0), max(stop, 0)):
+                recount(i)
+
+        # 丟掉舊 turn 時會多一則說明訊息，也要算進預算
+        note_cost = estimate_tokens({'content': OMITTED_NOTE.format(count=len(turns))})
+
+        def drop(stop):
+            nonlocal total, dropped_turns
+            while total > self.token_budget and dropped_turns < stop:
+                total -= costs[dropped_turns]
+                if not dropped_turns:
+                    total += note_cost
+                dropped_turns += 1
+
+        # 先壓縮、丟棄較舊的 turn，最近的 turn 盡量保持原樣
+        boundary = max(len(turns) - self.keep_recent_turns, 0)
+        elide(0, boundary)
+        drop(boundary)
+        if self.elide_recent_tool_output:
+            elide(max(boundary, dropped_turns), len(turns) - 1)
+        drop(len(turns) - 1)
+
+        request = list(system)
+        if dropped_turns:
+            request.append({'role': 'system', 'content': OMITTED_NOTE.format(count=dropped_turns)})
+        for turn in turns[dropped_turns:]:
+            request.extend(turn)
+
+        kept = sum(estimate_tokens(m) for m in request)
+        self.last_stats = {
+            "budget": self.token_budget,
+            "kept_tokens": kept,
+            "dropped_tokens": max(original_tokens - kept, 0),
+            "elided_messages": elided,
+            "dropped_turns": dropped_turns,
+        }
+        return request, self.last_stats
@@ -0,0 +1,104 @@
+import threading
+from typing import Any, Dict, Optional
+
+import httpx
+
+from config_store import get_config_store
+from debug_logging import get_logger
+
+logger = get_logger("http_transport_debug")
+
+
+class _SharedTransport(httpx.AsyncBaseTransport):
+    """
+    Forwards to a per-server transport without closing it. The MCP clients
+    open and close their ``httpx.AsyncClient`` for every session; the keep-alive
+    connections underneath stay in the pool for the next session.
+    """
+
+    def __init__(self, transport: httpx.AsyncHTTPTransport, stats: Dict[str, int]):
+        self._transport = transport
+        self._stats = stats
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        self._stats["requests"] += 1
+        return await self._transport.handle_async_request(request)
+
+    async def aclose(self) -> None:
+        # 由 HTTPClientPool.aclose 關閉
+        pass
+
+
+class HTTPClientPool:
+    """
+    One keep-alive connection pool per sse/http MCP server, shared by every
+    session the session pool opens to it (pooled sessions, warm spares,
+    reconnects). Limits come from the ``HTTP_Transport`` section.
+    """
+
+    def __init__(self, max_connections: int = 10, max_keepalive_connections: int = 5,
+                 keepalive_expiry: float = 30.0, timeout: float = 30.0):
+        self.limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive_connections,
+            keepalive_expiry=keepalive_expiry,
+        )
+        self.timeout = timeout
+        self.stats: Dict[str, Dict[str, int]] = {}
+        self._transports: Dict[str, httpx.AsyncHTTPTransport] = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_settings(cls, settings: Dict[str, Any]):
+        return cls(
+            max_connections=settings.get("MAX_CONNECTIONS", 10),
+            max_keepalive_connections=settings.get("MAX_KEEPALIVE_CONNECTIONS", 5),
+            keepalive_expiry=settings.get("KEEPALIVE_EXPIRY", 30.0),
+            timeout=settings.get("TIMEOUT", 30.0),
+        )
+
+    def _transport(self, server_type: str) -> _SharedTransport:
+        with self._lock:
+            if server_type not in self._transports:
+                self._transports[server_type] = httpx.AsyncHTTPTransport(limits=self.limits)
+                self.stats[server_type] = {"clients": 0, "requests": 0}
+            self.stats[server_type]["clients"] += 1
+            return _SharedTransport(self._transports[server_type], self.stats[server_type])
+
+    def factory(self, server_type: str):
+        """An ``httpx_client_factory`` for ``sse_client`` / ``streamablehttp_client``"""
+        def create(headers: Optional[Dict[str, str]] = None, timeout: Optional[httpx.Timeout] = None,
+                   auth: Optional[httpx.Auth] = None) -> httpx.AsyncClient:
+            # 與 mcp.shared._httpx_utils.create_mcp_http_client 相同的預設值
+            return httpx.AsyncClient(
+                transport=self._transport(server_type),
+                follow_redirects=True,
+                timeout=timeout if timeout is not None else httpx.Timeout(self.timeout),
+                headers=headers,
+                auth=auth,
+            )
+        return create
+
+    async def aclose(self, server_type: Optional[str] = None):
+        """Close the keep-alive connections of one server, or of every server"""
+        with self._lock:
+            names = [server_type] if server_type else list(self._transports)
+            transports = [self._transports.pop(name) for name in names if name in self._transports]
+        for transport in transports:
+            try:
+                await transport.aclose()
+            except Exception as e:
+                logger.warning("[WARNING] closing HTTP transport failed: %s", e)
+
+
+_http_pool: Optional[HTTPClientPool] = None
+_http_pool_lock = threading.Lock()
+
+
+def get_http_client_pool(config_path: str = "config.json") -> HTTPClientPool:
+    """Return the process-wide HTTP connection pool"""
+    global _http_pool
+    with _http_pool_lock:
+        if _http_pool is None:
+            _http_pool = HTTPClientPool.from_settings(get_config_store(config_path).section("HTTP_Transport"))
+        return _http_pool
@@ -3,11 +3,16 @@ BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 ollama_models_path = os.path.join(BASE_DIR, ".ollama", "models")
 os.environ["OLLAMA_MODELS"] = ollama_models_path
 import asyncio
+import signal
 import ollama
 # from mcp import StdioServerParameters # Moved into main()
-from mcpclient_manager import MCPClientManager, get_available_servers, load_config
-from ollama_toolmanager import OllamaToolManager
-from ollama_agent import OllamaAgent
+from mcpclient_manager import get_available_servers, load_config
+from mcpsession_pool import get_session_pool
+from tool_catalog import get_tool_catalog, sync_tool_manager
+from model_setting import sync_model_tool_support
+from model_preload import preload_enabled
+from ollama_toolmanager import tool_manager_from_config
+from ollama_agent import OllamaAgent, TextDelta, ToolCallStart, ToolResult, Done
 
 from rich.console import Console
 from rich.panel import Panel
@@ -33,6 +38,12 @@ def select_model_and_initialize_agent(console: Console):
         console.print("[bold red]No Ollama models found. Please pull a model first.[/bold red]")
         return None
 
+    # 先以 ollama.show 探測新模型是否支援 tool call，避免第一次請求才失敗
+    sync_model_tool_support(
+        available_models,
+        {model['model']: model.get('digest') for model in available_models_data['models']}
+    )
+
     console.print("\n[bold cyan]Available Ollama Models:[/bold cyan]")
     for model_name in available_models:
         console.print(f"- {model_name}")
@@ -75,68 +86,160 @@ def select_model_and_initialize_agent(console: Console):
         elif user_choice.isdigit() and 1 <= int(user_choice) <= len(available_servers):
             selected_server = available_servers[int(user_choice) - 1]
             break
+        elif "," in user_choice:
+            # 以逗號分隔可同時連接多個 server，例如 "filesystem,excel" 或 "1,3"
+            choices = [
+                available_servers[int(c) - 1] if c.isdigit() and 1 <= int(c) <= len(available_servers) else c
+                for c in (c.strip() for c in user_choice.split(",")) if c
+            ]
+            if choices and all(c in available_servers for c in choices):
+                selected_server = list(dict.fromkeys(choices))
+                break
+            console.print(f"[prompt.invalid]Invalid server choice: '{user_choice}'. Please choose from the list.")
         else:
             console.print(f"[prompt.invalid]Invalid server choice: '{user_choice}'. Please choose from the list.")
 
     # Get repository path (only needed for git server)
     repo_path = None
-    if selected_server == "git":
+    if selected_server == "git" or (isinstance(selected_server, list) and "git" in selected_server):
         prompt_message = "Enter repository path, use `pwd` to fetch full path."
         repo_path = Prompt.ask(prompt_message, console=console).strip()
 
-    # Initialize OllamaToolManager here or pass as an argument if it's complex/shared
-    tool_manager = OllamaToolManager()
+    # 與 Streamlit 相同的設定建立 OllamaToolManager
+    tool_manager = tool_manager_from_config()
     agent = OllamaAgent(selected_model_name, tool_manager, repo_path)
 
     return [agent, selected_server, repo_path]
 
 async def main():
     console = Console()
+    pool = get_session_pool()
+    if pool.prewarm_enabled:
+        # 使用者選模型/server 的同時，在背景啟動 warm spare server
+        pool.start_prewarm()
+    pool.start_health_checks()
 
     agent, selected_server, repo_path = select_model_and_initialize_agent(console)
     if agent is None:
         console.print("[bold red]Agent initialization failed. Exiting.[/bold red]")
         return
 
-    print(f"Fetching available tools from the {selected_server} MCP server")
-    async with MCPClientManager(selected_server, repo_path) as mcpclient:
-        tools_list = await mcpclient.get_available_tools()
-        console.clear()
-        console.print(Panel.fit("🚀 Welcome to Ollama MCP Client 🚀", padding=(1, 4)))
-        console.status("Registering Tools", spinner="dots")
+    servers = [selected_server] if isinstance(selected_server, str) else selected_server
+    print(f"Fetching available tools from the {', '.join(servers)} MCP server")
+
+    def make_call_tool(server):
+        async def call_tool(tool_name, arguments):
+            # 所有工具呼叫共用 pool 中已初始化的 session
+            return await pool.call_tool(server, tool_name, arguments)
+        return call_tool
+
+    async def connect(server):
+        tools_list = await get_tool_catalog().list_tools(server)
+        call_tool = make_call_tool(server)
         for tool in tools_list:
             agent.tool_manager.register_tool(
                 name=tool.name,
-                function=mcpclient.call_tool, # Passing the function reference here
+                function=call_tool,
                 description=tool.description,
-                inputSchema=tool.inputSchema
+                inputSchema=tool.inputSchema,
+                server=server
             )
 
-        while True:
-            try:
-                print("-" * 40)
-                user_prompt = input("How can I help you?\n")
-                print("-" * 40)
-                if user_prompt.lower() in ['quit', 'exit', 'q']:
-                    break
-                print()
-                with console.status("[bold green]Finding the right tool for the job...[/bold green]", spinner="dots"):
-                    try:
-                        res = await agent.get_response(user_prompt)
-                    except Exception as e:
-                        res = f"Error: {e}"
-
-                    if not res:
-                        res = "[red]No response from agent.[/red]"
-
-                    console.print("\n[bold magenta]Result:[/bold magenta]")
-                    console.print(Panel.fit(str(res), style="green"))
-
-            except KeyboardInterrupt:
-                print("\nExiting...")
+    # catalog 在背景 loop 上刷新；工具註冊表的更新排回這個 loop
+    sync_tool_manager(agent.tool_manager, servers, make_call_tool, loop=asyncio.get_running_loop())
+
+    # 模型載入與各 MCP server 啟動同時進行
+    phases = [connect(server) for server in servers]
+    if preload_enabled():
+        phases.append(agent.preload())
+    await asyncio.gather(*phases)
+    console.clear()
+    console.print(Panel.fit("🚀 Welcome to Ollama MCP Client 🚀", padding=(1, 4)))
+    for server in servers:
+        latency = pool.latency_summary(server)
+        if latency["acquire_last_ms"] is not None:
+            console.print(f"[dim]MCP session to {server} ready in {latency['acquire_last_ms']:.0f} ms[/dim]")
+
+    while True:
+        try:
+            print("-" * 40)
+            user_prompt = input("How can I help you?\n")
+            print("-" * 40)
+            if user_prompt.lower() in ['quit', 'exit', 'q']:
                 break
+            print()
+            console.print("[bold magenta]Result:[/bold magenta]")
+            # 文字 delta 直接印出，不必等整段回應完成
+            received = False
+
+            async def show_turn():
+                nonlocal received
+                async for event in agent.get_response(user_prompt, stream=True):
+                    if isinstance(event, TextDelta):
+                        received = True
+                        console.print(event.text, end="", markup=False, highlight=False)
+                    elif isinstance(event, ToolCallStart):
+                        console.print(f"\n[cyan]🔧 {event.name}[/cyan] {event.arguments}")
+                    elif isinstance(event, ToolResult):
+                        received = True
+                        preview = event.content if len(event.content) <= 500 else event.content[:500] + " ..."
+                        console.print(Panel.fit(preview, title=event.name, style="red" if event.is_error else "green"))
+                    elif isinstance(event, Done):
+                        stats = event.stats
+                        console.print(
+                            f"\n[dim]LLM calls: {stats.get('llm_calls', 0)} | "
+                            f"prompt tokens: {stats.get('prompt_tokens', 0)} | "
+                            f"tool calls: {stats.get('tool_calls', 0)}[/dim]"
+                        )
+                        tool_cache = stats.get("tool_cache")
+                        if tool_cache:
+                            console.print(f"[dim]tool cache: {tool_cache['hits']} hits, {tool_cache['misses']} misses[/dim]")
+                        coalescing = stats.get("tool_coalescing")
+                        if coalescing and coalescing["coalesced"]:
+                            console.print(f"[dim]coalesced tool calls: {coalescing['coalesced']} of {coalescing['calls']}[/dim]")
+                        selection = stats.get("tool_selection")
+                        if selection:
+                            console.print(f"[dim]tool selection ({selection['method']}): {selection['selected']}/{selection['total']} tools, "
+                                          f"~{selection['tokens_saved']} tokens saved[/dim]")
+                        history = stats.get("history")
+                        if history and history["dropped_tokens"]:
+                            console.print(
+                                f"[dim]history: kept ~{history['kept_tokens']} tokens, "
+                                f"dropped ~{history['dropped_tokens']}[/dim]"
+                            )
+
+            # Ctrl-C 只停止目前的回答（取消串流與工具呼叫），不離開程式
+            turn = asyncio.create_task(show_turn())
+            loop = asyncio.get_running_loop()
+            try:
+                loop.add_signal_handler(signal.SIGINT, turn.cancel)
+            except (NotImplementedError, RuntimeError):
+                pass
+            try:
+                await turn
+            except asyncio.CancelledError:
+                console.print("\n[yellow]⏹ Stopped[/yellow]")
+                received = True
             except Exception as e:
-                print(f"\nError occurred: {e}")
+                console.print(f"[red]Error: {e}[/red]")
+                received = True
+            finally:
+                try:
+                    loop.remove_signal_handler(signal.SIGINT)
+                except (NotImplementedError, RuntimeError):
+                    pass
+
+            if not received:
+                console.print("[red]No response from agent.[/red]")
+            console.print()
+
+        except KeyboardInterrupt:
+            print("\nExiting...")
+            break
+        except Exception as e:
+            print(f"\nError occurred: {e}")
+
+    await pool.close()
 
 
 if __name__ == "__main__":
@@ -1,29 +1,26 @@
-import os
-import json
 import asyncio
-import logging
 import traceback
-from mcp import ClientSession, StdioServerParameters
+import weakref
+from mcp import ClientSession, StdioServerParameters, types
 from mcp.client.stdio import stdio_client
 from mcp.client.sse import sse_client
 from mcp.client.streamable_http import streamablehttp_client
 from contextlib import asynccontextmanager
-from typing import Any, List, Optional
+from typing import Any, Callable, List, Optional
+from config_store import get_config_store
+from debug_logging import get_logger, Payload
+from tracing import get_tracer, span
+from deadline import timeout_for
+from http_transport import get_http_client_pool
 
-# 設定全域 logger
-logger = logging.getLogger("mcpclient_manager_debug")
-logger.setLevel(logging.DEBUG)
-handler = logging.FileHandler("debug.log", encoding='utf-8')
-formatter = logging.Formatter('%(asctime)s %(levelname)s %(message)s')
-handler.setFormatter(formatter)
-if not logger.handlers:
-    logger.addHandler(handler)
+# 全域 logger，經由 queue 在背景寫入 debug.log
+logger = get_logger("mcpclient_manager_debug")
 
 def load_config(config_path="config.json"):
-    """Load configuration from config file"""
-    if os.path.exists(config_path):
-        with open(config_path, 'r', encoding='utf-8') as f:
-            return json.load(f)
+    """Load configuration from config file (cached, reloaded when the file changes)"""
+    store = get_config_store(config_path)
+    if store.exists:
+        return store.get()
     return {"default_server_type": "git"}
 
 def get_available_servers(config_path="config.json"):
@@ -32,18 +29,62 @@ def get_available_servers(config_path="config.json"):
     servers = config.get("MCP_Servers", {})
     return list(servers.keys())
 
+class _RequestTrackingStream:
+    """
+    Wraps the session's write stream and remembers the JSON-RPC id of the last
+    request each task sent, so ``call_tool`` knows which id to cancel without
+    reading ClientSession internals.
+    """
+
+    def __init__(self, stream):
+        self._stream = stream
+        self.sent: "weakref.WeakKeyDictionary[asyncio.Task, Any]" = weakref.WeakKeyDictionary()
+
+    async def send(self, message):
+        root = getattr(getattr(message, 'message', None), 'root', None)
+        task = asyncio.current_task()
+        if isinstance(root, types.JSONRPCRequest) and task is not None:
+            self.sent[task] = root.id
+        await self._stream.send(message)
+
+    def last_request_id(self) -> Optional[Any]:
+        task = asyncio.current_task()
+        return self.sent.pop(task, None) if task is not None else None
+
+    async def __aenter__(self):
+        await self._stream.__aenter__()
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        return await self._stream.__aexit__(exc_type, exc_val, exc_tb)
+
+    def __getattr__(self, name):
+        return getattr(self._stream, name)
+
+
 class MCPClientManager:
     """Enhanced MCP client that supports multiple connection types"""
     
-    def __init__(self, server_type: str, config_path="config.json"):
+    def __init__(self, server_type: str, config_path="config.json",
+                 on_tools_changed: Optional[Callable[[str], None]] = None):
         self.server_type = server_type
         self.config_path = config_path
         self.session = None
         self._client = None
+        # initialize() 回傳的 serverInfo（name/version），供 tool catalog 判斷快取是否過期
+        self.server_info = None
+        self.on_tools_changed = on_tools_changed
+        self._get_session_id = None
+        self._requests: Optional[_RequestTrackingStream] = None
     
     async def __aenter__(self):
         """Async context manager entry"""
-        await self.connect()
+        try:
+            await self.connect()
+        except BaseException as e:
+            # 連線途中失敗時也要關掉已開啟的 transport，避免殘留子程序
+            await self.__aexit__(type(e), e, e.__traceback__)
+            raise
         return self
         
     async def __aexit__(self, exc_type, exc_val, exc_tb):
@@ -79,30 +120,56 @@ class MCPClientManager:
             
             self._client = stdio_client(server_params)
             self.read, self.write = await self._client.__aenter__()
-            session = ClientSession(self.read, self.write)
-            self.session = await session.__aenter__()
-            await self.session.initialize()
+            await self._start_session()
             
         elif mode == "sse":
             connection_config = server_config["connection"]
             url = connection_config["url"]
-            self._client = sse_client(url)
+            # 同一個 server 的所有 session 共用 keep-alive 連線池
+            self._client = sse_client(
+                url,
+                headers=connection_config.get("headers"),
+                httpx_client_factory=get_http_client_pool(self.config_path).factory(self.server_type),
+            )
             self.read, self.write = await self._client.__aenter__()
-            session = ClientSession(self.read, self.write)
-            self.session = await session.__aenter__()
-            await self.session.initialize()
+            await self._start_session()
             
         elif mode == "http":
             connection_config = server_config["connection"]
             url = connection_config["url"]
-            self._client = streamablehttp_client(url)
-            self.read, self.write, _ = await self._client.__aenter__()
-            session = ClientSession(self.read, self.write)
-            self.session = await session.__aenter__()
-            await self.session.initialize()
+            self._client = streamablehttp_client(
+                url,
+                headers=connection_config.get("headers"),
+                httpx_client_factory=get_http_client_pool(self.config_path).factory(self.server_type),
+            )
+            self.read, self.write, self._get_session_id = await self._client.__aenter__()
+            await self._start_session()
         else:
             raise ValueError(f"Unsupported connection mode: {mode}")
 
+    async def _start_session(self):
+        self._requests = _RequestTrackingStream(self.write)
+        session = ClientSession(self.read, self._requests, message_handler=self._handle_message)
+        self.session = await session.__aenter__()
+        result = await self.session.initialize()
+        self.server_info = getattr(result, 'serverInfo', None)
+
+    async def _handle_message(self, message):
+        """Forward ``notifications/tools/list_changed`` to ``on_tools_changed``"""
+        if isinstance(message, types.ServerNotification) and isinstance(message.root, types.ToolListChangedNotification):
+            logger.debug("[DEBUG] tools/list_changed from %s", self.server_type)
+            if self.on_tools_changed:
+                self.on_tools_changed(self.server_type)
+
+    @property
+    def server_version(self) -> Optional[str]:
+        return getattr(self.server_info, 'version', None)
+
+    @property
+    def session_id(self) -> Optional[str]:
+        """``Mcp-Session-Id`` assigned by a streamable HTTP server"""
+        return self._get_session_id() if self._get_session_id else None
+
     async def get_available_tools(self) -> List[Any]:
         """List available tools"""
         if not self.session:
@@ -129,64 +196,149 @@ class MCPClientManager:
             print(f"Raw tools response: {tools}")
             return []
 
-    async def call_tool(self, tool_name: str, arguments: dict) -> Any:
-        """Call a tool with given arguments"""
+    async def call_tool(self, tool_name: str, arguments: dict, timeout: Optional[float] = None) -> Any:
+        """
+        Call a tool with given arguments, bounded by ``timeout`` and the current
+        deadline. On timeout or cancellation the server is sent
+        ``notifications/cancelled`` so it can stop the abandoned work.
+        """
         if not self.session:
             raise RuntimeError("Not connected to MCP server")
-        result = await self.session.call_tool(tool_name, arguments=arguments)
-        return result 
+        limit = timeout_for(timeout)
+        if limit is not None:
+            limit = max(limit, 0)
+        try:
+            async with asyncio.timeout(limit):
+                return await self.session.call_tool(tool_name, arguments=arguments)
+        except TimeoutError:
+            # limit 為 None 時逾時來自 transport 本身
+            after = f" after {limit:.1f}s" if limit is not None else ""
+            await self._send_cancelled(self._last_request_id(), f"timed out{after}")
+            raise TimeoutError(f"{tool_name} on {self.server_type} timed out{after}")
+        except asyncio.CancelledError:
+            await self._send_cancelled(self._last_request_id(), "cancelled by client")
+            raise
+        finally:
+            self._last_request_id()
+
+    def _last_request_id(self) -> Optional[Any]:
+        """Id of the request this task sent last (the tools/call); cleared once read"""
+        return self._requests.last_request_id() if self._requests is not None else None
+
+    async def _send_cancelled(self, request_id, reason: str):
+        if request_id is None or not self.session:
+            return
+        notification = types.ClientNotification(types.CancelledNotification(
+            method="notifications/cancelled",
+            params=types.CancelledNotificationParams(requestId=request_id, reason=reason),
+        ))
+        try:
+            await asyncio.wait_for(self.session.send_notification(notification), 1)
+            logger.info("sent cancel for request %s to %s (%s)", request_id, self.server_type, reason)
+        except Exception as e:
+            logger.warning("[WARNING] could not send cancel to %s: %r", self.server_type, e)
 
-def initialize_agent_and_tools(selected_model, selected_server, _):
-    import asyncio
-    from ollama_toolmanager import OllamaToolManager
+def initialize_agent_and_tools(selected_model, selected_server, _, timings=None):
+    """
+    建立 agent 並註冊 MCP 工具。以下階段同時進行，完成一個 server 就先註冊它的工具：
+      - models：重新列出模型並探測所選模型的能力（digest 改變時）
+      - warmup：把模型載入記憶體
+      - mcp:<server>：各 MCP server 的握手與工具清單（優先使用 tool catalog 快取）
+    ``selected_server`` 可為單一 server 或 server 清單；若傳入 ``timings`` dict，
+    會填入各階段耗時 (ms) 與 total。
+    """
+    from ollama_toolmanager import tool_manager_from_config
     from ollama_agent import OllamaAgent
+    from tool_catalog import get_tool_catalog, sync_tool_manager
+    from model_preload import preload_enabled
+    from model_setting import async_sync_model_tool_support
+    import time
+
+    servers = [selected_server] if isinstance(selected_server, str) else list(selected_server)
+    timings = timings if timings is not None else {}
+
+    def make_call_tool(pool, server):
+        async def call_tool_wrapper(tool_name, arguments):
+            # 參數別名與型別已由 OllamaToolManager 依 inputSchema 修正
+            logger.debug("[DEBUG] call_tool_wrapper: tool_name=%s, arguments=%s", tool_name, Payload(arguments))
+            print(f"[DEBUG] call_tool_wrapper: tool_name={tool_name}, arguments={arguments}")
+
+            try:
+                result = await pool.call_tool(server, tool_name, arguments)
+                print(f"[DEBUG] 工具 {tool_name} 執行成功")
+                return result
+
+            except Exception as e:
+                error_msg = f"[ERROR] 工具 {tool_name} 執行失敗: {str(e)}"
+                print(error_msg)
+                logger.error(error_msg)
+                logger.error("[ERROR] 詳細錯誤: %s", traceback.format_exc())
+                return {
+                    'tool': tool_name,
+                    'content': [{
+                        'text': f"工具執行失敗: {str(e)}"
+                    }],
+                    'status': 'error',
+                    'error_details': str(e)
+                }
+        return call_tool_wrapper
+
+    async def timed(name, coro):
+        started = time.perf_counter()
+        try:
+            with span(f"init.{name}"):
+                return await coro
+        finally:
+            timings[name] = round((time.perf_counter() - started) * 1000, 1)
 
     async def _init():
-        tool_manager = OllamaToolManager()
+        from mcpsession_pool import get_session_pool
+
+        started = time.perf_counter()
+        tool_manager = tool_manager_from_config()
         agent = OllamaAgent(selected_model, tool_manager, None)
-        # MCPClientManager 僅在此 async context 內使用，連線完即釋放
-        async with MCPClientManager(selected_server) as mcpclient:
-            tools_list = await mcpclient.get_available_tools()
-            
-            # 註冊時用 wrapper，每次呼叫都新建 context
-            async def call_tool_wrapper(tool_name, arguments):
-                # Excel 工具參數名稱自動修正，支援多種常見名稱
-                if tool_name.startswith("excel_"):
-                    for k in ["file_path", "path", "filepath", "file","filePath"]:
-                        if k in arguments and "fileAbsolutePath" not in arguments:
-                            arguments["fileAbsolutePath"] = arguments.pop(k)
-                
-                # log 修正後的 arguments
-                logger.debug(f"[DEBUG] call_tool_wrapper: tool_name={tool_name}, arguments={json.dumps(arguments, ensure_ascii=False)}")
-                print(f"[DEBUG] call_tool_wrapper: tool_name={tool_name}, arguments={arguments}")
-                
-                try:
-                    print(f"[DEBUG] 建立 MCP 連線到 {selected_server}")
-                    async with MCPClientManager(selected_server) as client:
-                        print(f"[DEBUG] MCP 連線建立成功，開始呼叫工具 {tool_name}")
-                        result = await client.call_tool(tool_name, arguments)
-                        print(f"[DEBUG] 工具 {tool_name} 執行成功")
-                        return result
-                        
-                except Exception as e:
-                    error_msg = f"[ERROR] 工具 {tool_name} 執行失敗: {str(e)}"
-                    print(error_msg)
-                    logger.error(error_msg)
-                    logger.error(f"[ERROR] 詳細錯誤: {traceback.format_exc()}")
-                    return {
-                        'tool': tool_name,
-                        'content': [{
-                            'text': f"工具執行失敗: {str(e)}"
-                        }],
-                        'status': 'error',
-                        'error_details': str(e)
-                    }
+        # 使用共用的 session pool，連線在多次工具呼叫之間保持開啟
+        pool = get_session_pool()
+        # catalog 背景刷新或 tools/list_changed 後，同步更新已註冊的工具
+        catalog = get_tool_catalog()
+        sync_tool_manager(tool_manager, servers, lambda server: make_call_tool(pool, server), catalog=catalog)
+
+        async def probe_models():
+            client = agent._get_client()
+            listed = (await client.list())['models']
+            digests = {model['model']: model.get('digest') for model in listed}
+            await async_sync_model_tool_support(list(digests), digests, client)
+
+        async def connect(server):
+            # 先用磁碟上的 tool catalog，背景再向 server 確認
+            tools_list = await catalog.list_tools(server)
+            call_tool = make_call_tool(pool, server)
             for tool in tools_list:
                 agent.tool_manager.register_tool(
                     name=tool.name,
-                    function=call_tool_wrapper,
+                    function=call_tool,
                     description=tool.description,
-                    inputSchema=tool.inputSchema
+                    inputSchema=tool.inputSchema,
+                    server=server
                 )
-            return agent
-    return asyncio.run(_init()) 
\ No newline at end of file
+
+        with get_tracer().trace("initialize", model=selected_model, server=",".join(servers)):
+            phases = {"models": probe_models()}
+            if preload_enabled():
+                phases["warmup"] = agent.preload()
+            for server in servers:
+                phases[f"mcp:{server}"] = connect(server)
+            results = await asyncio.gather(
+                *(timed(name, coro) for name, coro in phases.items()), return_exceptions=True
+            )
+        timings["total"] = round((time.perf_counter() - started) * 1000, 1)
+        for name, result in zip(phases, results):
+            if isinstance(result, BaseException):
+                if name.startswith("mcp:"):
+                    raise result
+                # 模型列表/探測失敗不影響連線，第一次請求時仍有 ResponseError 的退路
+                logger.warning("[WARNING] init phase %s failed: %s", name, result)
+        return agent
+    # 在共用的背景 loop 上初始化，agent 的 async client 與 MCP session 可跨 rerun 重用
+    from background_loop import get_background_loop
+    return get_background_loop().run(_init())
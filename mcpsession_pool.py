@@ -0,0 +1,539 @@
+import asyncio
+import atexit
+import contextvars
+import threading
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Any, Callable, Dict, List, Optional
+
+import anyio
+from mcp.shared.exceptions import McpError
+from mcp.types import CONNECTION_CLOSED
+
+from mcpclient_manager import MCPClientManager, load_config, logger
+from tracing import span
+from background_loop import get_background_loop
+from server_health import HealthTracker
+from tool_result_cache import DEFAULT_READ_ONLY_TOOLS
+from http_transport import get_http_client_pool
+
+# 連線中斷時會出現的例外，遇到時丟棄該連線並重連
+_BROKEN_ERRORS = (
+    anyio.ClosedResourceError,
+    anyio.BrokenResourceError,
+    anyio.EndOfStream,
+    BrokenPipeError,
+    ConnectionError,
+    EOFError,
+)
+
+
+def _is_broken(exc: BaseException) -> bool:
+    """Return True if the exception means the underlying transport is gone"""
+    if isinstance(exc, _BROKEN_ERRORS):
+        return True
+    if isinstance(exc, McpError) and exc.error.code == CONNECTION_CLOSED:
+        return True
+    return False
+
+
+class _PooledConnection:
+    """One MCPClientManager kept open by its own owner task.
+
+    The stdio/sse/http clients use anyio cancel scopes, which must be entered
+    and exited by the same task, so every connection lives inside a dedicated
+    task that waits until the pool asks it to close.
+    """
+
+    def __init__(self, server_type: str, config_path: str,
+                 on_tools_changed: Optional[Callable[[str], None]] = None):
+        self.server_type = server_type
+        self.config_path = config_path
+        self.on_tools_changed = on_tools_changed
+        self.client: Optional[MCPClientManager] = None
+        self.broken = False
+        # _replenish 開出、尚未被借出過的 warm spare
+        self.spare = False
+        self.last_used = time.monotonic()
+        self._ready: Optional[asyncio.Future] = None
+        self._closing: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def alive(self) -> bool:
+        return (
+            not self.broken
+            and self.client is not None
+            and self._task is not None
+            and not self._task.done()
+        )
+
+    async def open(self):
+        self._ready = asyncio.get_running_loop().create_future()
+        self._closing = asyncio.Event()
+        self._task = asyncio.create_task(self._run())
+        await self._ready
+
+    async def _run(self):
+        try:
+            async with MCPClientManager(self.server_type, self.config_path,
+                                        on_tools_changed=self.on_tools_changed) as client:
+                self.client = client
+                self._ready.set_result(None)
+                await self._closing.wait()
+        except asyncio.CancelledError:
+            if not self._ready.done():
+                self._ready.cancel()
+            raise
+        except BaseException as e:
+            if not self._ready.done():
+                self._ready.set_exception(e)
+            else:
+                logger.warning("[WARNING] MCP connection to %s ended: %s", self.server_type, e)
+        finally:
+            self.client = None
+
+    async def close(self, timeout: float = 5):
+        if self._closing is not None:
+            self._closing.set()
+        if self._task is not None and not self._task.done():
+            try:
+                await asyncio.wait_for(asyncio.shield(self._task), timeout)
+            except (asyncio.TimeoutError, Exception):
+                self._task.cancel()
+
+
+class _ServerSlots:
+    """Idle connections and bookkeeping for one server"""
+
+    def __init__(self):
+        self.idle: List[_PooledConnection] = []
+        self.total = 0
+        self.cond = asyncio.Condition()
+
+
+class MCPSessionPool:
+    """Long-lived MCP sessions keyed by server name.
+
+    All sessions live on the process-wide background loop (see
+    ``background_loop.py``), so they outlive any single Streamlit rerun.
+    Public coroutines can be awaited from any loop; the work is forwarded to
+    the background loop.
+    """
+
+    def __init__(self, config_path="config.json", pool_size: Optional[int] = None,
+                 health_check_interval: Optional[float] = None,
+                 health_check_timeout: Optional[float] = None):
+        settings = load_config(config_path).get("Session_Pool", {})
+        self.config_path = config_path
+        self.pool_size = pool_size or settings.get("POOL_SIZE", 2)
+        self.health_check_interval = (
+            health_check_interval if health_check_interval is not None
+            else settings.get("HEALTH_CHECK_INTERVAL", 30)
+        )
+        self.health_check_timeout = (
+            health_check_timeout if health_check_timeout is not None
+            else settings.get("HEALTH_CHECK_TIMEOUT", 5)
+        )
+        self.health_checks_enabled = settings.get("HEALTH_CHECKS", True)
+        # 各 server 的健康狀態與斷路器（見 server_health.py）
+        self.health = HealthTracker.from_settings(settings)
+        # 連線中斷後可以安全重送的工具（與 Tool_Cache 相同的唯讀清單）
+        self.read_only_tools = set(
+            load_config(config_path).get("Tool_Cache", {}).get("READ_ONLY_TOOLS", DEFAULT_READ_ONLY_TOOLS)
+        )
+        self.prewarm_enabled = settings.get("PREWARM", False)
+        self.warm_spares = settings.get("WARM_SPARES", 1)
+        self.stats = {
+            "connects": 0, "reuses": 0, "reconnects": 0,
+            "health_check_failures": 0, "spares_used": 0,
+        }
+        # 最近的連線/取得 session 耗時 (ms)，供 UI 與 benchmark 報告
+        self.connect_latency: Dict[str, deque] = {}
+        self.acquire_latency: Dict[str, deque] = {}
+        self._prewarmed = set()
+        self._health_started = False
+        self._background = set()
+        self._tools_changed_listeners: List[Callable[[str], None]] = []
+        self._servers: Dict[str, _ServerSlots] = {}
+        # session 都活在共用的背景 loop 上，UI 與其他 async client 也用同一個 loop
+        self._background_loop = get_background_loop()
+        self._lock = threading.Lock()
+
+    # ---- event loop plumbing ----
+
+    async def _run(self, coro):
+        # 在呼叫端 context 中排程，讓 pool loop 上的 span 接在目前的 trace 底下
+        return await self._background_loop.run_async(coro)
+
+    def _slots(self, server_type: str) -> _ServerSlots:
+        if server_type not in self._servers:
+            self._servers[server_type] = _ServerSlots()
+        return self._servers[server_type]
+
+    def _record(self, table: Dict[str, deque], server_type: str, started: float):
+        table.setdefault(server_type, deque(maxlen=100)).append(
+            (time.perf_counter() - started) * 1000
+        )
+
+    def _spawn(self, coro):
+        """Run a background task on the pool loop and keep a reference to it"""
+        # 背景工作不屬於觸發它的 turn，不沿用其 trace context
+        task = asyncio.get_running_loop().create_task(coro, context=contextvars.Context())
+        self._background.add(task)
+        task.add_done_callback(self._background.discard)
+        return task
+
+    async def _open(self, server_type: str, record: bool = True) -> _PooledConnection:
+        """
+        Open a new session. ``record=False`` leaves the health verdict to the
+        caller (``_with_session`` records one outcome per call).
+        """
+        conn = _PooledConnection(server_type, self.config_path, self._notify_tools_changed)
+        started = time.perf_counter()
+        with span("mcp.connect", server=server_type):
+            try:
+                await conn.open()
+            except asyncio.CancelledError:
+                raise
+            except BaseException as e:
+                if record:
+                    self.health.record_failure(server_type, e)
+                raise
+        if record:
+            self.health.record_success(server_type)
+        self._record(self.connect_latency, server_type, started)
+        self.stats["connects"] += 1
+        logger.debug("[DEBUG] pool opened new session to %s", server_type)
+        return conn
+
+    def _notify_tools_changed(self, server_type: str):
+        for listener in list(self._tools_changed_listeners):
+            try:
+                listener(server_type)
+            except Exception as e:
+                logger.warning("[WARNING] tools_changed listener failed for %s: %s", server_type, e)
+
+    # ---- checkout / checkin (pool loop only) ----
+
+    async def _healthy(self, conn: _PooledConnection, record: bool = True) -> bool:
+        if not conn.alive:
+            return False
+        if time.monotonic() - conn.last_used < self.health_check_interval:
+            return True
+        started = time.perf_counter()
+        try:
+            await asyncio.wait_for(conn.client.session.send_ping(), self.health_check_timeout)
+        except Exception as e:
+            self.stats["health_check_failures"] += 1
+            if record:
+                self.health.record_failure(conn.server_type, e)
+            logger.warning("[WARNING] health check failed for %s: %s", conn.server_type, e)
+            return False
+        if record:
+            self.health.record_success(conn.server_type, (time.perf_counter() - started) * 1000)
+        return True
+
+    async def _discard(self, slots: _ServerSlots, conn: _PooledConnection):
+        await conn.close()
+        async with slots.cond:
+            slots.total -= 1
+            slots.cond.notify()
+
+    async def _acquire(self, server_type: str) -> _PooledConnection:
+        started = time.perf_counter()
+        with span("mcp.acquire", server=server_type):
+            conn = await self._acquire_inner(server_type)
+        self._record(self.acquire_latency, server_type, started)
+        return conn
+
+    async def _acquire_inner(self, server_type: str) -> _PooledConnection:
+        slots = self._slots(server_type)
+        while True:
+            conn = None
+            async with slots.cond:
+                while not slots.idle and slots.total >= self.pool_size:
+                    await slots.cond.wait()
+                if slots.idle:
+                    conn = slots.idle.pop()
+                else:
+                    slots.total += 1
+            if conn is None:
+                try:
+                    # 呼叫路徑上的連線結果由 _with_session 記錄一次
+                    return await self._open(server_type, record=False)
+                except BaseException:
+                    async with slots.cond:
+                        slots.total -= 1
+                        slots.cond.notify()
+                    raise
+            if await self._healthy(conn, record=False):
+                self.stats["reuses"] += 1
+                if conn.spare:
+                    # 交出一個 warm spare 後在背景補上新的；之後重用不再計算
+                    conn.spare = False
+                    self.stats["spares_used"] += 1
+                    self._spawn(self._replenish(server_type))
+                return conn
+            await self._discard(slots, conn)
+
+    async def _release(self, server_type: str, conn: _PooledConnection):
+        slots = self._slots(server_type)
+        if not conn.alive:
+            await self._discard(slots, conn)
+            return
+        conn.last_used = time.monotonic()
+        async with slots.cond:
+            slots.idle.append(conn)
+            slots.cond.notify()
+
+    @asynccontextmanager
+    async def _checkout(self, server_type: str):
+        conn = await self._acquire(server_type)
+        try:
+            yield conn
+        except BaseException as e:
+            if _is_broken(e):
+                conn.broken = True
+            raise
+        finally:
+            await self._release(server_type, conn)
+
+    async def _with_session(self, server_type: str, fn, idempotent: bool = True):
+        """
+        Run ``fn(client)`` on a pooled session, reconnecting once on a broken pipe.
+        A non-``idempotent`` request is only retried if it failed before it was
+        sent: once the server may have received it, a retry could run it twice.
+        Fails fast with CircuitOpenError while the server is marked down.
+        """
+        probing = self.health.check(server_type)
+        try:
+            for attempt in range(2):
+                sent = False
+                try:
+                    async with self._checkout(server_type) as conn:
+                        with span("mcp.rpc", server=server_type, attempt=attempt):
+                            sent = True
+                            result = await fn(conn.client)
+                    self.health.record_success(server_type)
+                    return result
+                except Exception as e:
+                    if attempt == 0 and _is_broken(e):
+                        if idempotent or not sent:
+                            self.stats["reconnects"] += 1
+                            logger.warning("[WARNING] session to %s broken (%r), reconnecting", server_type, e)
+                            continue
+                        logger.warning("[WARNING] session to %s broken (%r) during a non-idempotent call, not retried",
+                                       server_type, e)
+                    # 每次呼叫只記錄一個結果：取得/開啟 session 失敗，或傳輸中斷
+                    if (not sent and not isinstance(e, TimeoutError)) or _is_broken(e):
+                        self.health.record_failure(server_type, e)
+                    elif isinstance(e, McpError):
+                        # server 有回應（工具本身的錯誤），連線是好的
+                        self.health.record_success(server_type)
+                    raise
+        finally:
+            if probing:
+                self.health.release_probe(server_type)
+
+    async def _replenish(self, server_type: str):
+        """Open sessions until ``warm_spares`` idle ones are ready (bounded by pool size)"""
+        slots = self._slots(server_type)
+        spares = min(self.warm_spares, self.pool_size)
+        while True:
+            async with slots.cond:
+                if len(slots.idle) >= spares or slots.total >= self.pool_size:
+                    return
+                slots.total += 1
+            try:
+                conn = await self._open(server_type)
+            except Exception as e:
+                logger.warning("[WARNING] failed to start warm spare for %s: %s", server_type, e)
+                async with slots.cond:
+                    slots.total -= 1
+                    slots.cond.notify()
+                return
+            conn.spare = True
+            async with slots.cond:
+                slots.idle.append(conn)
+                slots.cond.notify()
+
+    async def _prewarm(self, server_types: List[str]):
+        await asyncio.gather(*(self._replenish(name) for name in server_types))
+
+    async def _probe(self, server_type: str):
+        """Try to reconnect to a server marked down; a new session joins the idle pool"""
+        slots = self._slots(server_type)
+        try:
+            async with slots.cond:
+                if slots.total >= self.pool_size:
+                    return
+                slots.total += 1
+            try:
+                conn = await self._open(server_type)
+            except Exception as e:
+                logger.warning("[WARNING] %s still unavailable: %s", server_type, e)
+                async with slots.cond:
+                    slots.total -= 1
+                    slots.cond.notify()
+                return
+            logger.info("%s is reachable again", server_type)
+            async with slots.cond:
+                slots.idle.append(conn)
+                slots.cond.notify()
+        finally:
+            self.health.release_probe(server_type)
+
+    async def _ping_idle(self, server_type: str):
+        """Ping idle sessions unused for ``health_check_interval``; drop the ones that fail"""
+        slots = self._slots(server_type)
+        now = time.monotonic()
+        async with slots.cond:
+            stale = [c for c in slots.idle if now - c.last_used >= self.health_check_interval]
+            slots.idle = [c for c in slots.idle if c not in stale]
+        for conn in stale:
+            if await self._healthy(conn):
+                conn.last_used = time.monotonic()
+                async with slots.cond:
+                    slots.idle.append(conn)
+                    slots.cond.notify()
+            else:
+                await self._discard(slots, conn)
+
+    async def _health_loop(self):
+        while True:
+            await asyncio.sleep(min(self.health_check_interval, self.health.backoff_max) / 2)
+            for name in list(self._servers):
+                if self.health.try_probe(name):
+                    await self._probe(name)
+                else:
+                    await self._ping_idle(name)
+
+    async def _start_health_loop(self):
+        self._spawn(self._health_loop())
+
+    # ---- public API ----
+
+    def start_health_checks(self):
+        """Start the background pings/reconnects (once per pool; safe to call on every rerun)"""
+        with self._lock:
+            if self._health_started or not self.health_checks_enabled:
+                return
+            self._health_started = True
+        self._background_loop.submit(self._start_health_loop())
+
+    def server_status(self, server_type: str) -> Dict[str, Any]:
+        """Health state plus idle/open session counts of ``server_type``, for display"""
+        status = self.health.snapshot(server_type)
+        slots = self._servers.get(server_type)
+        status["idle"] = len(slots.idle) if slots else 0
+        status["open"] = slots.total if slots else 0
+        return status
+
+    def start_prewarm(self, server_types: Optional[List[str]] = None):
+        """Start warm spare sessions in the background without blocking.
+
+        Defaults to every stdio server under ``MCP_Servers``.  Servers that were
+        already prewarmed are skipped, so this is safe to call on every rerun.
+        Returns a ``concurrent.futures.Future`` or None if nothing was started.
+        """
+        if server_types is None:
+            servers = load_config(self.config_path).get("MCP_Servers", {})
+            server_types = [
+                name for name, cfg in servers.items() if cfg.get("mode", "stdio") == "stdio"
+            ]
+        with self._lock:
+            new = [name for name in server_types if name not in self._prewarmed]
+            self._prewarmed.update(new)
+        if not new:
+            return None
+        return self._background_loop.submit(self._prewarm(new))
+
+    def latency_summary(self, server_type: str) -> Dict[str, Optional[float]]:
+        """Last and average connect/acquire latency in ms for a server"""
+        summary = {}
+        for label, table in (("connect", self.connect_latency), ("acquire", self.acquire_latency)):
+            samples = table.get(server_type)
+            summary[f"{label}_last_ms"] = samples[-1] if samples else None
+            summary[f"{label}_avg_ms"] = sum(samples) / len(samples) if samples else None
+        return summary
+
+    async def call_tool(self, server_type: str, tool_name: str, arguments: dict,
+                        timeout: Optional[float] = None) -> Any:
+        """
+        Call a tool on a pooled session of ``server_type`` (bounded by ``timeout``
+        and the current deadline). Only read-only tools are retried after the
+        session broke mid-call.
+        """
+        return await self._run(
+            self._with_session(server_type, lambda client: client.call_tool(tool_name, arguments, timeout),
+                               idempotent=tool_name in self.read_only_tools)
+        )
+
+    async def list_tools(self, server_type: str) -> List[Any]:
+        """List the tools of ``server_type`` using a pooled session"""
+        return await self._run(
+            self._with_session(server_type, lambda client: client.get_available_tools())
+        )
+
+    async def fetch_tool_catalog(self, server_type: str) -> Dict[str, Any]:
+        """List tools together with the server version reported by ``initialize()``"""
+        async def fetch(client):
+            tools = await client.get_available_tools()
+            return {"server_version": getattr(client, 'server_version', None), "tools": tools}
+        return await self._run(self._with_session(server_type, fetch))
+
+    def add_tools_changed_listener(self, listener: Callable[[str], None]):
+        """Call ``listener(server_type)`` when a pooled session receives tools/list_changed"""
+        if listener not in self._tools_changed_listeners:
+            self._tools_changed_listeners.append(listener)
+
+    async def _close(self, server_type: Optional[str] = None):
+        if server_type is None:
+            # 停掉還在補 warm spare 的背景工作，避免關閉後又開出新連線
+            for task in list(self._background):
+                task.cancel()
+            await asyncio.gather(*self._background, return_exceptions=True)
+        names = [server_type] if server_type else list(self._servers)
+        for name in names:
+            slots = self._servers.get(name)
+            if slots is None:
+                continue
+            async with slots.cond:
+                idle, slots.idle = slots.idle, []
+            for conn in idle:
+                await self._discard(slots, conn)
+        # sessions 都關了，再關掉 sse/http 的 keep-alive 連線
+        await get_http_client_pool(self.config_path).aclose(server_type)
+
+    async def close(self, server_type: Optional[str] = None):
+        """Close idle sessions of one server, or of every server"""
+        if not self._servers:
+            return
+        await self._run(self._close(server_type))
+
+    def shutdown(self, timeout: float = 10):
+        """Close every idle session (blocking); the shared background loop keeps running"""
+        if self._servers and not self._background_loop.in_loop():
+            try:
+                self._background_loop.run(self._close(), timeout)
+            except Exception as e:
+                print(f"[Warning] Exception during session pool shutdown: {e}")
+        self._servers = {}
+        self._prewarmed = set()
+        self._health_started = False
+
+
+_pool: Optional[MCPSessionPool] = None
+_pool_lock = threading.Lock()
+
+
+def get_session_pool(config_path="config.json") -> MCPSessionPool:
+    """Return the process-wide session pool"""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = MCPSessionPool(config_path)
+            atexit.register(_pool.shutdown)
+        return _pool
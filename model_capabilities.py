@@ -0,0 +1,60 @@
+import asyncio
+from typing import Any, Dict, Iterable, List, Optional
+
+import ollama
+
+from debug_logging import get_logger
+
+logger = get_logger("model_capabilities_debug")
+
+# 同時對 Ollama 發出的 show 請求上限
+PROBE_CONCURRENCY = 4
+
+
+def extract_capabilities(show: Any) -> Dict[str, Any]:
+    """
+    Reduce an ``ollama.show`` response to what the app needs: tool support,
+    context length and family. ``tools`` is None when the server cannot tell.
+    """
+    capabilities = list(getattr(show, "capabilities", None) or [])
+    if capabilities:
+        tools = "tools" in capabilities
+    else:
+        # 舊版 Ollama 沒有 capabilities 欄位，改看 template 是否使用 .Tools
+        template = getattr(show, "template", None) or ""
+        tools = ".Tools" in template if template else None
+
+    modelinfo = dict(getattr(show, "modelinfo", None) or {})
+    context_length = next(
+        (value for key, value in modelinfo.items() if key.endswith(".context_length")), None
+    )
+    details = getattr(show, "details", None)
+    family = getattr(details, "family", None) or modelinfo.get("general.architecture")
+    return {
+        "tools": tools,
+        "context_length": context_length,
+        "family": family,
+        "capabilities": capabilities,
+    }
+
+
+async def probe_models(models: Iterable[str], client: Optional[ollama.AsyncClient] = None,
+                       concurrency: int = PROBE_CONCURRENCY) -> Dict[str, Optional[Dict[str, Any]]]:
+    """
+    Run ``show`` for every model concurrently. A model whose probe fails maps
+    to None so callers can keep their previous answer.
+    """
+    client = client or ollama.AsyncClient()
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def probe(model):
+        async with semaphore:
+            try:
+                return extract_capabilities(await client.show(model))
+            except Exception as e:
+                logger.warning("[WARNING] capability probe for %s failed: %s", model, e)
+                return None
+
+    models = list(models)
+    results: List[Optional[Dict[str, Any]]] = await asyncio.gather(*(probe(m) for m in models))
+    return dict(zip(models, results))
@@ -0,0 +1,67 @@
+import time
+from datetime import datetime, timezone
+from typing import Any, Dict, Optional, Union
+
+import ollama
+
+from config_store import get_config_store
+from debug_logging import get_logger
+from tracing import span
+
+logger = get_logger("model_preload_debug")
+
+DEFAULT_KEEP_ALIVE = "30m"
+
+
+def keep_alive_for(model: str, config_path: str = "config.json") -> Union[str, int, None]:
+    """
+    keep_alive to send with every request for ``model``, from the
+    ``Model_Preload`` section: ``MODEL_KEEP_ALIVE[model]`` or ``DEFAULT_KEEP_ALIVE``.
+    Use e.g. "30m", -1 (keep loaded forever) or 0 (unload right after the answer).
+    """
+    settings = get_config_store(config_path).section("Model_Preload")
+    return settings.get("MODEL_KEEP_ALIVE", {}).get(model, settings.get("DEFAULT_KEEP_ALIVE", DEFAULT_KEEP_ALIVE))
+
+
+def preload_enabled(config_path: str = "config.json") -> bool:
+    return get_config_store(config_path).section("Model_Preload").get("ENABLED", True)
+
+
+async def preload_model(model: str, client: Optional[ollama.AsyncClient] = None,
+                        keep_alive: Union[str, int, None] = None) -> Optional[float]:
+    """
+    Load ``model`` into memory with an empty chat request. Returns the elapsed
+    ms, or None if Ollama could not load it (the first real request will then
+    pay the load itself).
+    """
+    client = client or ollama.AsyncClient()
+    keep_alive = keep_alive if keep_alive is not None else keep_alive_for(model)
+    started = time.perf_counter()
+    with span("llm.preload", model=model, keep_alive=keep_alive) as preload_span:
+        try:
+            response = await client.chat(model=model, messages=[], keep_alive=keep_alive)
+        except Exception as e:
+            logger.warning("[WARNING] preloading %s failed: %s", model, e)
+            return None
+        elapsed = (time.perf_counter() - started) * 1000
+        if preload_span is not None:
+            preload_span.set(load_ms=round((getattr(response, 'load_duration', None) or 0) / 1e6, 1))
+    logger.info("preloaded model=%s in %.0f ms (keep_alive=%s)", model, elapsed, keep_alive)
+    return elapsed
+
+
+async def model_load_state(model: str, client: Optional[ollama.AsyncClient] = None) -> Dict[str, Any]:
+    """
+    Whether ``model`` is currently loaded, from ``ollama ps``.
+    Returns ``{"loaded": bool, "expires_in_s": float|None, "size_vram": int|None}``.
+    """
+    client = client or ollama.AsyncClient()
+    running = await client.ps()
+    for entry in running.models:
+        if entry.model == model or entry.name == model:
+            expires_in = None
+            if entry.expires_at is not None:
+                now = datetime.now(timezone.utc) if entry.expires_at.tzinfo else datetime.now()
+                expires_in = (entry.expires_at - now).total_seconds()
+            return {"loaded": True, "expires_in_s": expires_in, "size_vram": entry.size_vram}
+    return {"loaded": False, "expires_in_s": None, "size_vram": None}
@@ -1,35 +1,79 @@
-import json
+from config_store import get_config_store
 
 CONFIG_PATH = "config.json"
+# 啟動時探測模型能力最多等待的秒數
+PROBE_TIMEOUT = 10
 
 def load_config():
-    with open(CONFIG_PATH, "r", encoding="utf-8") as f:
-        return json.load(f)
+    return get_config_store(CONFIG_PATH).get()
 
 def save_config(config):
-    with open(CONFIG_PATH, "w", encoding="utf-8") as f:
-        json.dump(config, f, ensure_ascii=False, indent=2)
+    get_config_store(CONFIG_PATH).save(config)
 
-def sync_model_tool_support(available_models):
+def _probe(models):
+    from background_loop import get_background_loop
+    from model_capabilities import probe_models
+    return get_background_loop().run(probe_models(models), timeout=PROBE_TIMEOUT)
+
+def _stale_models(available_models, digests):
+    """新出現、digest 改變或尚未列入 model_tool_support 的模型"""
     config = load_config()
-    if "model_tool_support" not in config:
-        config["model_tool_support"] = {}
-    changed = False
-    for model in available_models:
-        if model not in config["model_tool_support"]:
-            config["model_tool_support"][model] = True
-            changed = True
-    if changed:
-        save_config(config)
-    return config["model_tool_support"]
+    support = config.get("model_tool_support", {})
+    cached = config.get("model_capabilities", {})
+    return [
+        model for model in available_models
+        if model not in cached or cached[model].get("digest") != digests.get(model) or model not in support
+    ]
+
+def _apply_probe_results(available_models, digests, probed):
+    # 一次寫入所有變更
+    store = get_config_store(CONFIG_PATH)
+    with store.batch() as config:
+        support = config.setdefault("model_tool_support", {})
+        capabilities = config.setdefault("model_capabilities", {})
+        for model in available_models:
+            result = probed.get(model)
+            if result is not None:
+                capabilities[model] = dict(result, digest=digests.get(model))
+                if result["tools"] is not None:
+                    support[model] = result["tools"]
+            support.setdefault(model, True)
+    return store.get()["model_tool_support"]
+
+def sync_model_tool_support(available_models, digests=None):
+    """
+    以 ollama.show 探測新模型（或 digest 改變的模型）的能力，
+    結果依 digest 快取在 config 的 model_capabilities，並更新 model_tool_support。
+    探測失敗的模型維持原設定（未知時預設 True）。
+    """
+    digests = digests or {}
+    stale = _stale_models(available_models, digests)
+    if not stale:
+        return load_config().get("model_tool_support", {})
+    try:
+        probed = _probe(stale)
+    except Exception:
+        probed = {}
+    return _apply_probe_results(available_models, digests, probed)
+
+async def async_sync_model_tool_support(available_models, digests=None, client=None):
+    """Same as ``sync_model_tool_support`` for callers already on an event loop"""
+    from model_capabilities import probe_models
+    digests = digests or {}
+    stale = _stale_models(available_models, digests)
+    if not stale:
+        return load_config().get("model_tool_support", {})
+    probed = await probe_models(stale, client=client)
+    return _apply_probe_results(available_models, digests, probed)
+
+def get_model_capabilities(model):
+    """Cached probe result (tools, context_length, family) or {}"""
+    return load_config().get("model_capabilities", {}).get(model, {})
 
 def set_model_tool_support(model, support):
-    config = load_config()
-    if "model_tool_support" not in config:
-        config["model_tool_support"] = {}
-    config["model_tool_support"][model] = support
-    save_config(config)
+    with get_config_store(CONFIG_PATH).batch() as config:
+        config.setdefault("model_tool_support", {})[model] = support
 
 def get_model_tool_support(model):
     config = load_config()
-    return config.get("model_tool_support", {}).get(model, True) 
\ No newline at end of file
+    return config.get("model_tool_support", {}).get(model, True)
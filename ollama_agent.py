@@ -1,135 +1,332 @@
+import asyncio
 import ollama
 from ollama_toolmanager import OllamaToolManager
-import json
+from history_manager import ConversationHistory
+from config_store import get_config_store
 from ollama._client import ResponseError
-import logging
+from ollama._types import ChatResponse, Message
+import time
+from dataclasses import dataclass, field
+from typing import Any, Dict, Optional
+from debug_logging import get_logger, Payload
+from tracing import get_tracer, span
+from model_preload import keep_alive_for, preload_model
+from tool_selector import ToolSelector, spec_tokens
+from deadline import TimeoutPolicy, deadline, timeout_for
+
+# 自訂 logger，經由 queue 在背景寫入 debug.log
+logger = get_logger("ollama_agent_debug")
+
+
+# ---- get_response 產生的串流事件 ----
+
+@dataclass
+class TextDelta:
+    """A piece of assistant text; consumers append it to their buffer"""
+    text: str
+
+
+@dataclass
+class ToolCallStart:
+    """The model asked for a tool call"""
+    name: str
+    arguments: Dict[str, Any]
+
+
+@dataclass
+class ToolResult:
+    """A tool call finished"""
+    name: str
+    content: str
+    is_error: bool = False
+
+
+@dataclass
+class Done:
+    """End of the turn; ``content`` is the full assistant text"""
+    content: str
+    stats: Dict[str, Any] = field(default_factory=dict)
 
-# 設定自訂 logger，只寫本檔案 debug 訊息
-logger = logging.getLogger("ollama_agent_debug")
-logger.setLevel(logging.DEBUG)
-handler = logging.FileHandler("debug.log", encoding='utf-8')
-formatter = logging.Formatter('%(asctime)s %(levelname)s %(message)s')
-handler.setFormatter(formatter)
-logger.handlers = [handler]
 
 class OllamaAgent:
     def __init__(self,model:str,
                  tool_manager: OllamaToolManager,
                  default_prompt=None) -> None:
-        # 從 config.json 讀取 default_prompt
+        # 從 config.json 讀取 model_setting（default_prompt、max_steps）
+        try:
+            config = get_config_store().get()
+        except Exception:
+            config = {}
+        model_config = config.get("model_setting", {})
         if default_prompt is None:
-            try:
-                with open("config.json", "r", encoding="utf-8") as f:
-                    config = json.load(f)
-                default_prompt = config.get("model_setting", {}).get("default_prompt", "You are a helpful assistant who can use available tools to solve problems")
-            except Exception:
-                default_prompt = "You are a helpful assistant who can use available tools to solve problems"
+            default_prompt = model_config.get("default_prompt", "You are a helpful assistant who can use available tools to solve problems")
         self.model = model
         self.default_prompt = default_prompt
         self.messages = []
         self.tool_manager = tool_manager
+        # 一次 turn 最多呼叫 LLM 幾次（含最後的文字回答）
+        self.max_steps = max(1, model_config.get("max_steps", 5))
+        self.last_turn_stats = {}
+        # 送給模型的訊息由 history 依 token 預算從完整 self.messages 壓縮而來
+        self.history = ConversationHistory.from_settings(model, default_prompt, config.get("History_Settings", {}))
+        # 每次請求都帶上 keep_alive，讓模型依設定留在記憶體中
+        self.keep_alive = keep_alive_for(model)
+        # 只送與本次訊息相關的工具 schema（預設關閉）
+        selection = config.get("Tool_Selection", {})
+        self.tool_selector = ToolSelector.from_settings(selection) if selection.get("ENABLED", False) else None
+        # turn 的 deadline 與每次 LLM 請求的逾時（見 deadline.py）
+        self.timeouts = TimeoutPolicy.from_settings(config.get("Timeouts", {}))
+        self._client = None
+        self._client_loop = None
+
+    def _get_client(self) -> ollama.AsyncClient:
+        """AsyncClient 綁定建立時的 event loop，loop 改變時重建"""
+        loop = asyncio.get_running_loop()
+        if self._client is None or self._client_loop is not loop:
+            self._client = ollama.AsyncClient()
+            self._client_loop = loop
+        return self._client
+
+    async def preload(self):
+        """Load the model into memory ahead of the first request; returns elapsed ms or None"""
+        return await preload_model(self.model, self._get_client(), self.keep_alive)
 
     async def get_response(self, content: str, stream: bool = False):
         """
-        回傳完整回應（非 stream）或 streaming generator（stream=True）。
-        這裡不做 stream 判斷，全部交給 handle_response 處理。
+        執行一個完整的 agent turn，yield 型別化事件：
+        TextDelta、ToolCallStart、ToolResult，最後是 Done（含本 turn 的統計）。
+
+        模型要求 tool call 時，結果以 role=tool 訊息回填後讓模型繼續，
+        最多 max_steps 次 LLM 呼叫；最後一步不再提供工具，強制模型以文字回答。
+        stream=True 時文字 delta 一到就 yield；stream=False 時最後的回答只 yield 一次。
         """
+        # 每個 turn 一個 trace，LLM 呼叫、工具執行與連線都記錄為其中的 span
+        with get_tracer().trace("turn", model=self.model) as root, deadline(self.timeouts.turn):
+            async for event in self._run_turn(content, stream):
+                if isinstance(event, Done) and root is not None:
+                    root.set(**{k: v for k, v in event.stats.items() if not isinstance(v, dict)})
+                yield event
+
+    async def _run_turn(self, content: str, stream: bool):
         self.messages.append({'role': 'user', 'content': content})
-        logger.debug(f"[DEBUG] messages: {self.messages}")
+        logger.debug("[DEBUG] messages: %d, last: %s", len(self.messages), Payload(self.messages[-1]))
+        started = time.perf_counter()
+        stats = {"llm_calls": 0, "prompt_tokens": 0, "completion_tokens": 0, "tool_calls": 0}
+        self.last_turn_stats = stats
+        text = ""
+        content_parts = []
         try:
             # 判斷模型是否支援 tool call
             from model_setting import get_model_tool_support
             support_tool = get_model_tool_support(self.model)
-            if support_tool:
-                tools_schema = self.tool_manager.get_tools()
-                logger.debug(f"[DEBUG] tools schema sent to LLM: {json.dumps(tools_schema, ensure_ascii=False)}")
-                query = ollama.chat(
-                    model=self.model,
-                    messages=self.messages,
-                    tools=tools_schema,
-                )
-            else:
-                logger.debug(f"[DEBUG] model {self.model} does not support tools")
-
-                query = ollama.chat(
-                    model=self.model,
-                    messages=self.messages,
-                )
-            async for chunk in self.handle_response(query, stream=stream):
-                yield chunk
+            if not support_tool:
+                logger.debug("[DEBUG] model %s does not support tools", self.model)
+
+            selected_tools = None
+            if support_tool and self.tool_selector is not None:
+                selected_tools, method = await self.tool_selector.select(self.tool_manager.tools, content)
+                tokens_per_call = 0
+                if selected_tools is not None:
+                    tokens_per_call = (spec_tokens(self.tool_manager.get_tools_json())
+                                       - spec_tokens(self.tool_manager.get_tools_json(selected_tools)))
+                stats["tool_selection"] = {
+                    "method": method,
+                    "selected": len(selected_tools) if selected_tools is not None else len(self.tool_manager.tools),
+                    "total": len(self.tool_manager.tools),
+                    "tokens_saved": 0,
+                }
+                logger.debug("[DEBUG] tool selection (%s): %s", method, selected_tools)
+
+            for step in range(self.max_steps):
+                kwargs = {}
+                if support_tool and step < self.max_steps - 1:
+                    tools_schema = self.tool_manager.get_tools(selected_tools)
+                    if selected_tools is not None:
+                        stats["tool_selection"]["tokens_saved"] += tokens_per_call
+                    logger.debug("[DEBUG] tools schema sent to LLM: %d tools %s", len(tools_schema), Payload(self.tool_manager.get_tools_json(selected_tools)))
+                    kwargs['tools'] = tools_schema
+
+                request_messages, stats["history"] = self.history.build(self.messages)
+                content_parts = []
+                tool_calls = []
+                with span("llm", model=self.model, step=step, tools=len(kwargs.get('tools', [])),
+                          messages=len(request_messages)) as llm_span:
+                    llm_started = time.perf_counter()
+                    llm_timeout = timeout_for(self.timeouts.llm)
+                    llm_deadline = None if llm_timeout is None else llm_started + llm_timeout
+                    chunks = await asyncio.wait_for(self._get_client().chat(
+                        model=self.model,
+                        messages=request_messages,
+                        stream=True,
+                        keep_alive=self.keep_alive,
+                        **kwargs,
+                    ), llm_timeout)
+                    stats["llm_calls"] += 1
+                    async for part in self._until(chunks, llm_deadline):
+                        if llm_span is not None and "first_chunk_ms" not in llm_span.attributes:
+                            llm_span.set(first_chunk_ms=round((time.perf_counter() - llm_started) * 1000, 1))
+                        delta = part.message.content
+                        if delta:
+                            content_parts.append(delta)
+                            if stream:
+                                yield TextDelta(delta)
+                        if part.message.tool_calls:
+                            tool_calls.extend(part.message.tool_calls)
+                            for tool_call in part.message.tool_calls:
+                                yield ToolCallStart(tool_call.function.name, dict(tool_call.function.arguments))
+                        if part.done:
+                            stats["prompt_tokens"] += part.prompt_eval_count or 0
+                            stats["completion_tokens"] += part.eval_count or 0
+                            if llm_span is not None:
+                                # Ollama 回報的時間單位是 ns
+                                llm_span.set(
+                                    prompt_tokens=part.prompt_eval_count or 0,
+                                    completion_tokens=part.eval_count or 0,
+                                    load_ms=round((part.load_duration or 0) / 1e6, 1),
+                                    prompt_eval_ms=round((part.prompt_eval_duration or 0) / 1e6, 1),
+                                    eval_ms=round((part.eval_duration or 0) / 1e6, 1),
+                                    tool_calls=len(tool_calls),
+                                )
+
+                text = "".join(content_parts)
+                if not tool_calls:
+                    if text:
+                        logger.debug("[DEBUG] response.message.content: %s", Payload(text))
+                        self.messages.append({'role': 'assistant', 'content': text})
+                        if not stream:
+                            yield TextDelta(text)
+                    else:
+                        text = "[No valid response from model]"
+                        yield TextDelta(text)
+                    break
+
+                # 執行工具並把結果回填給模型，進入下一步
+                stats["tool_calls"] += len(tool_calls)
+                message = Message(role='assistant', content=text, tool_calls=tool_calls)
+                async for event in self.handle_response(ChatResponse(model=self.model, message=message), stream=stream):
+                    yield event
+        except asyncio.CancelledError:
+            # 使用者按下停止：保留部分回答，讓下一個 turn 的對話仍然完整
+            self._keep_interrupted_turn("".join(content_parts))
+            logger.info("turn model=%s cancelled after %.0f ms", self.model, (time.perf_counter() - started) * 1000)
+            raise
+        except TimeoutError:
+            # 已產生的部分回答保留在對話中，後面附上逾時說明
+            partial = "".join(content_parts)
+            if partial:
+                self.messages.append({'role': 'assistant', 'content': partial})
+            notice = f"\n\n[Timed out after {time.perf_counter() - started:.0f}s]"
+            text = partial + notice
+            yield TextDelta(notice if stream else text)
+            stats["timed_out"] = True
         except ResponseError as e:
             if "does not support tools" in str(e):
                 from model_setting import set_model_tool_support
                 set_model_tool_support(self.model, False)
-                yield " "
-                return
+                text = " "
             else:
-                yield f"[Ollama ResponseError: {e}]"
+                text = f"[Ollama ResponseError: {e}]"
+            yield TextDelta(text)
         except Exception as e:
-            yield f"[Error in get_response: {e}]"
+            text = f"[Error in get_response: {e}]"
+            yield TextDelta(text)
+        stats["duration_ms"] = round((time.perf_counter() - started) * 1000, 1)
+        if self.tool_manager.result_cache is not None:
+            stats["tool_cache"] = dict(self.tool_manager.result_cache.stats)
+        if self.tool_manager.singleflight is not None:
+            stats["tool_coalescing"] = dict(self.tool_manager.coalescing_stats)
+        # 每個 turn 一筆精簡的計時紀錄（INFO 等級，關閉 payload 時仍保留）
+        logger.info(
+            "turn model=%s duration_ms=%.0f llm_calls=%d prompt_tokens=%d completion_tokens=%d tool_calls=%d",
+            self.model, stats["duration_ms"], stats["llm_calls"], stats["prompt_tokens"],
+            stats["completion_tokens"], stats["tool_calls"]
+        )
+        yield Done(text, stats)
+
+    def _keep_interrupted_turn(self, partial: str):
+        """Close an interrupted turn in ``self.messages``: answer tool calls that never finished, keep partial text"""
+        last = self.messages[-1] if self.messages else {}
+        if last.get('role') == 'assistant' and last.get('tool_calls'):
+            # 停在工具執行中；該步的文字已在這則 assistant 訊息裡
+            for tool_call in last['tool_calls']:
+                self.messages.append({'role': 'tool', 'content': '[cancelled by user]',
+                                      'tool_name': tool_call.function.name})
+        elif partial:
+            self.messages.append({'role': 'assistant', 'content': partial})
+
+    @staticmethod
+    async def _until(chunks, until: Optional[float]):
+        """Iterate a chat stream, raising TimeoutError once ``until`` (monotonic) has passed"""
+        iterator = chunks.__aiter__()
+        while True:
+            try:
+                if until is None:
+                    part = await anext(iterator)
+                else:
+                    part = await asyncio.wait_for(anext(iterator), until - time.perf_counter())
+            except StopAsyncIteration:
+                return
+            yield part
+
+    @staticmethod
+    def _tool_result_text(result) -> str:
+        """把 MCP 工具結果轉成純文字"""
+        if isinstance(result, dict) and result.get("status") == "error":
+            return f"❌ 工具執行失敗: {result['content'][0]['text']}"
+        tool_response = []
+        if isinstance(result, dict) and isinstance(result.get('content'), list):
+            # OllamaToolManager 自訂工具的回傳格式 {'content': [{'text': ...}]}
+            for content in result['content']:
+                tool_response.append(content.get('text', '') if isinstance(content, dict) else str(content))
+        elif hasattr(result, 'content') and result.content:
+            logger.debug("[DEBUG] Content length: %s", len(result.content) if isinstance(result.content, list) else 'N/A')
+            for content in result.content:
+                if hasattr(content, 'text'):
+                    tool_response.append(content.text)
+                else:
+                    tool_response.append(str(content))
+        else:
+            logger.debug("[DEBUG] No content attribute or empty content, using result as string")
+            tool_response.append(str(result))
+        return "".join(tool_response)
+
+    @staticmethod
+    def _is_error_result(result) -> bool:
+        if isinstance(result, dict):
+            return result.get("status") == "error"
+        return bool(getattr(result, 'isError', False))
 
     async def handle_response(self, response, stream=False):
+        """
+        處理一個完整的 ChatResponse：執行所有 tool call 並 yield ToolResult，
+        或把文字內容 yield 為單一 TextDelta。
+        """
         try:
             tool_calls = getattr(response.message, 'tool_calls', None)
-            logger.debug(f"[DEBUG] response.message.tool_calls: {tool_calls}")
+            logger.debug("[DEBUG] response.message.tool_calls: %s", Payload(tool_calls))
             if tool_calls:
                 self.messages.append({
-                    'role': 'tool',
-                    'content': str(response)
+                    'role': 'assistant',
+                    'content': getattr(response.message, 'content', None) or '',
+                    'tool_calls': tool_calls
                 })
-                tool_payload = tool_calls[0]
-                result = await self.tool_manager.execute_tool(tool_payload)
-                logger.debug(f"[DEBUG] tool result: {result}")
-                # 判斷 tool call 是否 error
-                if isinstance(result, dict) and result.get("status") == "error":
-                    yield {
-                        "tool_call": str(tool_payload),
-                        "tool_result": f"❌ 工具執行失敗: {result['content'][0]['text']}",
-                        "final_response": None
-                    }
-                    return
-                # 正常回傳
-                tool_response = []
-                logger.debug(f"[DEBUG] Processing tool result: {result}")
-                logger.debug(f"[DEBUG] Result type: {type(result)}")
-                logger.debug(f"[DEBUG] Result has content attribute: {hasattr(result, 'content')}")
-                
-                if hasattr(result, 'content') and result.content:
-                    logger.debug(f"[DEBUG] Content type: {type(result.content)}")
-                    logger.debug(f"[DEBUG] Content length: {len(result.content) if isinstance(result.content, list) else 'N/A'}")
-                    
-                    for i, content in enumerate(result.content):
-                        logger.debug(f"[DEBUG] Processing content item {i}: {type(content)}")
-                        if hasattr(content, 'text'):
-                            logger.debug(f"[DEBUG] Content text: {content.text[:100]}...")  # 只記錄前100字元
-                            tool_response.append(content.text)
-                        else:
-                            logger.debug(f"[DEBUG] Content as string: {str(content)[:100]}...")
-                            tool_response.append(str(content))
-                else:
-                    logger.debug(f"[DEBUG] No content attribute or empty content, using result as string")
-                    tool_response.append(str(result))
-                
-                final_tool_result = "".join(tool_response)
-                logger.debug(f"[DEBUG] Final tool result length: {len(final_tool_result)}")
-                
-                yield {
-                    "tool_call": str(tool_payload),
-                    "tool_result": final_tool_result,
-                    "final_response": None
-                }
+                # 所有 tool call 同時執行，結果依原順序回填為 role=tool 訊息
+                results = await self.tool_manager.execute_tools(tool_calls)
+                for tool_payload, result in zip(tool_calls, results):
+                    logger.debug("[DEBUG] tool result: %s", Payload(result))
+                    final_tool_result = self._tool_result_text(result)
+                    logger.debug("[DEBUG] Final tool result length: %d", len(final_tool_result))
+                    self.messages.append({
+                        'role': 'tool',
+                        'content': final_tool_result,
+                        'tool_name': tool_payload.function.name
+                    })
+                    yield ToolResult(tool_payload.function.name, final_tool_result, self._is_error_result(result))
                 return
             content = getattr(response.message, 'content', None)
-            logger.debug(f"[DEBUG] response.message.content: {content}")
-            if content:
-                if stream:
-                    for i in range(1, len(content)+1):
-                        yield content[:i]
-                else:
-                    yield content
-                return
-            yield "[No valid response from model]"
+            logger.debug("[DEBUG] response.message.content: %s", Payload(content))
+            yield TextDelta(content or "[No valid response from model]")
         except Exception as e:
             print(e)
-            logger.error(f"[ERROR] Error in handle_response: {e}")
-            yield f"[Error in handle_response: {e}]"
+            logger.error("[ERROR] Error in handle_response: %s", e)
+            yield TextDelta(f"[Error in handle_response: {e}]")
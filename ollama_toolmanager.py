@@ -1,5 +1,15 @@
-from typing import Any, Dict, List, Callable
+import asyncio
+import json
+import re
+import time
+from typing import Any, Dict, Iterable, List, Callable, Optional, Tuple
 from dataclasses import dataclass
+from tracing import span
+from config_store import get_config_store
+from tool_result_cache import ToolResultCache, result_cache_from_config
+from tool_arguments import ArgumentValidator, ToolArgumentError, aliases_from_config
+from deadline import TimeoutPolicy, deadline, timeout_for, timeout_policy_from_config
+from singleflight import SingleFlight, get_singleflight
 
 @dataclass
 class OllamaTool:
@@ -8,37 +18,142 @@ class OllamaTool:
     description: str
     properties: Dict[str, Any]
     required: list[str]
+    server: Optional[str] = None
+    # 在 MCP server 上的原始名稱；名稱衝突而加上 server 前綴時與 name 不同
+    remote_name: Optional[str] = None
+    # 由 inputSchema 編譯的參數驗證/轉換器，呼叫 server 前先在本地檢查
+    validator: Optional[ArgumentValidator] = None
+
+
+def qualified_tool_name(server: str, name: str) -> str:
+    """``server__name`` with characters Ollama does not accept in function names replaced"""
+    return f"{re.sub(r'[^A-Za-z0-9_-]', '_', server)}__{name}"
 
 
 class OllamaToolManager:
-    def __init__(self):
+    def __init__(self, max_concurrency_per_server: int = 4, result_cache: Optional[ToolResultCache] = None,
+                 argument_aliases: Optional[Dict[str, List[str]]] = None,
+                 timeouts: Optional[TimeoutPolicy] = None, singleflight: Optional[SingleFlight] = None):
         self.tools = {}
+        self.max_concurrency_per_server = max_concurrency_per_server
+        # 每個 server 一個 semaphore，跨多次 execute_tools（不同 turn、同時的呼叫端）共用
+        self._semaphores: Dict[Optional[str], asyncio.Semaphore] = {}
+        # 多個 server 都有的工具名稱，一律以 server__name 註冊
+        self._colliding = set()
+        # 選用：唯讀工具的結果快取（見 tool_result_cache.py）
+        self.result_cache = result_cache
+        # 參數別名（正確名稱 -> 別名），None 時使用 tool_arguments.DEFAULT_ALIASES
+        self.argument_aliases = argument_aliases
+        # 每個工具呼叫的逾時（依工具/server 設定），None 時只受 turn 的 deadline 限制
+        self.timeouts = timeouts
+        # 選用：同時進行的相同唯讀呼叫只送一次（見 singleflight.py）
+        self.singleflight = singleflight
+        self.coalescing_stats = {"calls": 0, "coalesced": 0}
+        # 預先編好的 tool spec 與其精簡 JSON；註冊表變動時設為 None，下次取用時重建
+        self._specs: Optional[Dict[str, Dict[str, Any]]] = None
+        self._spec_list: List[Dict[str, Any]] = []
+        self._spec_json: Dict[str, str] = {}
+        self._all_json = "[]"
 
-    def register_tool(self, name: str, function:Callable, description: str, inputSchema: Dict[str, Any]):
+    def register_tool(self, name: str, function:Callable, description: str, inputSchema: Dict[str, Any],
+                      server: Optional[str] = None) -> str:
         """
-        Register a function as a tool.
+        Register a function as a tool. ``server`` is the MCP server that owns it.
+
+        When two servers expose the same tool name, both are registered as
+        ``server__name`` (see ``qualified_tool_name``); the function is still
+        called with the server's own name. Returns the registered name.
         """
         properties = inputSchema['properties']
         required = inputSchema.get('required', [])
-        tool = OllamaTool(name, function, description, properties, required)
-        self.tools[name] = tool
+        local_name = name
+        existing = self.tools.get(name)
+        if server is not None and (name in self._colliding or (existing and existing.server not in (None, server))):
+            if existing is not None:
+                # 先前註冊的同名工具也改用 server 前綴
+                del self.tools[name]
+                self._specs = None
+                existing.name = qualified_tool_name(existing.server, existing.remote_name)
+                self.tools[existing.name] = existing
+            self._colliding.add(name)
+            local_name = qualified_tool_name(server, name)
+        tool = OllamaTool(local_name, function, description, properties, required, server, remote_name=name,
+                          validator=ArgumentValidator(inputSchema, self.argument_aliases))
+        self.tools[local_name] = tool
+        self._specs = None
+        return local_name
 
-    def get_tools(self) -> Dict[str, List[Dict]]:
+    def unregister_tool(self, name: str) -> bool:
+        """Remove a registered tool; returns False if it was not registered"""
+        if self.tools.pop(name, None) is None:
+            return False
+        self._specs = None
+        return True
+
+    def sync_server_tools(self, server: str, tools: List[Any], function: Callable) -> Tuple[List[str], List[str]]:
         """
-        Generate the tools specification.
+        Make the registered tools of ``server`` match ``tools`` (``mcp.types.Tool``
+        or objects with name/description/inputSchema). Returns ``(registered, removed)``
+        local names; unchanged tools are kept as they are.
         """
-        tool_specs = []
-        for name, tool in self.tools.items():
-            tool_specs.append({
-                'type': 'function',
-                'function': {
-                    'name': name,
-                    'description': tool.description,
+        current = {tool.remote_name: local for local, tool in self.tools.items() if tool.server == server}
+        wanted = {tool.name: tool for tool in tools}
+        removed = [current[name] for name in current if name not in wanted]
+        for local in removed:
+            self.unregister_tool(local)
+        registered = []
+        for name, tool in wanted.items():
+            existing = self.tools.get(current.get(name))
+            if (existing is not None and existing.description == tool.description
+                    and existing.properties == tool.inputSchema['properties']
+                    and existing.required == tool.inputSchema.get('required', [])):
+                continue
+            registered.append(self.register_tool(name, function, tool.description, tool.inputSchema, server=server))
+        return registered, removed
+
+    @staticmethod
+    def _compile_spec(name: str, tool: OllamaTool) -> Dict[str, Any]:
+        return {
+            'type': 'function',
+            'function': {
+                'name': name,
+                'description': tool.description,
+                'parameters': {
+                    'type': 'object',
                     'properties': tool.properties,
-                    'required': tool.required
-                }
-            })
-        return tool_specs
+                    'required': tool.required,
+                },
+            },
+        }
+
+    def _compiled(self) -> Dict[str, Dict[str, Any]]:
+        if self._specs is None:
+            self._specs = {name: self._compile_spec(name, tool) for name, tool in self.tools.items()}
+            self._spec_list = list(self._specs.values())
+            self._spec_json = {
+                name: json.dumps(spec, ensure_ascii=False, separators=(",", ":"))
+                for name, spec in self._specs.items()
+            }
+            self._all_json = "[" + ",".join(self._spec_json.values()) + "]"
+        return self._specs
+
+    def get_tools(self, names: Optional[Iterable[str]] = None) -> List[Dict[str, Any]]:
+        """
+        Tools specification for ``ollama.chat``, limited to ``names`` when given.
+        Specs are built once per registry change and shared between calls;
+        callers must not modify them.
+        """
+        specs = self._compiled()
+        if names is None:
+            return self._spec_list
+        return [specs[name] for name in names if name in specs]
+
+    def get_tools_json(self, names: Optional[Iterable[str]] = None) -> str:
+        """Compact JSON of ``get_tools(names)`` from the cached per-tool serialization"""
+        self._compiled()
+        if names is None:
+            return self._all_json
+        return "[" + ",".join(self._spec_json[name] for name in names if name in self._spec_json) + "]"
 
     async def execute_tool(self, payload: Dict[str, Any]) -> Dict[str, Any]:
         """
@@ -50,21 +165,128 @@ class OllamaToolManager:
 
         if name not in self.tools:
             raise ValueError(f"Unknown tool: {name}")
-        try:
-            tool_func = self.tools[name].function
-            print("\nTool = \n", name)
-            print("\nTool input = \n", tool_input)
-            result = await tool_func(name, tool_input)
+        server = self.tools[name].server
+        cache = self.result_cache
+        with span("tool", tool=name, server=server,
+                  args_bytes=len(json.dumps(tool_input, ensure_ascii=False, default=str))) as tool_span:
+            validator = self.tools[name].validator
+            if validator is not None:
+                try:
+                    tool_input = validator(tool_input)
+                except ToolArgumentError as e:
+                    # 不符合 schema 的呼叫直接回報給模型修正，不送到 server
+                    if tool_span is not None:
+                        tool_span.set(status="invalid_arguments")
+                    return {
+                        'tool': name,
+                        'content': [{
+                            'text': f"Invalid arguments for tool {name}: {e}"
+                        }],
+                        'status': 'error'
+                    }
+            tool = self.tools[name]
+            # 名稱衝突時 name 是 server__name；快取/逾時/合併都以 server 上的原始名稱判斷
+            remote_name = tool.remote_name or name
+            if cache is not None:
+                hit, cached = cache.lookup(server, remote_name, tool_input)
+                if tool_span is not None:
+                    tool_span.set(cache="hit" if hit else "miss")
+                if hit:
+                    return cached
+                # 參數可能被工具 wrapper 修改，先保留一份作為快取 key
+                cache_arguments = dict(tool_input or {})
+                token = cache.begin(server, remote_name, cache_arguments)
+            tool_timeout = None
+            if self.timeouts is not None:
+                tool_timeout = self.timeouts.for_tool(server, remote_name)
+            started = time.perf_counter()
+            try:
+                print("\nTool = \n", name)
+                print("\nTool input = \n", tool_input)
+                # deadline 會經 contextvars 傳到 MCP 呼叫，逾時時由它送出 cancel 通知
+                with deadline(tool_timeout):
+                    async with asyncio.timeout(timeout_for()):
+                        result = await self._call(tool, name, tool_input, tool_span)
+            except TimeoutError:
+                result = {
+                    'tool': name,
+                    'content': [{
+                        'text': f"Tool {name} timed out after {time.perf_counter() - started:.1f}s"
+                    }],
+                    'status': 'error'
+                }
+            except Exception as e:
+                result = {
+                    'tool': name,
+                    'content': [{
+                        'text': f"Error executing tool: {str(e)}"
+                    }],
+                    'status': 'error'
+                }
+            if cache is not None:
+                cache.store(server, remote_name, cache_arguments, result, token)
+            if tool_span is not None:
+                is_error = result.get('status') == 'error' if isinstance(result, dict) else bool(getattr(result, 'isError', False))
+                tool_span.set(status="error" if is_error else "ok", result_bytes=len(str(result)))
             return result
-        except Exception as e:
-            return {
-                'tool': name,
-                'content': [{
-                    'text': f"Error executing tool: {str(e)}"
-                }],
-                'status': 'error'
-            }
+
+    async def _call(self, tool: OllamaTool, name: str, tool_input: Dict[str, Any], tool_span=None) -> Any:
+        """Call the tool function, attaching to an identical read-only call already in flight"""
+        remote_name = tool.remote_name or name
+        flight = self.singleflight
+        if flight is None or not flight.is_read_only(remote_name):
+            return await tool.function(remote_name, tool_input)
+        key = flight.key(tool.server, remote_name, tool_input)
+        # 工具 wrapper 可能修改參數，每次呼叫給一份新的
+        result, coalesced = await flight.do(key, lambda: tool.function(remote_name, dict(tool_input or {})))
+        self.coalescing_stats["calls"] += 1
+        if coalesced:
+            self.coalescing_stats["coalesced"] += 1
+            if tool_span is not None:
+                tool_span.set(coalesced=True)
+        return result
+
+    async def execute_tools(self, payloads: List[Dict[str, Any]]) -> List[Any]:
+        """
+        Execute several tool calls concurrently, at most ``max_concurrency_per_server``
+        at a time per MCP server across all callers of this manager (overlapping
+        turns included). Results are returned in the order of ``payloads``;
+        a failing call yields an error dict instead of aborting the others.
+        """
+        async def run(payload):
+            name = payload["function"].name
+            tool = self.tools.get(name)
+            server = tool.server if tool else None
+            if server not in self._semaphores:
+                self._semaphores[server] = asyncio.Semaphore(self.max_concurrency_per_server)
+            async with self._semaphores[server]:
+                try:
+                    return await self.execute_tool(payload)
+                except Exception as e:
+                    return {
+                        'tool': name,
+                        'content': [{
+                            'text': f"Error executing tool: {str(e)}"
+                        }],
+                        'status': 'error'
+                    }
+
+        return await asyncio.gather(*(run(payload) for payload in payloads))
 
     def clear_tools(self):
         """Clear all registered tools"""
         self.tools.clear()
+        self._colliding.clear()
+        self._specs = None
+
+
+def tool_manager_from_config(config_path: str = "config.json") -> OllamaToolManager:
+    """A tool manager set up from config.json, shared by the Streamlit app and the CLI"""
+    settings = get_config_store(config_path).section("Tool_Execution")
+    return OllamaToolManager(
+        max_concurrency_per_server=settings.get("MAX_CONCURRENCY_PER_SERVER", 4),
+        result_cache=result_cache_from_config(config_path),
+        argument_aliases=aliases_from_config(config_path),
+        timeouts=timeout_policy_from_config(config_path),
+        singleflight=get_singleflight(config_path),
+    )
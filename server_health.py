@@ -0,0 +1,131 @@
+import random
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional
+
+HEALTHY = "healthy"
+DOWN = "down"
+PROBING = "probing"
+UNKNOWN = "unknown"
+
+
+class CircuitOpenError(RuntimeError):
+    """The server is marked down; the call was rejected without trying to connect"""
+
+
+@dataclass
+class ServerHealth:
+    state: str = UNKNOWN
+    consecutive_failures: int = 0
+    # 連續幾次開啟斷路器，決定下次重試的退避時間
+    trips: int = 0
+    last_error: Optional[str] = None
+    last_ok: Optional[float] = None
+    last_failure: Optional[float] = None
+    retry_at: Optional[float] = None
+    latencies: List[float] = field(default_factory=list)
+
+
+class HealthTracker:
+    """
+    Per-server circuit breaker.
+
+    A server is marked ``down`` after ``failure_threshold`` consecutive
+    connection failures; calls then fail fast with CircuitOpenError until the
+    backoff (``backoff_base * 2**(trips-1)`` seconds with jitter, capped at
+    ``backoff_max``) has passed. The next call, or the pool's background
+    health check, is let through as a single probe (``probing``): success
+    closes the circuit, failure opens it again with a longer backoff.
+    Only transport/connection failures are recorded, not tool errors.
+    """
+
+    def __init__(self, failure_threshold: int = 3, backoff_base: float = 1.0, backoff_max: float = 60.0):
+        self.failure_threshold = max(1, failure_threshold)
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self._servers: Dict[str, ServerHealth] = {}
+        # UI thread 讀取 snapshot、背景 loop 更新狀態
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_settings(cls, settings: Dict[str, Any]):
+        """Create from the ``Session_Pool`` section of config.json"""
+        return cls(
+            failure_threshold=settings.get("FAILURE_THRESHOLD", 3),
+            backoff_base=settings.get("BACKOFF_BASE", 1.0),
+            backoff_max=settings.get("BACKOFF_MAX", 60.0),
+        )
+
+    def _get(self, server: str) -> ServerHealth:
+        if server not in self._servers:
+            self._servers[server] = ServerHealth()
+        return self._servers[server]
+
+    def check(self, server: str) -> bool:
+        """
+        Raise CircuitOpenError unless a call may go to ``server``. Returns True
+        if the caller was let through as the probe (pass to ``release_probe``).
+        """
+        with self._lock:
+            health = self._get(server)
+            probing = health.state == DOWN and time.monotonic() >= health.retry_at
+            if probing:
+                health.state = PROBING
+            if probing or health.state not in (DOWN, PROBING):
+                return probing
+            retry_in = max(0.0, (health.retry_at or 0) - time.monotonic())
+            error = health.last_error
+        raise CircuitOpenError(f"MCP server {server} is unavailable (last error: {error}); retry in {retry_in:.0f}s")
+
+    def record_success(self, server: str, latency_ms: Optional[float] = None):
+        with self._lock:
+            health = self._get(server)
+            health.state = HEALTHY
+            health.consecutive_failures = 0
+            health.trips = 0
+            health.retry_at = None
+            health.last_ok = time.time()
+            if latency_ms is not None:
+                health.latencies = (health.latencies + [latency_ms])[-20:]
+
+    def record_failure(self, server: str, error: BaseException):
+        with self._lock:
+            health = self._get(server)
+            health.consecutive_failures += 1
+            health.last_error = f"{type(error).__name__}: {error}" if str(error) else type(error).__name__
+            health.last_failure = time.time()
+            if health.state == PROBING or health.consecutive_failures >= self.failure_threshold:
+                health.trips += 1
+                backoff = min(self.backoff_max, self.backoff_base * 2 ** (health.trips - 1))
+                health.retry_at = time.monotonic() + backoff * random.uniform(0.8, 1.2)
+                health.state = DOWN
+
+    def release_probe(self, server: str):
+        """End a probe that finished without a verdict (e.g. cancelled); the next call probes again"""
+        with self._lock:
+            health = self._servers.get(server)
+            if health is not None and health.state == PROBING:
+                health.state = DOWN
+
+    def try_probe(self, server: str) -> bool:
+        """If ``server`` is down and its backoff has passed, claim the probe and return True"""
+        with self._lock:
+            health = self._servers.get(server)
+            if health is None or health.state != DOWN or time.monotonic() < health.retry_at:
+                return False
+            health.state = PROBING
+            return True
+
+    def snapshot(self, server: str) -> Dict[str, Any]:
+        """Health of ``server`` for display"""
+        with self._lock:
+            health = self._get(server)
+            return {
+                "state": health.state,
+                "consecutive_failures": health.consecutive_failures,
+                "last_error": health.last_error,
+                "last_ok": health.last_ok,
+                "retry_in_s": max(0.0, health.retry_at - time.monotonic()) if health.retry_at else None,
+                "ping_ms": health.latencies[-1] if health.latencies else None,
+            }
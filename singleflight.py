@@ -0,0 +1,97 @@
+import asyncio
+import json
+import threading
+from typing import Any, Awaitable, Callable, Dict, Iterable, Optional, Tuple
+
+from config_store import get_config_store
+from tool_result_cache import DEFAULT_READ_ONLY_TOOLS
+
+
+class SingleFlight:
+    """
+    Coalesces identical read-only tool calls that are in flight at the same time.
+
+    The first call runs the request in its own task; identical calls (same
+    server, tool and canonical JSON arguments) made before it finishes wait
+    for that task and get the same result. A waiter that is cancelled or times
+    out only stops waiting; the request itself is cancelled once nobody waits
+    for it. Mutating tools (not in ``read_only_tools``) are never coalesced.
+
+    One instance is shared by every OllamaToolManager in the process (see
+    ``get_singleflight``), so calls from different Streamlit sessions coalesce
+    too. The shared request runs with the deadline of the first caller.
+    """
+
+    def __init__(self, read_only_tools: Iterable[str] = DEFAULT_READ_ONLY_TOOLS):
+        self.read_only_tools = set(read_only_tools)
+        self.stats = {"calls": 0, "coalesced": 0}
+        # key -> (task, waiters)；task 綁定建立它的 event loop，key 內含 loop
+        self._inflight: Dict[Tuple, list] = {}
+
+    @classmethod
+    def from_settings(cls, settings: Dict[str, Any], read_only_tools: Iterable[str] = DEFAULT_READ_ONLY_TOOLS):
+        """Create from the ``Tool_Coalescing`` section of config.json"""
+        return cls(read_only_tools=settings.get("READ_ONLY_TOOLS") or read_only_tools)
+
+    def is_read_only(self, name: str) -> bool:
+        return name in self.read_only_tools
+
+    @staticmethod
+    def key(server: Optional[str], name: str, arguments: Any) -> Tuple:
+        return (id(asyncio.get_running_loop()), server, name,
+                json.dumps(arguments or {}, sort_keys=True, ensure_ascii=False, default=str))
+
+    async def do(self, key: Tuple, call: Callable[[], Awaitable[Any]]) -> Tuple[Any, bool]:
+        """
+        Run ``call()`` unless an identical call is in flight. Returns
+        ``(result, coalesced)``; exceptions of the shared call are raised to every waiter.
+        """
+        self.stats["calls"] += 1
+        entry = self._inflight.get(key)
+        coalesced = entry is not None
+        if coalesced:
+            self.stats["coalesced"] += 1
+            entry[1] += 1
+        else:
+            task = asyncio.ensure_future(call())
+            entry = self._inflight[key] = [task, 1]
+
+            def finished(_):
+                # 完成時就移除，之後的呼叫會重新送出
+                if self._inflight.get(key) is entry:
+                    del self._inflight[key]
+
+            task.add_done_callback(finished)
+        task = entry[0]
+        try:
+            return await asyncio.shield(task), coalesced
+        except asyncio.CancelledError:
+            entry[1] -= 1
+            if entry[1] == 0 and not task.done():
+                # 沒有人在等了，取消實際的請求（MCP 端會收到 notifications/cancelled）
+                task.cancel()
+                if self._inflight.get(key) is entry:
+                    del self._inflight[key]
+            raise
+        finally:
+            if not task.cancelled() and task.done():
+                # 取出例外，避免沒有 waiter 時出現 "exception was never retrieved"
+                task.exception()
+
+
+_singleflight: Optional[SingleFlight] = None
+_singleflight_lock = threading.Lock()
+
+
+def get_singleflight(config_path: str = "config.json") -> Optional[SingleFlight]:
+    """The process-wide SingleFlight if ``Tool_Coalescing.ENABLED`` is true, else None"""
+    global _singleflight
+    store = get_config_store(config_path)
+    settings = store.section("Tool_Coalescing")
+    if not settings.get("ENABLED", True):
+        return None
+    with _singleflight_lock:
+        if _singleflight is None:
+            read_only = store.section("Tool_Cache").get("READ_ONLY_TOOLS", DEFAULT_READ_ONLY_TOOLS)
+            _singleflight = SingleFlight.from_settings(settings, read_only)
+        return _singleflight
@@ -1,13 +1,11 @@
-import json
+from config_store import get_config_store
 
 def get_chat_container_height():
     """
     從 config.json 讀取聊天區塊高度設定，若無則回傳預設值 500。
     """
     try:
-        with open("config.json", "r", encoding="utf-8") as f:
-            config = json.load(f)
-        return config.get("UI_Settings", {}).get("CHAT_CONTAINER_HEIGHT", 500)
+        return get_config_store().section("UI_Settings").get("CHAT_CONTAINER_HEIGHT", 500)
     except Exception:
         return 500
 
@@ -17,8 +15,6 @@ def get_stream_mode():
     """
     
     try:
-        with open("config.json", "r", encoding="utf-8") as f:
-            config = json.load(f)
-        return config.get("UI_Settings", {}).get("STREAM_MODE", True)
+        return get_config_store().section("UI_Settings").get("STREAM_MODE", True)
     except Exception:
-        return True 
\ No newline at end of file
+        return True
@@ -1,26 +1,61 @@
 import streamlit as st
-import asyncio
-from mcpclient_manager import MCPClientManager, get_available_servers, load_config, initialize_agent_and_tools
-from ollama_toolmanager import OllamaToolManager
-from ollama_agent import OllamaAgent
+from mcpclient_manager import get_available_servers, initialize_agent_and_tools
+from ollama_agent import TextDelta, ToolCallStart, ToolResult, Done
 import ollama
-from model_setting import sync_model_tool_support, get_model_tool_support, set_model_tool_support
+from model_setting import sync_model_tool_support, get_model_tool_support, get_model_capabilities
 
 # 從 streamlit_manager 讀取聊天區塊高度
 from streamlit_manager import get_chat_container_height, get_stream_mode
+from mcpsession_pool import get_session_pool
+from background_loop import get_background_loop
+from tool_catalog import get_tool_catalog
+from model_preload import model_load_state
+from tracing import load_traces, latency_by, waterfall_rows
+from config_store import get_config_store
 CHAT_CONTAINER_HEIGHT = get_chat_container_height()
+# 模型清單快取秒數；connect 時會重新列出並探測所選模型
+MODEL_LIST_TTL = 30
+# streaming 時重繪聊天內容的最短間隔（秒）
+STREAM_RENDER_INTERVAL = 0.05
+
+# 啟動時預先建立 warm spare MCP server（已啟動過的 server 會自動略過）
+if get_session_pool().prewarm_enabled:
+    get_session_pool().start_prewarm()
+# 背景定期 ping 已連線的 server，並依退避時間重連標記為 down 的 server
+get_session_pool().start_health_checks()
+
+HEALTH_ICONS = {"healthy": "🟢", "probing": "🟡", "down": "🔴", "unknown": "⚪"}
+
+
+def server_status_line(server):
+    """一行 server 健康狀態，例如「🔴 excel：無法連線，12 秒後重試」"""
+    status = get_session_pool().server_status(server)
+    line = f"{HEALTH_ICONS.get(status['state'], '⚪')} {server}"
+    if status["state"] == "down":
+        line += f"：無法連線，{status['retry_in_s'] or 0:.0f} 秒後重試"
+    elif status["state"] == "probing":
+        line += "：重新連線中"
+    elif status["ping_ms"] is not None:
+        line += f"（ping {status['ping_ms']:.0f} ms）"
+    return line
+
+@st.cache_data(ttl=MODEL_LIST_TTL, show_spinner=False)
+def list_local_models():
+    """ollama.list 的模型名稱；清單更新時一併同步模型支援狀態（新模型以 ollama.show 探測）"""
+    models = ollama.list()['models']
+    digests = {model['model']: model.get('digest') for model in models}
+    sync_model_tool_support(list(digests), digests)
+    return list(digests)
+
+
+def stop_current_turn():
+    """停止按鈕的 callback；在被中斷的 run 結束後執行，標記保留下來的部分回答"""
+    st.session_state.processing = False
+    history = st.session_state.get("chat_history", [])
+    if history and history[-1]["role"] == "assistant":
+        partial = history[-1]["content"]
+        history[-1]["content"] = ("" if partial in ("", "[未完成]") else partial + "\n\n") + "⏹ 已停止"
 
-async def summarize_tool_result(agent, tool_result, user_prompt):
-    """
-    將工具回應丟給 LLM，請 LLM 幫忙總結/說明。
-    """
-    summary_prompt = (
-        f"使用者原始問題：{user_prompt}\n"
-        f"工具回應如下：\n{tool_result}\n"
-        "請用自然語言總結這個工具回應，若有錯誤請友善說明原因並給出建議。"
-    )
-    async for chunk in agent.get_response(summary_prompt, stream=False):
-        return chunk
 
 try:
     # 初始化 session state
@@ -34,8 +69,8 @@ try:
         st.session_state.connected = False
     if "selected_model" not in st.session_state:
         st.session_state.selected_model = None
-    if "selected_server" not in st.session_state:
-        st.session_state.selected_server = None
+    if "selected_servers" not in st.session_state:
+        st.session_state.selected_servers = []
     if "page" not in st.session_state:
         st.session_state.page = "chat"
     if "selected_mcp_server" not in st.session_state:
@@ -57,38 +92,41 @@ try:
         unsafe_allow_html=True
     )
     st.sidebar.title("🦙Ollama MCP Client Setting")
-    # 取得本地模型清單
+    # 取得本地模型清單（快取 MODEL_LIST_TTL 秒，不必每次 rerun 都呼叫 ollama.list）
     try:
-        available_models_data = ollama.list()
-        available_models = [model['model'] for model in available_models_data['models']]
+        available_models = list_local_models()
     except Exception as e:
         available_models = []
         st.sidebar.error(f"取得模型失敗: {e}")
 
-    # 同步模型支援狀態
-    model_tool_support_dict = sync_model_tool_support(available_models)
-
     prev_model = st.session_state.get("_prev_selected_model")
-    prev_server = st.session_state.get("_prev_selected_server")
+    prev_servers = st.session_state.get("_prev_selected_servers")
     selected_model = st.sidebar.selectbox("Ollama model selection", available_models, key="selected_model")
     servers = get_available_servers()
-    selected_server = st.sidebar.selectbox("MCP Server selection", servers, key="selected_server")
+    # 可同時連接多個 MCP server，工具合併到同一個 agent
+    if not st.session_state.selected_servers and servers:
+        st.session_state.selected_servers = [servers[0]]
+    selected_servers = st.sidebar.multiselect("MCP Server selection", servers, key="selected_servers")
+    for server in selected_servers:
+        st.sidebar.caption(server_status_line(server))
     # 若模型或 server 有變動，清除 agent/mcpclient/connected
-    if (prev_model is not None and prev_model != selected_model) or (prev_server is not None and prev_server != selected_server):
+    if (prev_model is not None and prev_model != selected_model) or (prev_servers is not None and prev_servers != selected_servers):
         st.session_state.agent = None
         st.session_state.mcpclient = None
         st.session_state.connected = False
         st.session_state.chat_history = []
     st.session_state["_prev_selected_model"] = selected_model
-    st.session_state["_prev_selected_server"] = selected_server
+    st.session_state["_prev_selected_servers"] = list(selected_servers)
     model_supports_tool = get_model_tool_support(selected_model)
 
-    if st.sidebar.button("connect/initialize"):
+    if st.sidebar.button("connect/initialize", disabled=not selected_servers):
         try:
-            agent = initialize_agent_and_tools(selected_model, selected_server, None)
+            init_timings = {}
+            agent = initialize_agent_and_tools(selected_model, selected_servers, None, timings=init_timings)
             st.session_state.agent = agent  # 只存 agent（無 async context）
             st.session_state.connected = True
             st.session_state.chat_history = []
+            st.session_state.init_timings = init_timings
             st.sidebar.success("connected!")
         except Exception as e:
             import traceback
@@ -98,6 +136,12 @@ try:
             st.sidebar.text(traceback.format_exc())
             
 
+    # 初始化各階段耗時（同時進行，total 約等於最慢的階段）
+    if st.session_state.connected and st.session_state.get("init_timings"):
+        with st.sidebar.expander("⏱️ 初始化耗時", expanded=False):
+            for phase, ms in st.session_state.init_timings.items():
+                st.caption(f"{phase}: {ms:.0f} ms")
+
     # 新增 MCP Server 管理按鈕
     st.sidebar.markdown("---")
     if st.sidebar.button("🛠️ MCP Server management"):
@@ -107,6 +151,9 @@ try:
     if st.sidebar.button("💬 Chat room"):
         st.session_state.page = "chat"
         st.rerun()
+    if st.sidebar.button("📈 Performance"):
+        st.session_state.page = "performance"
+        st.rerun()
 
     # MCP Server management page
     if st.session_state.get("page") == "mcp_server":
@@ -117,38 +164,88 @@ try:
                 st.session_state.selected_mcp_server = key
                 st.session_state.page = "mcp_tools"
                 st.rerun()
+            status = get_session_pool().server_status(key)
+            st.caption(f"{server_status_line(key)} · 連線 {status['open']}（閒置 {status['idle']}）")
+            if status["state"] in ("down", "probing") and status["last_error"]:
+                st.caption(f"最後錯誤：{status['last_error']}")
         st.stop()
 
     # MCP Tools 頁面
     if st.session_state.get("page") == "mcp_tools":
         server_type = st.session_state.get("selected_mcp_server")
         st.title(f"🔧 MCP Tools @ {server_type}")
-        import asyncio
-        from mcpclient_manager import MCPClientManager
-        async def show_tools():
+        def show_tools():
             try:
-                async with MCPClientManager(server_type) as mcpclient:
-                    tools = await mcpclient.get_available_tools()
-                    if not tools:
-                        st.info("此 MCP Server 無可用工具。")
-                        return
-                    tab_labels = [getattr(tool, 'name', str(tool)) for tool in tools]
-                    tabs = st.tabs(tab_labels)
-                    for i, tool in enumerate(tools):
-                        with tabs[i]:
-                            st.subheader("📝 功能描述")
-                            st.write(getattr(tool, 'description', ''))
-                            st.subheader("🛠️ Input 參數")
-                            st.json(getattr(tool, 'inputSchema', {}))
-                            st.subheader("📤 Return 內容")
-                            output_schema = getattr(tool, 'outputSchema', None)
-                            if output_schema:
-                                st.json(output_schema)
-                            else:
-                                st.info("無 outputSchema 定義")
+                # 先顯示 tool catalog 快取，背景再向 server 確認，不再每次造訪都列一次工具
+                tools = get_background_loop().run(get_tool_catalog().list_tools(server_type))
+                if not tools:
+                    st.info("此 MCP Server 無可用工具。")
+                    return
+                tab_labels = [getattr(tool, 'name', str(tool)) for tool in tools]
+                tabs = st.tabs(tab_labels)
+                for i, tool in enumerate(tools):
+                    with tabs[i]:
+                        st.subheader("📝 功能描述")
+                        st.write(getattr(tool, 'description', ''))
+                        st.subheader("🛠️ Input 參數")
+                        st.json(getattr(tool, 'inputSchema', {}))
+                        st.subheader("📤 Return 內容")
+                        output_schema = getattr(tool, 'outputSchema', None)
+                        if output_schema:
+                            st.json(output_schema)
+                        else:
+                            st.info("無 outputSchema 定義")
             except Exception as e:
                 st.error(f"連線 MCP Server 失敗: {e}")
-        asyncio.run(show_tools())
+        show_tools()
+        st.stop()
+
+    # Performance 頁面：依 traces.jsonl 顯示每個 turn 的 waterfall 與延遲分位數
+    if st.session_state.get("page") == "performance":
+        st.title("📈 Performance")
+        tracing_settings = get_config_store().section("Tracing")
+        traces = load_traces(limit=tracing_settings.get("MAX_TRACES_SHOWN", 50))
+        if not traces:
+            st.info("尚無 trace 紀錄，請先進行對話（config.json 的 Tracing.ENABLED 需為 true）。")
+            st.stop()
+        st.subheader("⏱️ Latency (p50 / p95)")
+        col1, col2, col3 = st.columns(3)
+        with col1:
+            st.caption("Tools")
+            st.dataframe(latency_by(traces, "tool", "tool"), hide_index=True)
+        with col2:
+            st.caption("LLM calls")
+            st.dataframe(latency_by(traces, "llm", "model"), hide_index=True)
+        with col3:
+            st.caption("MCP connects")
+            st.dataframe(latency_by(traces, "mcp.connect", "server"), hide_index=True)
+
+        st.subheader("🌊 Waterfall")
+        recent = list(reversed(traces))
+        labels = [
+            f"{t['started_at'][11:19]} {t['name']} {t['attributes'].get('model', '')} ({t['duration_ms']:.0f} ms)"
+            for t in recent
+        ]
+        index = st.selectbox("Trace", range(len(recent)), format_func=lambda i: labels[i])
+        trace = recent[index]
+        st.vega_lite_chart(
+            {"values": waterfall_rows(trace)},
+            {
+                "mark": {"type": "bar", "tooltip": True},
+                "encoding": {
+                    "y": {"field": "label", "type": "nominal", "sort": None, "title": None},
+                    "x": {"field": "start_ms", "type": "quantitative", "title": "ms"},
+                    "x2": {"field": "end_ms"},
+                    "color": {"field": "span", "type": "nominal"},
+                    "tooltip": [
+                        {"field": "span"}, {"field": "duration_ms"}, {"field": "attributes"},
+                    ],
+                },
+            },
+            use_container_width=True,
+        )
+        with st.expander("Raw trace"):
+            st.json(trace)
         st.stop()
 
     # 主畫面
@@ -166,9 +263,30 @@ try:
             st.markdown("<span style='color:red;font-weight:bold'>❌ <b>無法使用 MCP 工具</b></span>", unsafe_allow_html=True)
         else:
             st.markdown("<span style='color:green;font-weight:bold'>✅ 可使用 MCP 工具</span>", unsafe_allow_html=True)
+        model_capabilities = get_model_capabilities(selected_model)
+        if model_capabilities:
+            st.caption(
+                f"family: {model_capabilities.get('family') or '?'} · "
+                f"context: {model_capabilities.get('context_length') or '?'} tokens"
+            )
+        # 模型載入狀態（ollama ps）
+        try:
+            load_state = get_background_loop().run(model_load_state(selected_model), timeout=2)
+        except Exception:
+            load_state = None
+        if load_state and load_state["loaded"]:
+            expires_in = load_state["expires_in_s"]
+            if expires_in is not None and expires_in < 10 ** 6:
+                st.caption(f"🟢 模型已載入記憶體（約 {max(expires_in, 0) / 60:.0f} 分鐘後釋放）")
+            else:
+                st.caption("🟢 模型已載入記憶體")
+        elif load_state is not None:
+            st.caption("⚪ 模型尚未載入，第一次回應需等待載入")
     with col2:
         st.markdown("#### 🛠️ MCP Server")
-        st.markdown(f"<span style='font-size:1.2em;font-weight:bold'>{selected_server}</span>", unsafe_allow_html=True)
+        st.markdown(f"<span style='font-size:1.2em;font-weight:bold'>{', '.join(selected_servers)}</span>", unsafe_allow_html=True)
+        if len(selected_servers) > 1:
+            st.caption(f"{len(st.session_state.agent.tool_manager.tools)} tools（同名工具以 server__tool 區分）")
 
     
 
@@ -207,7 +325,10 @@ try:
         with col1:
             prompt = st.chat_input("請輸入你的問題：", disabled=st.session_state.get("processing", False))
         with col2:
-            if st.button("清除", help="清除即時聊天並存入歷史紀錄"):
+            if st.session_state.get("processing", False):
+                # 按下後 Streamlit 會中斷目前的 script run，BackgroundLoop.stream 隨之取消 agent turn
+                st.button("⏹ 停止", help="停止目前的回答與工具執行，保留已產生的內容", on_click=stop_current_turn)
+            elif st.button("清除", help="清除即時聊天並存入歷史紀錄"):
                 if "chat_history_archive" not in st.session_state:
                     st.session_state.chat_history_archive = []
                 st.session_state.chat_history_archive.extend(st.session_state.chat_history)
@@ -225,45 +346,70 @@ try:
             st.session_state.chat_history[-1]["content"] == "" and
             st.session_state.get("processing", False)  # 只有在處理中才執行
         ):
-            with st.status("Processing...", expanded=True):
-                import asyncio
-                stream_mode = get_stream_mode()
-                if stream_mode:
+            # 文字 delta 只 append 到 buffer，定時重繪一次，避免每個 token 都重繪整段 markdown
+            buffer = []
+            try:
+                with st.status("Processing...", expanded=True):
+                    import time
+                    stream_mode = get_stream_mode()
+                    user_prompt = st.session_state.chat_history[-2]["content"]
                     with chat_container.chat_message("assistant"):
                         ai_placeholder = st.empty()
-                        def update(content):
-                            st.session_state.chat_history[-1]["content"] = content
-                            ai_placeholder.markdown(content)
-                        async def stream_agent_response():
-                            async for chunk in st.session_state.agent.get_response(st.session_state.chat_history[-2]["content"], stream=True):
-                                if isinstance(chunk, dict) and chunk.get("tool_result"):
-                                    summary = await summarize_tool_result(
-                                        st.session_state.agent,
-                                        chunk["tool_result"],
-                                        st.session_state.chat_history[-2]["content"]
-                                    )
-                                    
-                                    update(summary)
-                                    break
+                    last_render = [0.0]
+                    def render(force=False):
+                        now = time.monotonic()
+                        if force or now - last_render[0] >= STREAM_RENDER_INTERVAL:
+                            ai_placeholder.markdown("".join(buffer))
+                            last_render[0] = now
+                    def run_agent_turn():
+                        # agent 內部完成 tool call → 回填結果 → 繼續回答的整個流程
+                        # agent turn 在背景 loop 上執行，事件經 queue 交回 script thread 顯示
+                        events = st.session_state.agent.get_response(user_prompt, stream=stream_mode)
+                        # 等待事件時定期重繪，讓停止按鈕觸發的 rerun 能中斷這個 run
+                        for event in get_background_loop().stream(events, idle=lambda: render(force=True)):
+                            if isinstance(event, TextDelta):
+                                buffer.append(event.text)
+                                if stream_mode:
+                                    render()
+                            elif isinstance(event, ToolCallStart):
+                                # tool call 一到就先顯示，結果稍後才回來
+                                st.write(f"🤖 呼叫工具：`{event.name}` `{event.arguments}`")
+                            elif isinstance(event, ToolResult):
+                                if event.is_error:
+                                    st.error(event.content)
                                 else:
-                                    update(chunk)
-                        asyncio.run(stream_agent_response())
-                else:
-                    async def get_first_response():
-                        agen = st.session_state.agent.get_response(st.session_state.chat_history[-2]["content"], stream=False)
-                        async for chunk in agen:
-                            if isinstance(chunk, dict) and chunk.get("tool_result"):
-                                summary = await summarize_tool_result(
-                                    st.session_state.agent,
-                                    chunk["tool_result"],
-                                    st.session_state.chat_history[-2]["content"]
+                                    st.write(f"🛠️ `{event.name}` 完成（{len(event.content)} 字元）")
+                            elif isinstance(event, Done):
+                                stats = event.stats
+                                st.caption(
+                                    f"LLM 呼叫 {stats.get('llm_calls', 0)} 次 · "
+                                    f"prompt tokens {stats.get('prompt_tokens', 0)} · "
+                                    f"工具呼叫 {stats.get('tool_calls', 0)} 次"
                                 )
-                                return summary
-                            else:
-                                return chunk
-                    res = asyncio.run(get_first_response())
-                    st.session_state.chat_history[-1]["content"] = res
-            st.session_state["processing"] = False  # 清除處理標記
+                                tool_cache = stats.get("tool_cache")
+                                if tool_cache:
+                                    st.caption(f"工具結果快取：命中 {tool_cache['hits']} / 未命中 {tool_cache['misses']}")
+                                coalescing = stats.get("tool_coalescing")
+                                if coalescing and coalescing["coalesced"]:
+                                    st.caption(f"合併的重複工具呼叫：{coalescing['coalesced']} / {coalescing['calls']}")
+                                selection = stats.get("tool_selection")
+                                if selection:
+                                    st.caption(f"工具篩選（{selection['method']}）：送出 {selection['selected']}/{selection['total']} 個工具，"
+                                               f"約省下 {selection['tokens_saved']} tokens")
+                                history = stats.get("history")
+                                if history and (history["elided_messages"] or history["dropped_turns"]):
+                                    st.caption(
+                                        f"歷史壓縮：保留約 {history['kept_tokens']} / 省下約 {history['dropped_tokens']} tokens"
+                                        f"（省略 {history['elided_messages']} 則工具輸出、{history['dropped_turns']} 個舊 turn）"
+                                    )
+                    run_agent_turn()
+                    render(force=True)
+                    st.session_state.chat_history[-1]["content"] = "".join(buffer)
+            finally:
+                # 逾時或例外時也要清除處理標記，否則輸入框會一直停用
+                st.session_state["processing"] = False
+                if st.session_state.chat_history[-1]["content"] == "":
+                    st.session_state.chat_history[-1]["content"] = "".join(buffer) or "[未完成]"
             st.rerun()
 
     with tab2:
@@ -0,0 +1,24 @@
+import pytest
+import debug_logging
+import tracing
+
+
+@pytest.fixture(scope="session", autouse=True)
+def isolated_log_file(tmp_path_factory):
+    """Write debug.log of the test run to a temp directory instead of the project root"""
+    debug_logging._ensure_listener()
+    handler = debug_logging._listener.handlers[0]
+    handler.acquire()
+    try:
+        # 關閉後下一筆紀錄會以新的 baseFilename 重新開檔
+        handler.close()
+        handler.baseFilename = str(tmp_path_factory.mktemp("logs") / "debug.log")
+    finally:
+        handler.release()
+    yield
+
+
+@pytest.fixture(autouse=True)
+def isolated_trace_file(tmp_path, monkeypatch):
+    """Export traces of each test to its own temp file instead of traces.jsonl"""
+    monkeypatch.setattr(tracing, "_tracer", tracing.Tracer(str(tmp_path / "traces.jsonl")))
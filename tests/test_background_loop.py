@@ -0,0 +1,123 @@
+import asyncio
+import contextvars
+import threading
+import pytest
+from background_loop import BackgroundLoop
+
+request_id = contextvars.ContextVar("request_id", default=None)
+
+
+@pytest.fixture
+def background():
+    background = BackgroundLoop(name="test-background-loop")
+    yield background
+    background.stop()
+
+
+class TestBackgroundLoop:
+
+    def test_resources_survive_between_runs(self, background):
+        async def current_loop():
+            return asyncio.get_running_loop()
+
+        first = background.run(current_loop())
+        second = background.run(current_loop())
+        assert first is second
+        assert background._thread.name == "test-background-loop"
+
+    def test_submit_from_many_threads(self, background):
+        async def double(x):
+            await asyncio.sleep(0.01)
+            return x * 2
+
+        results = [None] * 8
+
+        def worker(i):
+            results[i] = background.submit(double(i)).result(5)
+
+        threads = [threading.Thread(target=worker, args=(i,)) for i in range(8)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        assert results == [i * 2 for i in range(8)]
+
+    def test_callers_context_is_carried(self, background):
+        async def read():
+            return request_id.get()
+
+        request_id.set("abc")
+        assert background.run(read()) == "abc"
+
+    def test_run_from_own_loop_raises(self, background):
+        async def nested():
+            background.run(asyncio.sleep(0))
+
+        with pytest.raises(RuntimeError):
+            background.run(nested())
+
+    @pytest.mark.asyncio
+    async def test_run_async_from_another_loop(self, background):
+        async def where():
+            return threading.current_thread().name
+
+        assert await background.run_async(where()) == "test-background-loop"
+
+
+class TestBackgroundStream:
+
+    def test_stream_keeps_generator_context_between_items(self, background):
+        async def events():
+            request_id.set("turn-1")
+            for i in range(3):
+                await asyncio.sleep(0)
+                yield (i, request_id.get())
+
+        assert list(background.stream(events())) == [(0, "turn-1"), (1, "turn-1"), (2, "turn-1")]
+
+    def test_stream_reraises_errors(self, background):
+        async def events():
+            yield 1
+            raise ValueError("boom")
+
+        with pytest.raises(ValueError):
+            list(background.stream(events()))
+
+    def test_leaving_stream_early_cancels_generator(self, background):
+        closed = threading.Event()
+
+        async def events():
+            try:
+                while True:
+                    yield 1
+                    await asyncio.sleep(0.01)
+            finally:
+                closed.set()
+
+        for _ in background.stream(events()):
+            break
+        assert closed.wait(2)
+
+    def test_idle_callback_error_cancels_generator(self, background):
+        cancelled = threading.Event()
+
+        class StopRequested(Exception):
+            pass
+
+        async def events():
+            yield "partial"
+            try:
+                await asyncio.sleep(60)
+            except asyncio.CancelledError:
+                cancelled.set()
+                raise
+
+        def idle():
+            raise StopRequested()
+
+        received = []
+        with pytest.raises(StopRequested):
+            for item in background.stream(events(), idle=idle, idle_interval=0.01):
+                received.append(item)
+        assert received == ["partial"]
+        assert cancelled.wait(2)
@@ -0,0 +1,93 @@
+import json
+import os
+import threading
+import pytest
+from config_store import ConfigStore
+
+
+def write_json(path, data):
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(data, f)
+
+
+class TestConfigStore:
+
+    def test_parses_once_until_file_changes(self, tmp_path):
+        path = tmp_path / "config.json"
+        write_json(path, {"UI_Settings": {"STREAM_MODE": True}})
+        store = ConfigStore(str(path))
+
+        for _ in range(5):
+            assert store.section("UI_Settings")["STREAM_MODE"] is True
+        assert store.stats["loads"] == 1
+
+        write_json(path, {"UI_Settings": {"STREAM_MODE": False, "CHAT_CONTAINER_HEIGHT": 700}})
+        os.utime(path, ns=(0, 1))  # 保證 mtime 改變
+        assert store.section("UI_Settings")["STREAM_MODE"] is False
+        assert store.stats["loads"] == 2
+
+    def test_missing_file_reads_as_empty(self, tmp_path):
+        store = ConfigStore(str(tmp_path / "missing.json"))
+        assert not store.exists
+        assert store.get() == {}
+
+    def test_nested_batches_write_once_atomically(self, tmp_path):
+        path = tmp_path / "config.json"
+        write_json(path, {"model_tool_support": {}})
+        store = ConfigStore(str(path))
+
+        with store.batch() as config:
+            config["model_tool_support"]["a"] = True
+            with store.batch() as inner:
+                inner["model_tool_support"]["b"] = False
+                assert store.get()["model_tool_support"] == {"a": True, "b": False}
+
+        assert store.stats["writes"] == 1
+        with open(path, encoding="utf-8") as f:
+            assert json.load(f) == {"model_tool_support": {"a": True, "b": False}}
+        assert [p.name for p in tmp_path.iterdir()] == ["config.json"]
+        assert store.stats["loads"] == 1  # 寫入後不需要重新解析
+
+    def test_unchanged_batch_does_not_write(self, tmp_path):
+        path = tmp_path / "config.json"
+        write_json(path, {"x": 1})
+        store = ConfigStore(str(path))
+
+        with store.batch() as config:
+            config["x"] = 1
+
+        assert store.stats["writes"] == 0
+
+    def test_failed_batch_is_discarded(self, tmp_path):
+        path = tmp_path / "config.json"
+        write_json(path, {"x": 1})
+        store = ConfigStore(str(path))
+
+        with pytest.raises(RuntimeError):
+            with store.batch() as config:
+                config["x"] = 2
+                raise RuntimeError("boom")
+
+        assert store.stats["writes"] == 0
+        assert store.get() == {"x": 1}
+        write_json(path, {"x": 3})
+        os.utime(path, ns=(0, 1))  # 保證 mtime 改變
+        assert store.get() == {"x": 3}
+
+    def test_concurrent_batches_do_not_lose_updates(self, tmp_path):
+        path = tmp_path / "config.json"
+        write_json(path, {"model_tool_support": {}})
+        store = ConfigStore(str(path))
+
+        def worker(i):
+            with store.batch() as config:
+                config["model_tool_support"][f"model{i}"] = True
+
+        threads = [threading.Thread(target=worker, args=(i,)) for i in range(20)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        with open(path, encoding="utf-8") as f:
+            assert len(json.load(f)["model_tool_support"]) == 20
@@ -0,0 +1,112 @@
+import asyncio
+import time
+import pytest
+from unittest.mock import MagicMock
+from deadline import TimeoutPolicy, deadline, remaining, timeout_for
+from mcp import types
+from mcp.shared.message import SessionMessage
+from mcpclient_manager import MCPClientManager, _RequestTrackingStream
+from ollama_toolmanager import OllamaToolManager
+
+
+class NullStream:
+    async def send(self, message):
+        pass
+
+
+class HangingSession:
+    """ClientSession stand-in whose tools never answer"""
+
+    def __init__(self, write, error=None):
+        self.write = write
+        self.error = error
+        self.next_id = 7
+        self.notifications = []
+
+    async def call_tool(self, name, arguments=None):
+        request = types.JSONRPCRequest(jsonrpc="2.0", id=self.next_id, method="tools/call")
+        self.next_id += 1
+        await self.write.send(SessionMessage(types.JSONRPCMessage(request)))
+        if self.error is not None:
+            raise self.error
+        await asyncio.sleep(60)
+
+    async def send_notification(self, notification):
+        self.notifications.append(notification.model_dump(by_alias=True, mode="json", exclude_none=True))
+
+
+def hanging_client(error=None):
+    client = MCPClientManager("excel")
+    client._requests = _RequestTrackingStream(NullStream())
+    client.session = HangingSession(client._requests, error)
+    return client
+
+
+class TestDeadline:
+
+    def test_nested_deadline_only_shortens(self):
+        assert remaining() is None
+        with deadline(10):
+            with deadline(60):
+                assert remaining() <= 10
+            with deadline(0.5):
+                assert remaining() <= 0.5
+            assert timeout_for(30) <= 10
+            assert timeout_for(1) == 1
+        assert remaining() is None and timeout_for(None) is None
+
+    def test_policy_prefers_tool_then_server(self):
+        policy = TimeoutPolicy.from_settings({
+            "TOOL_TIMEOUT": 60, "SERVER_TOOL_TIMEOUT": {"excel": 30}, "PER_TOOL_TIMEOUT": {"directory_tree": 120},
+        })
+        assert policy.for_tool("filesystem", "directory_tree") == 120
+        assert policy.for_tool("excel", "excel_read_sheet") == 30
+        assert policy.for_tool("filesystem", "read_file") == 60
+
+
+class TestCancellation:
+
+    @pytest.mark.asyncio
+    async def test_timeout_sends_cancel_notification(self):
+        client = hanging_client()
+        with deadline(0.05):
+            with pytest.raises(TimeoutError, match="excel_read_sheet on excel timed out"):
+                await client.call_tool("excel_read_sheet", {})
+        assert client.session.notifications[0]["method"] == "notifications/cancelled"
+        assert client.session.notifications[0]["params"]["requestId"] == 7
+
+    @pytest.mark.asyncio
+    async def test_transport_timeout_without_limit(self):
+        client = hanging_client(error=TimeoutError())
+        with pytest.raises(TimeoutError, match="excel_read_sheet on excel timed out$"):
+            await client.call_tool("excel_read_sheet", {})
+        assert client.session.notifications[0]["params"] == {"requestId": 7, "reason": "timed out"}
+        assert len(client._requests.sent) == 0
+
+    @pytest.mark.asyncio
+    async def test_cancelled_call_sends_cancel_notification(self):
+        client = hanging_client()
+        task = asyncio.create_task(client.call_tool("excel_read_sheet", {}))
+        await asyncio.sleep(0.01)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        assert client.session.notifications[0]["params"]["reason"] == "cancelled by client"
+
+    @pytest.mark.asyncio
+    async def test_tool_timeout_returns_error_to_model(self):
+        client = hanging_client()
+        manager = OllamaToolManager(timeouts=TimeoutPolicy(tool=60, servers={"excel": 0.05}))
+        manager.register_tool("excel_read_sheet", client.call_tool, "Read a sheet",
+                              {"properties": {}}, server="excel")
+        function = MagicMock()
+        function.name = "excel_read_sheet"
+        function.arguments = {}
+
+        started = time.perf_counter()
+        result = await manager.execute_tool({"function": function})
+
+        assert time.perf_counter() - started < 1
+        assert result["status"] == "error"
+        assert "timed out" in result["content"][0]["text"]
+        assert client.session.notifications[0]["method"] == "notifications/cancelled"
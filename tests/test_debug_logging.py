@@ -0,0 +1,70 @@
+import threading
+import pytest
+from mcp.types import CallToolResult, TextContent
+import debug_logging
+from debug_logging import Payload
+
+
+class TestPayload:
+
+    def test_long_payload_is_truncated(self, monkeypatch):
+        monkeypatch.setattr(debug_logging, "_settings", lambda: {"MAX_PAYLOAD_CHARS": 50})
+        text = str(Payload("x" * 1000))
+        assert text.startswith("x" * 50)
+        assert "950 more chars" in text
+
+    def test_big_list_is_not_fully_rendered(self, monkeypatch):
+        monkeypatch.setattr(debug_logging, "_settings", lambda: {"MAX_PAYLOAD_CHARS": 100})
+        rendered = []
+
+        class Item:
+            def __repr__(self):
+                rendered.append(self)
+                return "item" * 10
+
+        text = str(Payload([Item() for _ in range(1000)]))
+        assert len(rendered) < 10
+        assert "more" in text
+
+    def test_payload_logging_can_be_disabled(self, monkeypatch):
+        monkeypatch.setattr(debug_logging, "_settings", lambda: {"LOG_PAYLOADS": False})
+        assert str(Payload({"messages": ["secret"]})) == "<dict omitted>"
+
+    def test_payload_is_not_rendered_when_level_disabled(self, monkeypatch):
+        logger = debug_logging.get_logger("test_debug_logging")
+        logger.setLevel("INFO")
+        calls = []
+        monkeypatch.setattr(debug_logging, "_render", lambda obj, limit: calls.append(obj) or "")
+        logger.debug("payload: %s", Payload(["x"]))
+        assert calls == []
+
+    def test_big_model_is_not_fully_serialized(self, monkeypatch):
+        monkeypatch.setattr(debug_logging, "_settings", lambda: {"MAX_PAYLOAD_CHARS": 200})
+        result = CallToolResult(content=[TextContent(type="text", text="x" * 5_000_000)] * 50)
+        monkeypatch.setattr(CallToolResult, "model_dump_json", lambda *a, **k: pytest.fail("serialized in full"))
+
+        text = str(Payload(result))
+
+        assert text.startswith("CallToolResult(")
+        assert len(text) < 400
+        assert "more chars" in text
+
+    def test_dict_payload_stays_json_like(self, monkeypatch):
+        monkeypatch.setattr(debug_logging, "_settings", lambda: {})
+        assert str(Payload({"role": "user", "n": 1, "ok": True, "x": None})) == '{"role": "user", "n": 1, "ok": true, "x": null}'
+
+
+class TestDeferredFormatting:
+
+    def test_payload_is_rendered_on_the_writer_thread(self, monkeypatch):
+        threads = []
+        monkeypatch.setattr(debug_logging, "_render",
+                            lambda obj, limit: threads.append(threading.current_thread()) or "x")
+        logger = debug_logging.get_logger("test_debug_logging_deferred")
+        logger.setLevel("DEBUG")
+
+        logger.debug("payload: %s", Payload(["x"]))
+
+        debug_logging._listener.stop()
+        debug_logging._listener.start()
+        assert threads and threading.current_thread() not in threads
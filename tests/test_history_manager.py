@@ -0,0 +1,94 @@
+from history_manager import ConversationHistory, estimate_tokens
+
+
+def make_turn(i, tool_output_chars=0):
+    turn = [{'role': 'user', 'content': f"question {i}"}]
+    if tool_output_chars:
+        turn.append({
+            'role': 'assistant',
+            'content': '',
+            'tool_calls': [{'function': {'name': 'read_file', 'arguments': {'path': f"{i}.txt"}}}]
+        })
+        turn.append({'role': 'tool', 'content': "x" * tool_output_chars, 'tool_name': 'read_file'})
+    turn.append({'role': 'assistant', 'content': f"answer {i}"})
+    return turn
+
+
+class TestConversationHistory:
+
+    def test_small_history_is_sent_verbatim_with_system_prompt(self):
+        history = ConversationHistory("be helpful", token_budget=1000)
+        messages = make_turn(0) + make_turn(1)
+
+        request, stats = history.build(messages)
+
+        assert request[0] == {'role': 'system', 'content': 'be helpful'}
+        assert request[1:] == messages
+        assert stats["dropped_tokens"] == 0
+        assert stats["elided_messages"] == 0
+
+    def test_old_tool_outputs_are_elided_first(self):
+        history = ConversationHistory(None, token_budget=600, keep_recent_turns=1,
+                                      elided_tool_output_chars=20)
+        messages = make_turn(0, tool_output_chars=4000) + make_turn(1, tool_output_chars=400)
+
+        request, stats = history.build(messages)
+
+        old_tool, recent_tool = [m for m in request if m['role'] == 'tool']
+        assert "elided" in old_tool['content']
+        assert recent_tool['content'] == "x" * 400
+        assert stats["elided_messages"] == 1
+        assert stats["dropped_turns"] == 0
+        assert messages[2]['content'] == "x" * 4000  # transcript untouched
+
+    def test_old_turns_dropped_before_recent_tool_output_is_touched(self):
+        history = ConversationHistory(None, token_budget=650, keep_recent_turns=2,
+                                      elided_tool_output_chars=20)
+        messages = []
+        for i in range(6):
+            messages += make_turn(i, tool_output_chars=1000)
+
+        request, stats = history.build(messages)
+
+        # 先丟掉較舊的 turn，最近兩個 turn 的工具輸出保持原樣
+        assert "omitted" in request[0]['content']
+        assert stats["dropped_turns"] >= 1
+        assert [m['content'] for m in request if m['role'] == 'tool'][-2:] == ["x" * 1000] * 2
+        assert stats["kept_tokens"] <= 650
+
+    def test_eliding_recent_tool_output_is_opt_in(self):
+        messages = []
+        for i in range(4):
+            messages += make_turn(i, tool_output_chars=1000)
+        options = dict(token_budget=400, keep_recent_turns=2, elided_tool_output_chars=20)
+
+        request, _ = ConversationHistory(None, **options).build(messages)
+        assert [m['content'] for m in request if m['role'] == 'tool'] == ["x" * 1000]
+
+        request, _ = ConversationHistory(None, elide_recent_tool_output=True, **options).build(messages)
+        tool_outputs = [m['content'] for m in request if m['role'] == 'tool']
+        assert len(tool_outputs) == 2
+        assert "elided" in tool_outputs[0] and tool_outputs[1] == "x" * 1000
+
+    def test_oldest_turns_dropped_but_current_turn_kept(self):
+        history = ConversationHistory("sys", token_budget=60, keep_recent_turns=1)
+        messages = []
+        for i in range(10):
+            messages += make_turn(i)
+
+        request, stats = history.build(messages)
+
+        assert request[0]['content'] == "sys"
+        assert "omitted" in request[1]['content']
+        assert request[-2:] == messages[-2:]
+        assert stats["dropped_turns"] > 0
+        assert stats["kept_tokens"] <= 60
+        assert stats["kept_tokens"] + stats["dropped_tokens"] == sum(
+            estimate_tokens(m) for m in [request[0]] + messages
+        )
+
+    def test_budget_per_model_from_settings(self):
+        settings = {"DEFAULT_TOKEN_BUDGET": 100, "MODEL_TOKEN_BUDGETS": {"big:latest": 9000}}
+
+        assert ConversationHistory.from_settings("big:latest", None, settings).token_budget == 9000
+        assert ConversationHistory.from_settings("small:latest", None, settings).token_budget == 100
@@ -0,0 +1,62 @@
+import httpx
+import pytest
+from http_transport import HTTPClientPool
+from mcpclient_manager import MCPClientManager
+
+
+class RecordingTransport(httpx.MockTransport):
+    """MockTransport that remembers whether it was closed"""
+
+    def __init__(self):
+        super().__init__(lambda request: httpx.Response(200, json={"path": request.url.path}))
+        self.closed = False
+
+    async def aclose(self):
+        self.closed = True
+
+
+def pool_with_mock(server="custom_server"):
+    pool = HTTPClientPool(max_connections=4, max_keepalive_connections=2)
+    transport = RecordingTransport()
+    pool._transports[server] = transport
+    pool.stats[server] = {"clients": 0, "requests": 0}
+    return pool, transport
+
+
+class TestHTTPClientPool:
+
+    @pytest.mark.asyncio
+    async def test_closing_a_client_keeps_the_shared_transport(self):
+        pool, transport = pool_with_mock()
+        factory = pool.factory("custom_server")
+
+        # sse_client / streamablehttp_client 每個 session 都用 async with 開關 client
+        async with factory(headers={"X-Test": "1"}) as client:
+            assert (await client.get("http://localhost/mcp")).json() == {"path": "/mcp"}
+        assert not transport.closed
+        async with factory() as client:
+            await client.post("http://localhost/mcp")
+
+        assert pool.stats["custom_server"] == {"clients": 2, "requests": 2}
+        await pool.aclose("custom_server")
+        assert transport.closed
+        assert "custom_server" not in pool._transports
+
+    def test_limits_and_defaults(self):
+        pool = HTTPClientPool.from_settings({"MAX_CONNECTIONS": 3, "MAX_KEEPALIVE_CONNECTIONS": 1,
+                                             "KEEPALIVE_EXPIRY": 5, "TIMEOUT": 12})
+        assert pool.limits.max_connections == 3
+        assert pool.limits.max_keepalive_connections == 1
+        assert pool.limits.keepalive_expiry == 5
+        client = pool.factory("custom_server")()
+        assert client.timeout.read == 12
+        assert client.follow_redirects
+
+
+class TestSessionId:
+
+    def test_session_id_comes_from_the_http_client(self):
+        client = MCPClientManager("custom_server")
+        assert client.session_id is None
+        client._get_session_id = lambda: "abc123"
+        assert client.session_id == "abc123"
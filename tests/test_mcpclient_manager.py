@@ -0,0 +1,55 @@
+import asyncio
+import time
+import pytest
+from mcp.types import Tool
+import ollama_agent
+import tool_catalog
+from mcpclient_manager import initialize_agent_and_tools
+
+PHASE_SECONDS = 0.2
+
+
+class FakeCatalog:
+    async def list_tools(self, server):
+        await asyncio.sleep(PHASE_SECONDS)
+        return [Tool(name=f"{server}_tool", description="", inputSchema={"type": "object", "properties": {}})]
+
+    def add_refresh_listener(self, listener):
+        self.listener = listener
+
+
+class FakeOllamaClient:
+    async def list(self):
+        await asyncio.sleep(PHASE_SECONDS)
+        return {"models": []}
+
+
+class TestInitializeAgentAndTools:
+
+    def test_phases_run_concurrently_and_report_timings(self, monkeypatch):
+        async def slow_preload(self):
+            await asyncio.sleep(PHASE_SECONDS)
+
+        monkeypatch.setattr(tool_catalog, "get_tool_catalog", lambda: FakeCatalog())
+        monkeypatch.setattr(ollama_agent.OllamaAgent, "preload", slow_preload)
+        monkeypatch.setattr(ollama_agent.OllamaAgent, "_get_client", lambda self: FakeOllamaClient())
+        timings = {}
+
+        started = time.perf_counter()
+        agent = initialize_agent_and_tools("m:latest", ["a", "b"], None, timings=timings)
+        elapsed = time.perf_counter() - started
+
+        assert {name: tool.server for name, tool in agent.tool_manager.tools.items()} == {"a_tool": "a", "b_tool": "b"}
+        assert set(timings) >= {"models", "mcp:a", "mcp:b", "total"}
+        assert all(timings[name] >= PHASE_SECONDS * 1000 * 0.9 for name in ("models", "mcp:a", "mcp:b"))
+        assert elapsed < PHASE_SECONDS * 2.5
+
+    def test_mcp_failure_is_raised(self, monkeypatch):
+        class BrokenCatalog(FakeCatalog):
+            async def list_tools(self, server):
+                raise ConnectionError("server down")
+
+        monkeypatch.setattr(tool_catalog, "get_tool_catalog", lambda: BrokenCatalog())
+        monkeypatch.setattr(ollama_agent.OllamaAgent, "_get_client", lambda self: FakeOllamaClient())
+        with pytest.raises(ConnectionError):
+            initialize_agent_and_tools("m:latest", "a", None)
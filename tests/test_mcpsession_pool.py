@@ -0,0 +1,211 @@
+import asyncio
+import pytest
+import anyio
+import mcpsession_pool
+from mcpsession_pool import MCPSessionPool
+
+
+class FakeSession:
+    def __init__(self, owner):
+        self.owner = owner
+
+    async def send_ping(self):
+        if self.owner.ping_fails:
+            raise anyio.BrokenResourceError()
+
+
+class FakeClient:
+    """Stand-in for MCPClientManager that records how often it connects"""
+    instances = []
+    # 模擬 server 沒有啟動
+    refuse = False
+
+    def __init__(self, server_type, config_path="config.json", on_tools_changed=None):
+        self.server_type = server_type
+        self.on_tools_changed = on_tools_changed
+        self.server_version = "1.0"
+        self.calls = 0
+        self.fail_next_call = False
+        self.ping_fails = False
+        self.session = FakeSession(self)
+        FakeClient.instances.append(self)
+
+    async def __aenter__(self):
+        await asyncio.sleep(0)
+        if FakeClient.refuse:
+            raise ConnectionRefusedError("connection refused")
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        return None
+
+    async def call_tool(self, tool_name, arguments, timeout=None):
+        self.calls += 1
+        if self.fail_next_call:
+            self.fail_next_call = False
+            raise BrokenPipeError("pipe closed")
+        await asyncio.sleep(0.01)
+        return {"tool": tool_name, "arguments": arguments, "client": id(self)}
+
+    async def get_available_tools(self):
+        return ["read_file", "list_directory"]
+
+
+@pytest.fixture
+def pool(monkeypatch):
+    FakeClient.instances = []
+    FakeClient.refuse = False
+    monkeypatch.setattr(mcpsession_pool, "MCPClientManager", FakeClient)
+    pool = MCPSessionPool(pool_size=2, health_check_interval=30)
+    yield pool
+    pool.shutdown()
+
+
+class TestMCPSessionPool:
+
+    @pytest.mark.asyncio
+    async def test_session_is_reused_between_calls(self, pool):
+        for _ in range(3):
+            result = await pool.call_tool("filesystem", "read_file", {"path": "a.txt"})
+            assert result["tool"] == "read_file"
+        assert len(FakeClient.instances) == 1
+        assert pool.stats["connects"] == 1
+        assert pool.stats["reuses"] == 2
+
+    @pytest.mark.asyncio
+    async def test_list_tools_shares_pool(self, pool):
+        tools = await pool.list_tools("filesystem")
+        await pool.call_tool("filesystem", "read_file", {})
+        assert tools == ["read_file", "list_directory"]
+        assert len(FakeClient.instances) == 1
+
+    @pytest.mark.asyncio
+    async def test_pool_size_bounds_connections(self, pool):
+        results = await asyncio.gather(*[
+            pool.call_tool("filesystem", "read_file", {"i": i}) for i in range(6)
+        ])
+        assert [r["arguments"]["i"] for r in results] == list(range(6))
+        assert len(FakeClient.instances) == 2
+
+    @pytest.mark.asyncio
+    async def test_servers_are_pooled_separately(self, pool):
+        await pool.call_tool("filesystem", "read_file", {})
+        await pool.call_tool("excel", "excel_describe_sheets", {})
+        assert sorted(c.server_type for c in FakeClient.instances) == ["excel", "filesystem"]
+
+    @pytest.mark.asyncio
+    async def test_reconnects_on_broken_pipe(self, pool):
+        await pool.call_tool("filesystem", "read_file", {})
+        FakeClient.instances[0].fail_next_call = True
+        result = await pool.call_tool("filesystem", "read_file", {})
+        assert result["client"] == id(FakeClient.instances[1])
+        assert pool.stats["reconnects"] == 1
+
+    @pytest.mark.asyncio
+    async def test_mutating_call_is_not_resent_on_broken_pipe(self, pool):
+        await pool.call_tool("filesystem", "read_file", {})
+        FakeClient.instances[0].fail_next_call = True
+        with pytest.raises(BrokenPipeError):
+            await pool.call_tool("filesystem", "write_file", {"path": "a.txt", "content": "x"})
+        assert sum(c.calls for c in FakeClient.instances) == 2
+        assert pool.stats["reconnects"] == 0
+
+        # 壞掉的 session 已丟棄，下一次呼叫重新連線
+        result = await pool.call_tool("filesystem", "write_file", {"path": "a.txt", "content": "x"})
+        assert result["client"] == id(FakeClient.instances[1])
+
+    @pytest.mark.asyncio
+    async def test_failed_health_check_replaces_session(self, pool):
+        pool.health_check_interval = 0
+        await pool.call_tool("filesystem", "read_file", {})
+        FakeClient.instances[0].ping_fails = True
+        result = await pool.call_tool("filesystem", "read_file", {})
+        assert result["client"] == id(FakeClient.instances[1])
+        assert pool.stats["health_check_failures"] == 1
+
+    @pytest.mark.asyncio
+    async def test_prewarm_hands_out_spare_and_replaces_it(self, pool):
+        await asyncio.wrap_future(pool.start_prewarm(["filesystem"]))
+        assert len(FakeClient.instances) == 1
+        assert pool.start_prewarm(["filesystem"]) is None
+
+        await pool.call_tool("filesystem", "read_file", {})
+        assert pool.stats["spares_used"] == 1
+        assert pool.latency_summary("filesystem")["acquire_last_ms"] is not None
+        # 背景補上的 spare
+        for _ in range(50):
+            if len(FakeClient.instances) == 2:
+                break
+            await asyncio.sleep(0.01)
+        assert len(FakeClient.instances) == 2
+
+        # 重用已借出過的連線不算 spare，也不再補新的
+        for _ in range(3):
+            await pool.call_tool("filesystem", "read_file", {})
+        assert pool.stats["spares_used"] == 1
+        assert len(FakeClient.instances) == 2
+
+
+class TestSessionPoolTracing:
+
+    @pytest.mark.asyncio
+    async def test_pool_spans_join_the_callers_trace(self, pool, tmp_path):
+        from tracing import Tracer, load_traces
+        tracer = Tracer(str(tmp_path / "traces.jsonl"))
+        with tracer.trace("turn"):
+            await pool.call_tool("filesystem", "read_file", {})
+
+        [trace] = load_traces(tracer.path)
+        names = [s["name"] for s in trace["spans"]]
+        assert names == ["turn", "mcp.acquire", "mcp.connect", "mcp.rpc"]
+
+
+class TestCircuitBreaker:
+
+    @pytest.mark.asyncio
+    async def test_down_server_fails_fast_then_recovers(self, pool):
+        from server_health import CircuitOpenError
+
+        pool.health.failure_threshold = 3
+        pool.health.backoff_base = 0.05
+        FakeClient.refuse = True
+        for expected in (1, 2):
+            with pytest.raises(ConnectionRefusedError):
+                await pool.call_tool("excel", "excel_read_sheet", {})
+            # 一次呼叫（含重試的連線）只算一次失敗
+            status = pool.server_status("excel")
+            assert status["consecutive_failures"] == expected
+            assert status["state"] != "down"
+        with pytest.raises(ConnectionRefusedError):
+            await pool.call_tool("excel", "excel_read_sheet", {})
+        assert pool.server_status("excel")["state"] == "down"
+        assert pool.server_status("excel")["consecutive_failures"] == 3
+
+        attempts = len(FakeClient.instances)
+        with pytest.raises(CircuitOpenError):
+            await pool.call_tool("excel", "excel_read_sheet", {})
+        # 斷路器開啟時不再嘗試連線
+        assert len(FakeClient.instances) == attempts
+
+        FakeClient.refuse = False
+        await asyncio.sleep(0.1)
+        await pool.call_tool("excel", "excel_read_sheet", {})
+        assert pool.server_status("excel")["state"] == "healthy"
+
+    @pytest.mark.asyncio
+    async def test_background_probe_reconnects(self, pool):
+        pool.health.failure_threshold = 3
+        pool.health.backoff_base = 0.01
+        FakeClient.refuse = True
+        for _ in range(3):
+            with pytest.raises(ConnectionRefusedError):
+                await pool.call_tool("excel", "excel_read_sheet", {})
+        assert pool.server_status("excel")["state"] == "down"
+
+        FakeClient.refuse = False
+        await asyncio.sleep(0.05)
+        await pool._run(pool._probe("excel") if pool.health.try_probe("excel") else asyncio.sleep(0))
+
+        status = pool.server_status("excel")
+        assert status["state"] == "healthy"
+        assert status["idle"] == 1
@@ -0,0 +1,98 @@
+import asyncio
+import json
+import pytest
+from ollama._types import ShowResponse
+import model_setting
+from model_capabilities import extract_capabilities, probe_models
+
+
+class FakeShowClient:
+    def __init__(self, responses):
+        self.responses = responses
+        self.running = 0
+        self.peak = 0
+
+    async def show(self, model):
+        self.running += 1
+        self.peak = max(self.peak, self.running)
+        await asyncio.sleep(0.01)
+        self.running -= 1
+        response = self.responses[model]
+        if isinstance(response, Exception):
+            raise response
+        return response
+
+
+def show(capabilities=None, template=None, family="llama", context_length=8192):
+    return ShowResponse(
+        capabilities=capabilities,
+        template=template,
+        details={"family": family},
+        model_info={"general.architecture": family, f"{family}.context_length": context_length},
+    )
+
+
+class TestExtractCapabilities:
+
+    def test_capabilities_field(self):
+        caps = extract_capabilities(show(capabilities=["completion", "tools"]))
+        assert caps["tools"] is True
+        assert caps["context_length"] == 8192
+        assert caps["family"] == "llama"
+
+    def test_template_fallback_for_old_servers(self):
+        assert extract_capabilities(show(template="{{ if .Tools }}...")).get("tools") is True
+        assert extract_capabilities(show(template="{{ .Prompt }}")).get("tools") is False
+        assert extract_capabilities(show()).get("tools") is None
+
+
+class TestProbeModels:
+
+    @pytest.mark.asyncio
+    async def test_probes_concurrently_and_tolerates_failures(self):
+        client = FakeShowClient({
+            "a": show(capabilities=["tools"]),
+            "b": show(capabilities=["completion"]),
+            "c": ConnectionError("down"),
+        })
+        results = await probe_models(["a", "b", "c"], client=client, concurrency=3)
+
+        assert results["a"]["tools"] is True
+        assert results["b"]["tools"] is False
+        assert results["c"] is None
+        assert client.peak == 3
+
+
+class TestSyncModelToolSupport:
+
+    @pytest.fixture
+    def config_path(self, tmp_path, monkeypatch):
+        path = tmp_path / "config.json"
+        path.write_text(json.dumps({"model_tool_support": {"old:latest": False}}))
+        monkeypatch.setattr(model_setting, "CONFIG_PATH", str(path))
+        return path
+
+    def test_probe_results_are_cached_by_digest(self, config_path, monkeypatch):
+        probed = []
+
+        def fake_probe(models):
+            probed.append(list(models))
+            return {m: {"tools": m != "phi:latest", "context_length": 4096, "family": "x", "capabilities": []}
+                    for m in models}
+
+        monkeypatch.setattr(model_setting, "_probe", fake_probe)
+        models = ["qwen:latest", "phi:latest"]
+
+        support = model_setting.sync_model_tool_support(models, {"qwen:latest": "d1", "phi:latest": "d2"})
+        model_setting.sync_model_tool_support(models, {"qwen:latest": "d1", "phi:latest": "d2"})
+        model_setting.sync_model_tool_support(models, {"qwen:latest": "d3", "phi:latest": "d2"})
+
+        assert support == {"old:latest": False, "qwen:latest": True, "phi:latest": False}
+        assert probed == [models, ["qwen:latest"]]
+        assert model_setting.get_model_capabilities("qwen:latest")["digest"] == "d3"
+
+    def test_failed_probe_keeps_default(self, config_path, monkeypatch):
+        monkeypatch.setattr(model_setting, "_probe", lambda models: {m: None for m in models})
+        support = model_setting.sync_model_tool_support(["new:latest"], {"new:latest": "d"})
+        assert support["new:latest"] is True
+        assert model_setting.get_model_capabilities("new:latest") == {}
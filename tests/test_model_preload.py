@@ -0,0 +1,62 @@
+import json
+from datetime import datetime, timedelta, timezone
+import pytest
+from ollama._types import ProcessResponse
+from model_preload import keep_alive_for, model_load_state, preload_model
+
+
+class FakeClient:
+    def __init__(self, running=()):
+        self.requests = []
+        self.running = list(running)
+
+    async def chat(self, **kwargs):
+        self.requests.append(kwargs)
+        return None
+
+    async def ps(self):
+        return ProcessResponse(models=self.running)
+
+
+@pytest.fixture
+def config_path(tmp_path):
+    path = tmp_path / "config.json"
+    path.write_text(json.dumps({"Model_Preload": {
+        "DEFAULT_KEEP_ALIVE": "10m", "MODEL_KEEP_ALIVE": {"big:latest": -1}
+    }}))
+    return str(path)
+
+
+class TestModelPreload:
+
+    def test_keep_alive_per_model(self, config_path):
+        assert keep_alive_for("big:latest", config_path) == -1
+        assert keep_alive_for("small:latest", config_path) == "10m"
+
+    @pytest.mark.asyncio
+    async def test_preload_sends_empty_chat_with_keep_alive(self):
+        client = FakeClient()
+        elapsed = await preload_model("small:latest", client, keep_alive="5m")
+        assert elapsed is not None
+        assert client.requests == [{"model": "small:latest", "messages": [], "keep_alive": "5m"}]
+
+    @pytest.mark.asyncio
+    async def test_preload_failure_is_not_fatal(self):
+        class Down(FakeClient):
+            async def chat(self, **kwargs):
+                raise ConnectionError("ollama is not running")
+
+        assert await preload_model("small:latest", Down(), keep_alive="5m") is None
+
+    @pytest.mark.asyncio
+    async def test_load_state_from_ps(self):
+        expires = datetime.now(timezone.utc) + timedelta(minutes=5)
+        client = FakeClient(running=[{"model": "small:latest", "name": "small:latest",
+                                      "expires_at": expires, "size_vram": 123}])
+
+        loaded = await model_load_state("small:latest", client)
+        missing = await model_load_state("other:latest", client)
+
+        assert loaded["loaded"] is True
+        assert 250 < loaded["expires_in_s"] <= 300
+        assert missing == {"loaded": False, "expires_in_s": None, "size_vram": None}
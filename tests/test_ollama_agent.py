@@ -0,0 +1,176 @@
+import asyncio
+import pytest
+from unittest.mock import patch
+from ollama._types import ChatResponse, Message
+from ollama_agent import OllamaAgent, TextDelta, ToolCallStart, ToolResult, Done
+from ollama_toolmanager import OllamaToolManager
+
+
+class FakeAsyncClient:
+    """Replays one scripted list of streamed messages per chat() call"""
+
+    def __init__(self, scripts):
+        self.scripts = list(scripts)
+        self.requests = []
+
+    async def chat(self, **kwargs):
+        self.requests.append({**kwargs, "messages": list(kwargs.get("messages", []))})
+        parts = self.scripts.pop(0)
+
+        async def stream():
+            for part in parts:
+                await asyncio.sleep(0)
+                yield part
+        return stream()
+
+
+def text_part(text, **extra):
+    return ChatResponse(message=Message(role='assistant', content=text), **extra)
+
+
+def tool_part(*calls):
+    return ChatResponse(message=Message(
+        role='assistant',
+        content='',
+        tool_calls=[{'function': {'name': name, 'arguments': args}} for name, args in calls]
+    ))
+
+
+async def echo_tool(name, args):
+    return {'tool': name, 'content': [{'text': f"{name}:{args['path']}"}], 'status': 'success'}
+
+
+@pytest.fixture(autouse=True)
+def tool_support():
+    with patch("model_setting.get_model_tool_support", return_value=True):
+        yield
+
+
+def make_agent(scripts):
+    manager = OllamaToolManager()
+    manager.register_tool(
+        name="read_file",
+        function=echo_tool,
+        description="Read a file",
+        inputSchema={"properties": {"path": {"type": "string"}}, "required": ["path"]}
+    )
+    agent = OllamaAgent("test-model", manager, "You are a test")
+    client = FakeAsyncClient(scripts)
+    agent._get_client = lambda: client
+    return agent, client
+
+
+async def collect(agen):
+    return [event async for event in agen]
+
+
+class TestOllamaAgentEvents:
+
+    @pytest.mark.asyncio
+    async def test_stream_yields_text_deltas_then_done(self):
+        agent, _ = make_agent([[text_part("Hel"), text_part("lo")]])
+
+        events = await collect(agent.get_response("hi", stream=True))
+
+        assert events[:2] == [TextDelta("Hel"), TextDelta("lo")]
+        assert isinstance(events[-1], Done)
+        assert events[-1].content == "Hello"
+
+    @pytest.mark.asyncio
+    async def test_non_stream_yields_single_delta(self):
+        agent, _ = make_agent([[text_part("Hel"), text_part("lo")]])
+
+        events = await collect(agent.get_response("hi", stream=False))
+
+        assert [e for e in events if isinstance(e, TextDelta)] == [TextDelta("Hello")]
+
+    @pytest.mark.asyncio
+    async def test_tool_calls_emit_start_and_results_in_order(self):
+        agent, _ = make_agent([
+            [tool_part(("read_file", {"path": "a"}), ("read_file", {"path": "b"}))],
+            [text_part("done")],
+        ])
+
+        events = await collect(agent.get_response("read a and b", stream=True))
+
+        starts = [e for e in events if isinstance(e, ToolCallStart)]
+        results = [e for e in events if isinstance(e, ToolResult)]
+        assert [s.arguments["path"] for s in starts] == ["a", "b"]
+        assert [r.content for r in results] == ["read_file:a", "read_file:b"]
+        tool_messages = [m for m in agent.messages if m["role"] == "tool"]
+        assert [m["content"] for m in tool_messages] == ["read_file:a", "read_file:b"]
+
+    @pytest.mark.asyncio
+    async def test_tool_results_are_fed_back_in_the_same_turn(self):
+        agent, client = make_agent([
+            [tool_part(("read_file", {"path": "a"}))],
+            [text_part("File a says hi", done=True, prompt_eval_count=40, eval_count=5)],
+        ])
+
+        events = await collect(agent.get_response("what is in a?", stream=False))
+
+        assert events[-1] == Done("File a says hi", events[-1].stats)
+        assert events[-1].stats["llm_calls"] == 2
+        assert events[-1].stats["prompt_tokens"] == 40
+        assert events[-1].stats["tool_calls"] == 1
+        second_request = client.requests[1]["messages"]
+        assert second_request[-1] == {'role': 'tool', 'content': 'read_file:a', 'tool_name': 'read_file'}
+        assert agent.messages[-1] == {'role': 'assistant', 'content': 'File a says hi'}
+
+    @pytest.mark.asyncio
+    async def test_last_step_is_sent_without_tools(self):
+        agent, client = make_agent([
+            [tool_part(("read_file", {"path": "a"}))],
+            [text_part("giving up on tools")],
+        ])
+        agent.max_steps = 2
+
+        events = await collect(agent.get_response("loop forever", stream=True))
+
+        assert "tools" in client.requests[0]
+        assert "tools" not in client.requests[1]
+        assert events[-1].stats["llm_calls"] == 2
+
+    @pytest.mark.asyncio
+    async def test_llm_timeout_keeps_partial_answer(self):
+        class StalledClient(FakeAsyncClient):
+            async def chat(self, **kwargs):
+                async def stream():
+                    yield text_part("Partial")
+                    await asyncio.sleep(60)
+                return stream()
+
+        agent, _ = make_agent([])
+        agent._get_client = lambda: StalledClient([])
+        agent.timeouts.llm = 0.05
+
+        events = await collect(agent.get_response("hi", stream=True))
+
+        assert events[0] == TextDelta("Partial")
+        assert "Timed out" in events[1].text
+        assert events[-1].stats["timed_out"] is True
+        assert agent.messages[-1] == {'role': 'assistant', 'content': 'Partial'}
+
+    @pytest.mark.asyncio
+    async def test_cancel_during_tool_call_keeps_history_consistent(self):
+        started = asyncio.Event()
+
+        async def slow_tool(name, args):
+            started.set()
+            await asyncio.sleep(60)
+
+        agent, _ = make_agent([[text_part("Looking"), tool_part(("slow", {}))]])
+        agent.tool_manager.register_tool("slow", slow_tool, "Slow tool", {"properties": {}})
+
+        async def consume():
+            async for _ in agent.get_response("hi", stream=True):
+                pass
+
+        turn = asyncio.create_task(consume())
+        await asyncio.wait_for(started.wait(), 2)
+        turn.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await turn
+
+        assert agent.messages[-2]['role'] == 'assistant' and agent.messages[-2]['content'] == "Looking"
+        assert agent.messages[-1] == {'role': 'tool', 'content': '[cancelled by user]', 'tool_name': 'slow'}
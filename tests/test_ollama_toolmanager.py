@@ -1,7 +1,8 @@
 import pytest
 import asyncio
+import json
 from unittest.mock import MagicMock, patch
-from ollama_toolmanager import OllamaToolManager, OllamaTool
+from ollama_toolmanager import OllamaToolManager, OllamaTool, tool_manager_from_config
 
 # I did not write these tests. Cursor FTW!
 
@@ -83,8 +84,18 @@ class TestOllamaToolManager:
         assert tool_spec["type"] == "function"
         assert tool_spec["function"]["name"] == "add_numbers"
         assert tool_spec["function"]["description"] == "Add two numbers"
-        assert tool_spec["function"]["properties"] == inputSchema["properties"]
-        assert tool_spec["function"]["required"] == inputSchema["required"]
+        assert tool_spec["function"]["parameters"] == {
+            "type": "object",
+            "properties": inputSchema["properties"],
+            "required": inputSchema["required"],
+        }
+        assert json.loads(self.tool_manager.get_tools_json()) == tools_spec
+        # 註冊表沒變時回傳同一份已編好的 spec
+        assert self.tool_manager.get_tools() is tools_spec
+
+        assert self.tool_manager.unregister_tool("add_numbers")
+        assert self.tool_manager.get_tools() == []
+        assert self.tool_manager.get_tools_json() == "[]"
     
     def test_multiple_tools(self):
         # Register multiple tools
@@ -248,4 +259,131 @@ class TestOllamaToolManager:
         self.tool_manager.clear_tools()
         
         # Verify tools are cleared
-        assert len(self.tool_manager.tools) == 0 
\ No newline at end of file
+        assert len(self.tool_manager.tools) == 0 
+    @pytest.mark.asyncio
+    async def test_execute_tools_keeps_order_and_limits_concurrency(self):
+        manager = OllamaToolManager(max_concurrency_per_server=2)
+        running = {"now": 0, "peak": 0}
+
+        async def slow_echo(name: str, args: dict) -> dict:
+            running["now"] += 1
+            running["peak"] = max(running["peak"], running["now"])
+            await asyncio.sleep(0.01 * (5 - args["i"]))
+            running["now"] -= 1
+            return {'tool': name, 'content': [{'text': str(args["i"])}], 'status': 'success'}
+
+        manager.register_tool(
+            name="echo",
+            function=slow_echo,
+            description="Echo the index",
+            inputSchema={"properties": {"i": {"type": "number"}}},
+            server="filesystem"
+        )
+
+        payloads = []
+        for i in range(5):
+            mock_function = MagicMock()
+            mock_function.name = "echo"
+            mock_function.arguments = {"i": i}
+            payloads.append({"function": mock_function})
+
+        results = await manager.execute_tools(payloads)
+
+        assert [r["content"][0]["text"] for r in results] == ["0", "1", "2", "3", "4"]
+        assert running["peak"] == 2
+
+        # 同時進行的兩批呼叫共用同一個上限
+        running["peak"] = 0
+        await asyncio.gather(manager.execute_tools(payloads[:3]), manager.execute_tools(payloads[3:]))
+        assert running["peak"] == 2
+
+    @pytest.mark.asyncio
+    async def test_execute_tools_isolates_failures(self):
+        self.tool_manager.register_tool(
+            name="multiply",
+            function=async_multiply,
+            description="Multiply two numbers asynchronously",
+            inputSchema={"properties": {"a": {"type": "number"}, "b": {"type": "number"}}}
+        )
+        good = MagicMock()
+        good.name = "multiply"
+        good.arguments = {"a": 2, "b": 4}
+        unknown = MagicMock()
+        unknown.name = "unknown_tool"
+        unknown.arguments = {}
+
+        results = await self.tool_manager.execute_tools([{"function": unknown}, {"function": good}])
+
+        assert results[0]["status"] == "error"
+        assert "Unknown tool" in results[0]["content"][0]["text"]
+        assert results[1]["content"][0]["text"] == "8"
+
+    @pytest.mark.asyncio
+    async def test_result_cache_skips_repeated_read_only_calls(self):
+        from tool_result_cache import ToolResultCache
+        manager = OllamaToolManager(result_cache=ToolResultCache(read_only_tools=["read_file"]))
+        calls = []
+
+        async def read_file(name: str, args: dict) -> dict:
+            calls.append(args)
+            return {'tool': name, 'content': [{'text': "hello"}], 'status': 'success'}
+
+        manager.register_tool(
+            name="read_file",
+            function=read_file,
+            description="Read a file",
+            inputSchema={"properties": {"path": {"type": "string"}}},
+            server="filesystem"
+        )
+        mock_function = MagicMock()
+        mock_function.name = "read_file"
+        mock_function.arguments = {"path": "/does/not/exist.txt"}
+
+        first = await manager.execute_tool({"function": mock_function})
+        second = await manager.execute_tool({"function": mock_function})
+
+        assert first == second
+        assert len(calls) == 1
+        assert manager.result_cache.stats["hits"] == 1
+
+    @pytest.mark.asyncio
+    async def test_colliding_tool_names_are_prefixed_with_server(self):
+        manager = OllamaToolManager()
+        calls = []
+
+        def make_tool(server):
+            async def call(name: str, args: dict) -> dict:
+                calls.append((server, name))
+                return {'tool': name, 'content': [{'text': server}], 'status': 'success'}
+            return call
+
+        schema = {"properties": {"path": {"type": "string"}}}
+        manager.register_tool("read_file", make_tool("filesystem"), "Read", schema, server="filesystem")
+        manager.register_tool("excel_read_sheet", make_tool("excel"), "Sheet", schema, server="excel")
+        registered = manager.register_tool("read_file", make_tool("excel"), "Read", schema, server="excel")
+
+        assert registered == "excel__read_file"
+        assert sorted(manager.tools) == ["excel__read_file", "excel_read_sheet", "filesystem__read_file"]
+
+        mock_function = MagicMock()
+        mock_function.name = "filesystem__read_file"
+        mock_function.arguments = {"path": "a.txt"}
+        result = await manager.execute_tool({"function": mock_function})
+
+        assert result["content"][0]["text"] == "filesystem"
+        assert calls == [("filesystem", "read_file")]
+
+
+class TestToolManagerFromConfig:
+
+    def test_settings_come_from_config(self, tmp_path):
+        config = tmp_path / "config.json"
+        config.write_text(json.dumps({
+            "Tool_Execution": {"MAX_CONCURRENCY_PER_SERVER": 1},
+            "Tool_Cache": {"ENABLED": True},
+            "Timeouts": {"TOOL_TIMEOUT": 5},
+        }))
+        manager = tool_manager_from_config(str(config))
+        assert manager.max_concurrency_per_server == 1
+        assert manager.result_cache is not None
+        assert manager.timeouts.tool == 5
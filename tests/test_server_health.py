@@ -0,0 +1,49 @@
+import time
+import pytest
+from server_health import CircuitOpenError, HealthTracker
+
+
+class TestHealthTracker:
+
+    def test_opens_after_threshold_and_backs_off_exponentially(self):
+        tracker = HealthTracker(failure_threshold=2, backoff_base=10, backoff_max=25)
+        tracker.record_failure("excel", ConnectionError("refused"))
+        assert tracker.check("excel") is False
+        tracker.record_failure("excel", ConnectionError("refused"))
+
+        status = tracker.snapshot("excel")
+        assert status["state"] == "down"
+        assert 8 <= status["retry_in_s"] <= 12
+        assert status["last_error"] == "ConnectionError: refused"
+        with pytest.raises(CircuitOpenError, match="excel is unavailable"):
+            tracker.check("excel")
+
+        # 退避時間到了：只放行一個 probe，probe 失敗則加倍退避（上限 backoff_max）
+        tracker._servers["excel"].retry_at = time.monotonic()
+        assert tracker.check("excel") is True
+        with pytest.raises(CircuitOpenError):
+            tracker.check("excel")
+        tracker.record_failure("excel", ConnectionError("refused"))
+        assert 16 <= tracker.snapshot("excel")["retry_in_s"] <= 24
+        tracker._servers["excel"].retry_at = time.monotonic()
+        assert tracker.try_probe("excel")
+        tracker.record_failure("excel", ConnectionError("refused"))
+        assert tracker.snapshot("excel")["retry_in_s"] <= 25 * 1.2
+
+    def test_success_closes_circuit(self):
+        tracker = HealthTracker(failure_threshold=1, backoff_base=0)
+        tracker.record_failure("git", EOFError())
+        assert tracker.try_probe("git")
+        tracker.record_success("git", latency_ms=3.0)
+        status = tracker.snapshot("git")
+        assert status["state"] == "healthy"
+        assert status["ping_ms"] == 3.0
+        assert tracker.check("git") is False
+
+    def test_released_probe_can_be_retried(self):
+        tracker = HealthTracker(failure_threshold=1, backoff_base=0)
+        tracker.record_failure("git", EOFError())
+        assert tracker.try_probe("git")
+        assert not tracker.try_probe("git")
+        tracker.release_probe("git")
+        assert tracker.try_probe("git")
@@ -0,0 +1,115 @@
+import asyncio
+import pytest
+from unittest.mock import MagicMock
+from ollama_toolmanager import OllamaToolManager
+from singleflight import SingleFlight
+
+
+def payload(name, arguments):
+    function = MagicMock()
+    function.name = name
+    function.arguments = arguments
+    return {"function": function}
+
+
+def slow_server(calls):
+    async def call_tool(name, arguments):
+        calls.append((name, arguments))
+        await asyncio.sleep(0.05)
+        return {"tool": name, "content": [{"text": f"{name} {len(calls)}"}], "status": "success"}
+    return call_tool
+
+
+def manager_with(calls, singleflight):
+    manager = OllamaToolManager(singleflight=singleflight)
+    schema = {"properties": {"path": {"type": "string"}, "content": {"type": "string"}}}
+    for name in ("list_directory", "write_file"):
+        manager.register_tool(name, slow_server(calls), name, schema, server="filesystem")
+    return manager
+
+
+class TestSingleFlight:
+
+    @pytest.mark.asyncio
+    async def test_identical_read_only_calls_share_one_request(self):
+        calls = []
+        manager = manager_with(calls, SingleFlight())
+
+        results = await asyncio.gather(
+            manager.execute_tool(payload("list_directory", {"path": "."})),
+            manager.execute_tool(payload("list_directory", {"path": "."})),
+            manager.execute_tool(payload("list_directory", {"path": "/tmp"})),
+        )
+
+        assert calls == [("list_directory", {"path": "."}), ("list_directory", {"path": "/tmp"})]
+        assert results[0] is results[1]
+        assert manager.coalescing_stats == {"calls": 3, "coalesced": 1}
+        # 完成後不再合併
+        await manager.execute_tool(payload("list_directory", {"path": "."}))
+        assert len(calls) == 3
+
+    @pytest.mark.asyncio
+    async def test_mutating_calls_are_not_coalesced(self):
+        calls = []
+        manager = manager_with(calls, SingleFlight())
+        arguments = {"path": "a.txt", "content": "x"}
+
+        await asyncio.gather(*(manager.execute_tool(payload("write_file", dict(arguments))) for _ in range(2)))
+
+        assert len(calls) == 2
+        assert manager.coalescing_stats == {"calls": 0, "coalesced": 0}
+
+    @pytest.mark.asyncio
+    async def test_cancelled_waiter_does_not_cancel_the_shared_call(self):
+        flight = SingleFlight()
+        started = asyncio.Event()
+        finished = []
+
+        async def request():
+            started.set()
+            await asyncio.sleep(0.05)
+            finished.append(True)
+            return "ok"
+
+        key = flight.key("filesystem", "read_file", {"path": "a"})
+        first = asyncio.create_task(flight.do(key, request))
+        await started.wait()
+        second = asyncio.create_task(flight.do(key, request))
+        await asyncio.sleep(0)
+        first.cancel()
+
+        assert await second == ("ok", True)
+        assert finished == [True]
+        with pytest.raises(asyncio.CancelledError):
+            await first
+
+    @pytest.mark.asyncio
+    async def test_request_is_cancelled_when_nobody_waits(self):
+        flight = SingleFlight()
+        cancelled = asyncio.Event()
+
+        async def request():
+            try:
+                await asyncio.sleep(60)
+            except asyncio.CancelledError:
+                cancelled.set()
+                raise
+
+        task = asyncio.create_task(flight.do(flight.key(None, "read_file", {}), request))
+        await asyncio.sleep(0.01)
+        task.cancel()
+        await asyncio.wait_for(cancelled.wait(), 1)
+        assert flight._inflight == {}
+
+    @pytest.mark.asyncio
+    async def test_errors_reach_every_waiter(self):
+        flight = SingleFlight()
+
+        async def request():
+            await asyncio.sleep(0.01)
+            raise ConnectionError("boom")
+
+        key = flight.key(None, "read_file", {"path": "a"})
+        results = await asyncio.gather(flight.do(key, request), flight.do(key, request), return_exceptions=True)
+        assert all(isinstance(r, ConnectionError) for r in results)
+        assert flight.stats == {"calls": 2, "coalesced": 1}
@@ -0,0 +1,88 @@
+import pytest
+from unittest.mock import MagicMock
+from ollama_toolmanager import OllamaToolManager
+from tool_arguments import ArgumentValidator, ToolArgumentError
+
+EXCEL_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "fileAbsolutePath": {"type": "string"},
+        "sheetName": {"type": "string"},
+        "range": {"type": "string"},
+        "showFormula": {"type": "boolean"},
+    },
+    "required": ["fileAbsolutePath", "sheetName"],
+}
+
+EDIT_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "path": {"type": "string"},
+        "edits": {"type": "array", "items": {"type": "object"}},
+        "head": {"type": "integer"},
+        "ratio": {"type": "number"},
+        "mode": {"type": "string", "enum": ["text", "binary"]},
+    },
+    "required": ["path"],
+    "additionalProperties": False,
+}
+
+
+class TestArgumentValidator:
+
+    def test_aliases_are_renamed(self):
+        validate = ArgumentValidator(EXCEL_SCHEMA)
+        assert validate({"file_path": "/a.xlsx", "sheet_name": "S1"}) == {"fileAbsolutePath": "/a.xlsx", "sheetName": "S1"}
+        # 正確名稱優先於別名
+        assert validate({"fileAbsolutePath": "/a.xlsx", "path": "/b.xlsx", "sheetName": "S1"})["fileAbsolutePath"] == "/a.xlsx"
+
+    def test_stringified_values_are_coerced(self):
+        validate = ArgumentValidator(EDIT_SCHEMA)
+        result = validate({"path": "/x", "head": "10", "ratio": "0.5", "edits": '[{"oldText": "a"}]', "mode": None})
+        assert result == {"path": "/x", "head": 10, "ratio": 0.5, "edits": [{"oldText": "a"}]}
+        assert ArgumentValidator(EXCEL_SCHEMA)({"fileAbsolutePath": "/a", "sheetName": "S", "showFormula": "true"})["showFormula"] is True
+        # 整個 arguments 是 JSON 字串
+        assert validate('{"path": "/x"}') == {"path": "/x"}
+
+    def test_invalid_arguments_list_every_problem(self):
+        validate = ArgumentValidator(EDIT_SCHEMA)
+        with pytest.raises(ToolArgumentError) as e:
+            validate({"head": "ten", "mode": "hex", "extra": 1})
+        message = str(e.value)
+        assert "'head': expected integer" in message
+        assert "must be one of" in message
+        assert "unknown argument 'extra'" in message
+        assert "missing required argument 'path'" in message
+        assert "path (string, required)" in message
+
+    def test_custom_aliases(self):
+        validate = ArgumentValidator(EDIT_SCHEMA, aliases={"path": ["file"]})
+        assert validate({"file": "/x"}) == {"path": "/x"}
+
+
+class TestToolManagerValidation:
+
+    @pytest.mark.asyncio
+    async def test_invalid_call_never_reaches_the_tool(self):
+        calls = []
+
+        async def read_sheet(name, arguments):
+            calls.append(arguments)
+            return {"tool": name, "content": [{"text": "ok"}], "status": "success"}
+
+        manager = OllamaToolManager()
+        manager.register_tool("excel_read_sheet", read_sheet, "Read a sheet", EXCEL_SCHEMA, server="excel")
+
+        function = MagicMock()
+        function.name = "excel_read_sheet"
+        function.arguments = {"path": "/a.xlsx"}
+        result = await manager.execute_tool({"function": function})
+
+        assert result["status"] == "error"
+        assert "missing required argument 'sheetName'" in result["content"][0]["text"]
+        assert calls == []
+
+        function.arguments = {"path": "/a.xlsx", "sheetName": "S1"}
+        result = await manager.execute_tool({"function": function})
+        assert result["status"] == "success"
+        assert calls == [{"fileAbsolutePath": "/a.xlsx", "sheetName": "S1"}]
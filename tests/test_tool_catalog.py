@@ -0,0 +1,130 @@
+import json
+import time
+import pytest
+from mcp.types import ResourceListChangedNotification, ServerNotification, Tool, ToolListChangedNotification
+from mcpclient_manager import MCPClientManager
+from ollama_toolmanager import OllamaToolManager
+from tool_catalog import ToolCatalog, sync_tool_manager
+
+
+class FakePool:
+    def __init__(self, version="1.0"):
+        self.fetches = 0
+        self.version = version
+        self.names = ["read_file"]
+
+    async def fetch_tool_catalog(self, server_type):
+        self.fetches += 1
+        tools = [Tool(name=name, description=f"{name} tool",
+                      inputSchema={"type": "object", "properties": {"path": {"type": "string"}}})
+                 for name in self.names]
+        return {"server_version": self.version, "tools": tools}
+
+
+@pytest.fixture
+def paths(tmp_path):
+    config = tmp_path / "config.json"
+    config.write_text(json.dumps({"MCP_Servers": {"filesystem": {"mode": "stdio", "connection": {"args": ["a"]}}}}))
+    return str(tmp_path / "tool_catalog.json"), str(config)
+
+
+def wait_for(condition, timeout=2):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return condition()
+
+
+class TestToolCatalog:
+
+    @pytest.mark.asyncio
+    async def test_miss_fetches_and_persists(self, paths):
+        cache_path, config_path = paths
+        pool = FakePool()
+        catalog = ToolCatalog(pool, cache_path, config_path)
+
+        tools = await catalog.list_tools("filesystem")
+        await catalog.list_tools("filesystem")
+
+        assert [t.name for t in tools] == ["read_file"]
+        assert pool.fetches == 1
+        assert catalog.stats["misses"] == 1 and catalog.stats["hits"] == 1
+        with open(cache_path) as f:
+            assert json.load(f)["filesystem"]["server_version"] == "1.0"
+
+    @pytest.mark.asyncio
+    async def test_warm_start_from_disk_refreshes_in_background(self, paths):
+        cache_path, config_path = paths
+        await ToolCatalog(FakePool(), cache_path, config_path).list_tools("filesystem")
+
+        pool = FakePool(version="2.0")
+        catalog = ToolCatalog(pool, cache_path, config_path)
+        tools = await catalog.list_tools("filesystem")
+
+        assert tools[0].inputSchema["properties"]["path"]["type"] == "string"
+        assert catalog.stats["hits"] == 1
+        assert wait_for(lambda: pool.fetches == 1)
+        assert wait_for(lambda: catalog.store.get()["filesystem"]["server_version"] == "2.0")
+
+    @pytest.mark.asyncio
+    async def test_config_change_invalidates_entry(self, paths):
+        cache_path, config_path = paths
+        await ToolCatalog(FakePool(), cache_path, config_path).list_tools("filesystem")
+        with open(config_path, "w") as f:
+            json.dump({"MCP_Servers": {"filesystem": {"mode": "stdio", "connection": {"args": ["b"]}}}}, f)
+
+        assert ToolCatalog(FakePool(), cache_path, config_path).get("filesystem") is None
+
+    @pytest.mark.asyncio
+    async def test_invalidate_drops_cached_tools(self, paths):
+        cache_path, config_path = paths
+        pool = FakePool()
+        catalog = ToolCatalog(pool, cache_path, config_path)
+        await catalog.list_tools("filesystem")
+
+        catalog.invalidate("filesystem")
+        await catalog.list_tools("filesystem")
+
+        assert pool.fetches == 2
+
+
+class TestRegistrySync:
+
+    @pytest.mark.asyncio
+    async def test_changed_tool_list_updates_the_tool_manager(self, paths):
+        cache_path, config_path = paths
+        pool = FakePool()
+        catalog = ToolCatalog(pool, cache_path, config_path)
+        manager = OllamaToolManager()
+
+        async def call_tool(name, arguments):
+            return name
+
+        for tool in await catalog.list_tools("filesystem"):
+            manager.register_tool(tool.name, call_tool, tool.description, tool.inputSchema, server="filesystem")
+        sync_tool_manager(manager, ["filesystem"], lambda server: call_tool, catalog=catalog)
+
+        pool.names = ["write_file", "list_directory"]
+        await catalog.refresh("filesystem")
+        assert sorted(manager.tools) == ["list_directory", "write_file"]
+        assert "read_file" not in manager.get_tools_json()
+
+        # tools/list_changed：背景重新列出工具後同步
+        pool.names = ["read_file"]
+        catalog.tools_changed("filesystem")
+        assert wait_for(lambda: list(manager.tools) == ["read_file"])
+
+
+class TestListChangedNotification:
+
+    @pytest.mark.asyncio
+    async def test_tools_list_changed_calls_listener(self):
+        changed = []
+        client = MCPClientManager("filesystem", on_tools_changed=changed.append)
+        notification = ServerNotification(ToolListChangedNotification(method="notifications/tools/list_changed"))
+
+        await client._handle_message(notification)
+        await client._handle_message(ServerNotification(
+            ResourceListChangedNotification(method="notifications/resources/list_changed")))
+
+        assert changed == ["filesystem"]
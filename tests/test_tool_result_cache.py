@@ -0,0 +1,108 @@
+import os
+import pytest
+from unittest.mock import MagicMock
+from ollama_toolmanager import OllamaToolManager
+from tool_result_cache import ToolResultCache
+
+
+def call(cache, server, name, arguments, result):
+    """Run one tool call through the cache the way OllamaToolManager does"""
+    hit, cached = cache.lookup(server, name, arguments)
+    if hit:
+        return cached
+    token = cache.begin(server, name, arguments)
+    cache.store(server, name, arguments, result, token)
+    return result
+
+
+class TestToolResultCache:
+
+    def test_read_only_result_is_reused(self, tmp_path):
+        path = str(tmp_path / "a.txt")
+        open(path, "w").write("one")
+        cache = ToolResultCache()
+
+        call(cache, "fs", "read_file", {"path": path}, "one")
+        hit, result = cache.lookup("fs", "read_file", {"path": path})
+
+        assert hit and result == "one"
+        assert cache.stats["hits"] == 1
+        assert cache.stats["misses"] == 1
+
+    def test_unknown_tools_are_not_cached(self):
+        cache = ToolResultCache()
+        call(cache, "git", "git_status", {}, "clean")
+        assert cache.lookup("git", "git_status", {}) == (False, None)
+
+    def test_mtime_change_invalidates(self, tmp_path):
+        path = str(tmp_path / "a.txt")
+        open(path, "w").write("one")
+        cache = ToolResultCache()
+        call(cache, "fs", "read_file", {"path": path}, "one")
+
+        stat = os.stat(path)
+        os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000))
+
+        assert cache.lookup("fs", "read_file", {"path": path}) == (False, None)
+        assert cache.stats["invalidations"] == 1
+
+    def test_mutating_tool_invalidates_same_server_only(self):
+        cache = ToolResultCache()
+        call(cache, "fs", "list_directory", {"path": "/nope"}, "a")
+        call(cache, "excel", "excel_describe_sheets", {"fileAbsolutePath": "/x.xlsx"}, "b")
+
+        call(cache, "fs", "write_file", {"path": "/nope/b.txt"}, "ok")
+
+        assert cache.lookup("fs", "list_directory", {"path": "/nope"})[0] is False
+        assert cache.lookup("excel", "excel_describe_sheets", {"fileAbsolutePath": "/x.xlsx"})[0] is True
+
+    def test_read_overlapping_a_mutation_is_not_stored(self):
+        cache = ToolResultCache()
+        token = cache.begin("fs", "read_file", {"path": "/a"})
+        call(cache, "fs", "write_file", {"path": "/a"}, "ok")
+        cache.store("fs", "read_file", {"path": "/a"}, "stale", token)
+        assert cache.lookup("fs", "read_file", {"path": "/a"})[0] is False
+
+    def test_lru_eviction_by_bytes(self):
+        cache = ToolResultCache(max_bytes=25)
+        call(cache, "fs", "read_file", {"path": "/a"}, "a" * 10)
+        call(cache, "fs", "read_file", {"path": "/b"}, "b" * 10)
+        cache.lookup("fs", "read_file", {"path": "/a"})  # /a 變成最近使用
+        call(cache, "fs", "read_file", {"path": "/c"}, "c" * 10)
+
+        assert cache.lookup("fs", "read_file", {"path": "/b"})[0] is False
+        assert cache.lookup("fs", "read_file", {"path": "/a"})[0] is True
+        assert cache.stats["evictions"] == 1
+        assert cache.stats["bytes"] <= 25
+
+    def test_errors_are_not_cached(self):
+        cache = ToolResultCache()
+        call(cache, "fs", "read_file", {"path": "/a"}, {"status": "error", "content": [{"text": "x"}]})
+        assert cache.lookup("fs", "read_file", {"path": "/a"})[0] is False
+
+
+class TestToolManagerCache:
+
+    @pytest.mark.asyncio
+    async def test_colliding_tool_names_are_cached_by_remote_name(self):
+        calls = []
+
+        def server(label):
+            async def call_tool(name, arguments):
+                calls.append((label, name))
+                return {"tool": name, "content": [{"text": label}], "status": "success"}
+            return call_tool
+
+        manager = OllamaToolManager(result_cache=ToolResultCache())
+        schema = {"properties": {"path": {"type": "string"}}}
+        manager.register_tool("read_file", server("fs1"), "Read", schema, server="fs1")
+        manager.register_tool("read_file", server("fs2"), "Read", schema, server="fs2")
+
+        function = MagicMock()
+        function.name = "fs1__read_file"
+        function.arguments = {"path": "/nonexistent/a.txt"}
+        results = [await manager.execute_tool({"function": function}) for _ in range(3)]
+
+        assert calls == [("fs1", "read_file")]
+        assert all(r["content"][0]["text"] == "fs1" for r in results)
+        assert manager.result_cache.stats["hits"] == 2
@@ -0,0 +1,73 @@
+import pytest
+from ollama_toolmanager import OllamaTool
+from tool_selector import BM25Index, ToolSelector, spec_tokens, tokenize
+
+
+def make_tools(descriptions):
+    return {
+        name: OllamaTool(name=name, function=None, description=description,
+                         properties={"path": {"type": "string"}}, required=["path"])
+        for name, description in descriptions.items()
+    }
+
+
+FS_TOOLS = make_tools({
+    "read_file": "Read the complete contents of a file from the file system",
+    "write_file": "Create a new file or overwrite an existing file with new content",
+    "list_directory": "Get a detailed listing of all files and directories in a specified path",
+    "move_file": "Move or rename files and directories",
+    "search_files": "Recursively search for files and directories matching a pattern",
+    "get_file_info": "Retrieve detailed metadata about a file or directory",
+    "excel_read_sheet": "Read values from an Excel sheet",
+    "excel_write_to_sheet": "Write values to an Excel sheet",
+})
+
+
+class TestToolSelector:
+
+    def test_tokenize_splits_identifiers(self):
+        assert tokenize("excel_readSheet HTTPServer") == ["excel", "read", "sheet", "http", "server"]
+
+    def test_bm25_ranks_matching_document_first(self):
+        index = BM25Index({"a": "read a file", "b": "move directories", "c": "excel sheet values"})
+        scores = index.scores("rename these directories")
+        assert max(scores, key=scores.get) == "b"
+        assert scores["a"] == 0
+
+    @pytest.mark.asyncio
+    async def test_selects_top_k_relevant_tools(self):
+        selector = ToolSelector(top_k=2)
+        names, method = await selector.select(FS_TOOLS, "read the values of the excel sheet report.xlsx")
+        assert method == "bm25"
+        assert len(names) == 2
+        assert names[0] == "excel_read_sheet"
+
+    @pytest.mark.asyncio
+    async def test_falls_back_to_all_tools(self):
+        selector = ToolSelector(top_k=2)
+        # 沒有任何字詞對得上時送出全部工具
+        assert await selector.select(FS_TOOLS, "你好") == (None, "fallback")
+        # 工具數量不超過 top_k 時不篩選
+        assert await ToolSelector(top_k=20).select(FS_TOOLS, "read file") == (None, "all")
+
+    @pytest.mark.asyncio
+    async def test_always_include_and_embedding_failure(self):
+        selector = ToolSelector(top_k=1, method="embeddings", embedding_model="missing-model",
+                                always_include=["list_directory"])
+        async def unreachable(tools, query):
+            raise ConnectionError("ollama is not running")
+
+        # 連不上 embedding 模型時改用 BM25
+        selector._embedding_scores = unreachable
+        names, method = await selector.select(FS_TOOLS, "move the file")
+        assert method == "bm25"
+        assert names == ["move_file", "list_directory"]
+
+    def test_spec_tokens_counts_selected_subset(self):
+        from ollama_toolmanager import OllamaToolManager
+        manager = OllamaToolManager()
+        for name, tool in FS_TOOLS.items():
+            manager.register_tool(name, tool.function, tool.description,
+                                  {"properties": tool.properties, "required": tool.required})
+        assert spec_tokens(manager.get_tools_json(["read_file"])) < spec_tokens(manager.get_tools_json())
+        assert [t["function"]["name"] for t in manager.get_tools(["read_file"])] == ["read_file"]
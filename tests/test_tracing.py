@@ -0,0 +1,104 @@
+import asyncio
+import json
+import os
+import pytest
+import tracing
+from tracing import Tracer, _tail_lines, latency_by, load_traces, percentile, waterfall_rows
+
+
+@pytest.fixture
+def tracer(tmp_path, monkeypatch):
+    tracer = Tracer(str(tmp_path / "traces.jsonl"))
+    monkeypatch.setattr(tracing, "_tracer", tracer)
+    return tracer
+
+
+class TestTracer:
+
+    def test_nested_spans_are_exported_as_one_line(self, tracer):
+        with tracer.trace("turn", model="m") as root:
+            with tracing.span("llm", step=0) as llm:
+                llm.set(prompt_tokens=10)
+            root.set(llm_calls=1)
+
+        [trace] = load_traces(tracer.path)
+        root_span, llm_span = trace["spans"]
+        assert trace["name"] == "turn"
+        assert trace["attributes"] == {"model": "m", "llm_calls": 1}
+        assert llm_span["parent_id"] == root_span["span_id"]
+        assert llm_span["attributes"] == {"step": 0, "prompt_tokens": 10}
+
+    def test_span_outside_trace_is_noop(self, tracer):
+        with tracing.span("tool") as span:
+            assert span is None
+        assert load_traces(tracer.path) == []
+
+    @pytest.mark.asyncio
+    async def test_concurrent_tasks_attach_to_current_span(self, tracer):
+        async def tool(name):
+            with tracing.span("tool", tool=name):
+                await asyncio.sleep(0.01)
+
+        with tracer.trace("turn"):
+            with tracing.span("tools") as parent:
+                await asyncio.gather(tool("a"), tool("b"))
+
+        [trace] = load_traces(tracer.path)
+        tools = [s for s in trace["spans"] if s["name"] == "tool"]
+        assert {s["parent_id"] for s in tools} == {parent.span_id}
+
+    def test_error_is_recorded_and_reraised(self, tracer):
+        with pytest.raises(RuntimeError):
+            with tracer.trace("turn"):
+                with tracing.span("tool"):
+                    raise RuntimeError("boom")
+        [trace] = load_traces(tracer.path)
+        assert all(s["attributes"]["error"] == "RuntimeError" for s in trace["spans"])
+
+
+class TestTraceSummaries:
+
+    def test_percentile(self):
+        values = list(range(1, 101))
+        assert percentile(values, 50) == 50
+        assert percentile(values, 95) == 95
+        assert percentile([], 50) is None
+
+    def test_latency_by_tool_and_waterfall(self, tmp_path):
+        path = tmp_path / "traces.jsonl"
+        trace = {
+            "name": "turn", "attributes": {}, "duration_ms": 30,
+            "spans": [
+                {"name": "turn", "span_id": "r", "parent_id": None, "start_ms": 0, "duration_ms": 30, "attributes": {}},
+                {"name": "tool", "span_id": "a", "parent_id": "r", "start_ms": 5, "duration_ms": 10, "attributes": {"tool": "read"}},
+                {"name": "tool", "span_id": "b", "parent_id": "r", "start_ms": 5, "duration_ms": 20, "attributes": {"tool": "read"}},
+            ],
+        }
+        path.write_text(json.dumps(trace) + "\n" + "not json\n")
+
+        traces = load_traces(str(path))
+        assert latency_by(traces, "tool", "tool") == [
+            {"tool": "read", "count": 2, "p50_ms": 10, "p95_ms": 20}
+        ]
+        rows = waterfall_rows(traces[0])
+        assert rows[1]["label"] == "01   tool read"
+        assert rows[2]["end_ms"] == 25
+
+    def test_trace_file_is_rotated_and_read_from_the_tail(self, tmp_path):
+        tracer = Tracer(str(tmp_path / "traces.jsonl"), max_bytes=2000)
+        for i in range(30):
+            with tracer.trace("turn", i=i):
+                pass
+
+        assert os.path.getsize(tracer.path) <= 2000 + 500
+        assert os.path.exists(tracer.path + ".1")
+        # 目前的檔案只剩幾筆，不足的部分從 .1 備份補上
+        traces = load_traces(tracer.path, limit=5)
+        assert [t["attributes"]["i"] for t in traces] == list(range(25, 30))
+        assert len(load_traces(tracer.path, limit=100)) < 30
+
+    def test_tail_reads_across_blocks(self, tmp_path):
+        path = tmp_path / "traces.jsonl"
+        path.write_text("".join(json.dumps({"name": "t", "n": i, "pad": "x" * 100}) + "\n" for i in range(100)))
+        assert [line.count(b"pad") for line in _tail_lines(str(path), 3, block_size=64)] == [1, 1, 1]
+        assert [t["n"] for t in load_traces(str(path), limit=5)] == [95, 96, 97, 98, 99]
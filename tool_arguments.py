@@ -0,0 +1,274 @@
+import json
+import re
+from typing import Any, Callable, Dict, Iterable, List, Mapping, Optional
+
+from config_store import get_config_store
+
+# 模型常用錯的參數名稱：正確名稱 -> 可接受的別名（只在 schema 沒有該別名時套用）
+DEFAULT_ALIASES = {
+    "fileAbsolutePath": ["file_path", "path", "filepath", "file", "filePath"],
+}
+
+_DROP = object()
+_TRUE = {"true", "yes", "1"}
+_FALSE = {"false", "no", "0"}
+
+
+class ToolArgumentError(ValueError):
+    """Arguments do not match the tool's inputSchema; the message is meant for the model"""
+
+
+def _normalize_key(key: str) -> str:
+    return re.sub(r"[_\-\s]", "", key).lower()
+
+
+def _json_value(value: str, kind: type) -> Any:
+    """Parse stringified JSON (``'{"a": 1}'``) that must decode to ``kind``"""
+    try:
+        parsed = json.loads(value)
+    except ValueError:
+        parsed = None
+    if not isinstance(parsed, kind):
+        raise ToolArgumentError(f"expected {'object' if kind is dict else 'array'}")
+    return parsed
+
+
+def _to_integer(value: Any) -> int:
+    if isinstance(value, bool):
+        raise ToolArgumentError("expected integer")
+    if isinstance(value, int):
+        return value
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    if isinstance(value, str):
+        try:
+            number = float(value.strip())
+        except ValueError:
+            pass
+        else:
+            if number.is_integer():
+                return int(number)
+    raise ToolArgumentError("expected integer")
+
+
+def _to_number(value: Any) -> float:
+    if isinstance(value, bool):
+        raise ToolArgumentError("expected number")
+    if isinstance(value, (int, float)):
+        return value
+    if isinstance(value, str):
+        try:
+            number = float(value.strip())
+        except ValueError:
+            pass
+        else:
+            return int(number) if number.is_integer() and "." not in value else number
+    raise ToolArgumentError("expected number")
+
+
+def _to_boolean(value: Any) -> bool:
+    if isinstance(value, bool):
+        return value
+    if isinstance(value, int) and value in (0, 1):
+        return bool(value)
+    if isinstance(value, str):
+        lowered = value.strip().lower()
+        if lowered in _TRUE:
+            return True
+        if lowered in _FALSE:
+            return False
+    raise ToolArgumentError("expected boolean")
+
+
+def _to_string(value: Any) -> str:
+    if isinstance(value, str):
+        return value
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return str(value)
+    raise ToolArgumentError("expected string")
+
+
+def _to_null(value: Any) -> None:
+    if value is None or value == "null":
+        return None
+    raise ToolArgumentError("expected null")
+
+
+def _array_coercer(schema: Dict[str, Any]) -> Callable[[Any], List[Any]]:
+    items = schema.get("items")
+    item = _compile_property(items) if isinstance(items, dict) else None
+
+    def coerce(value):
+        if isinstance(value, str):
+            stripped = value.strip()
+            # 字串形式的 JSON 陣列，否則視為單一元素
+            value = _json_value(stripped, list) if stripped.startswith("[") else [value]
+        elif not isinstance(value, list):
+            value = [value]
+        if item is None:
+            return value
+        result = []
+        for i, element in enumerate(value):
+            try:
+                result.append(item(element))
+            except ToolArgumentError as e:
+                raise ToolArgumentError(f"item {i}: {e}")
+        return result
+    return coerce
+
+
+def _object_coercer(schema: Dict[str, Any]) -> Callable[[Any], Dict[str, Any]]:
+    def coerce(value):
+        if isinstance(value, str):
+            return _json_value(value, dict)
+        if isinstance(value, Mapping):
+            return dict(value)
+        raise ToolArgumentError("expected object")
+    return coerce
+
+
+def _schema_types(schema: Dict[str, Any]) -> List[str]:
+    types = schema.get("type")
+    if isinstance(types, str):
+        return [types]
+    if isinstance(types, list):
+        return types
+    found = []
+    for option in schema.get("anyOf") or schema.get("oneOf") or []:
+        if isinstance(option, dict):
+            found.extend(t for t in _schema_types(option) if t not in found)
+    return found
+
+
+def _compile_property(schema: Dict[str, Any]) -> Callable[[Any], Any]:
+    """Build a coercer for one property schema; raises ToolArgumentError on mismatch"""
+    types = _schema_types(schema)
+    coercers = []
+    for kind in types:
+        if kind == "integer":
+            coercers.append(_to_integer)
+        elif kind == "number":
+            coercers.append(_to_number)
+        elif kind == "boolean":
+            coercers.append(_to_boolean)
+        elif kind == "string":
+            coercers.append(_to_string)
+        elif kind == "array":
+            coercers.append(_array_coercer(schema))
+        elif kind == "object":
+            coercers.append(_object_coercer(schema))
+        elif kind == "null":
+            coercers.append(_to_null)
+    nullable = "null" in types
+    enum = schema.get("enum")
+
+    def coerce(value):
+        if value is None and types and not nullable:
+            # 模型常對選填參數傳 null，視為沒有傳
+            return _DROP
+        if len(coercers) == 1:
+            value = coercers[0](value)
+        elif coercers:
+            error = None
+            # 型別已正確的值優先，避免 ["string", "number"] 把 "1" 轉成 1
+            for coercer in sorted(coercers, key=lambda c: not _accepts_as_is(c, value)):
+                try:
+                    value = coercer(value)
+                    break
+                except ToolArgumentError as e:
+                    error = error or e
+            else:
+                raise ToolArgumentError(f"expected {' or '.join(types)}" if len(types) > 1 else str(error))
+        if enum is not None and value not in enum:
+            raise ToolArgumentError(f"must be one of {json.dumps(enum, ensure_ascii=False)}")
+        return value
+    return coerce
+
+
+def _accepts_as_is(coercer, value) -> bool:
+    if coercer is _to_string:
+        return isinstance(value, str)
+    if coercer is _to_boolean:
+        return isinstance(value, bool)
+    if coercer in (_to_integer, _to_number):
+        return isinstance(value, (int, float)) and not isinstance(value, bool)
+    return False
+
+
+class ArgumentValidator:
+    """
+    Validator/coercer compiled once from a tool's ``inputSchema``.
+
+    Calling it with the model's arguments returns a new dict with aliases
+    renamed, stringified numbers/booleans/JSON converted and ``null`` optional
+    arguments dropped, or raises ToolArgumentError listing every problem.
+    Only top-level properties (and array items) are checked; nested objects
+    are passed through for the server to validate.
+    """
+
+    def __init__(self, schema: Optional[Dict[str, Any]], aliases: Optional[Dict[str, Iterable[str]]] = None):
+        schema = schema or {}
+        properties = schema.get("properties") or {}
+        self.required = list(schema.get("required") or [])
+        self.allow_extra = schema.get("additionalProperties", True) is not False
+        self._coercers = {name: _compile_property(prop if isinstance(prop, dict) else {})
+                          for name, prop in properties.items()}
+        # 別名：先比對 config 的別名，再比對忽略大小寫與底線後的名稱（file_path -> filePath）
+        self._aliases: Dict[str, str] = {}
+        for name in properties:
+            self._aliases.setdefault(_normalize_key(name), name)
+        for canonical, names in (DEFAULT_ALIASES if aliases is None else aliases).items():
+            if canonical in properties:
+                for alias in names:
+                    if alias not in properties:
+                        self._aliases[alias] = canonical
+        self.signature = ", ".join(
+            f"{name} ({'/'.join(_schema_types(prop)) or 'any'}{', required' if name in self.required else ''})"
+            for name, prop in properties.items() if isinstance(prop, dict)
+        )
+
+    def _resolve(self, key: str) -> Optional[str]:
+        if key in self._coercers:
+            return key
+        return self._aliases.get(key) or self._aliases.get(_normalize_key(key))
+
+    def __call__(self, arguments: Any) -> Dict[str, Any]:
+        if arguments is None:
+            arguments = {}
+        elif isinstance(arguments, str):
+            try:
+                arguments = json.loads(arguments) if arguments.strip() else {}
+            except ValueError:
+                raise ToolArgumentError(f"arguments must be a JSON object. Expected parameters: {self.signature}")
+        if not isinstance(arguments, Mapping):
+            raise ToolArgumentError(f"arguments must be a JSON object. Expected parameters: {self.signature}")
+
+        result = {}
+        errors = []
+        for key, value in arguments.items():
+            name = self._resolve(key)
+            if name is None:
+                if self.allow_extra:
+                    result[key] = value
+                else:
+                    errors.append(f"unknown argument '{key}'")
+                continue
+            if name != key and name in arguments:
+                # 正確名稱與別名同時出現時以正確名稱為準
+                continue
+            try:
+                value = self._coercers[name](value)
+            except ToolArgumentError as e:
+                errors.append(f"'{name}': {e}")
+                continue
+            if value is not _DROP:
+                result[name] = value
+        errors.extend(f"missing required argument '{name}'" for name in self.required if name not in result)
+        if errors:
+            raise ToolArgumentError(f"{'; '.join(errors)}. Expected parameters: {self.signature}")
+        return result
+
+
+def aliases_from_config(config_path: str = "config.json") -> Dict[str, List[str]]:
+    """``Tool_Arguments.ALIASES`` from config.json, or the built-in aliases"""
+    return get_config_store(config_path).section("Tool_Arguments").get("ALIASES", DEFAULT_ALIASES)
@@ -0,0 +1,237 @@
+import contextvars
+import hashlib
+import json
+import threading
+import time
+import weakref
+from typing import Any, Callable, Dict, List, Optional
+
+from mcp.types import Tool
+
+from config_store import get_config_store
+from debug_logging import get_logger
+from tracing import span
+
+logger = get_logger("tool_catalog_debug")
+
+
+def _tools_signature(tools: List[Any]) -> str:
+    encoded = json.dumps(
+        [t.model_dump(mode="json", exclude_none=True) if isinstance(t, Tool) else repr(t) for t in tools],
+        sort_keys=True, ensure_ascii=False, default=str,
+    )
+    return hashlib.sha256(encoded.encode("utf-8")).hexdigest()
+
+
+def server_config_hash(server_config: Dict[str, Any]) -> str:
+    """Stable hash of one ``MCP_Servers`` entry; editing it invalidates the cached catalog"""
+    encoded = json.dumps(server_config, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(encoded.encode("utf-8")).hexdigest()[:16]
+
+
+class ToolCatalog:
+    """
+    Per-server cache of ``list_tools`` results, persisted to ``cache_path``.
+
+    An entry is used only while the server's config hash still matches.
+    The first lookup per process answers from disk immediately and refreshes
+    in the background; the refresh replaces the entry (including the server
+    version reported by ``initialize()``). ``tools_changed`` is wired to MCP
+    ``notifications/tools/list_changed`` through the session pool. Refresh
+    listeners are called with ``(server_type, tools)`` whenever a refresh
+    returns a tool set that differs from the one served before.
+    """
+
+    def __init__(self, pool, cache_path: str = "tool_catalog.json", config_path: str = "config.json",
+                 enabled: bool = True):
+        self.pool = pool
+        self.store = get_config_store(cache_path)
+        self.config_path = config_path
+        self.enabled = enabled
+        self.stats = {"hits": 0, "misses": 0, "refreshes": 0, "invalidations": 0}
+        self._memory: Dict[str, List[Tool]] = {}
+        # 本 process 已向 server 確認過的 catalog，不再背景刷新
+        self._confirmed = set()
+        self._refreshing = set()
+        # 最近一次提供出去的工具集合的指紋，用來判斷刷新後是否有變動
+        self._signatures: Dict[str, str] = {}
+        self._listeners: List[Callable[[str, List[Any]], None]] = []
+        self._lock = threading.Lock()
+
+    def _config_hash(self, server_type: str) -> str:
+        servers = get_config_store(self.config_path).section("MCP_Servers")
+        return server_config_hash(servers.get(server_type, {}))
+
+    def get(self, server_type: str) -> Optional[List[Tool]]:
+        """Cached tools for ``server_type`` or None"""
+        with self._lock:
+            if server_type in self._memory:
+                return self._memory[server_type]
+        entry = self.store.get().get(server_type)
+        if not entry or entry.get("config_hash") != self._config_hash(server_type):
+            return None
+        try:
+            tools = [Tool.model_validate(t) for t in entry["tools"]]
+        except Exception as e:
+            logger.warning("[WARNING] ignoring unreadable tool catalog for %s: %s", server_type, e)
+            return None
+        with self._lock:
+            self._memory[server_type] = tools
+            self._signatures.setdefault(server_type, _tools_signature(tools))
+        return tools
+
+    def put(self, server_type: str, tools: List[Any], server_version: Optional[str] = None):
+        """Store a fresh ``list_tools`` result in memory and on disk"""
+        with self._lock:
+            self._memory[server_type] = tools
+            self._confirmed.add(server_type)
+        if not all(isinstance(t, Tool) for t in tools):
+            # 非標準格式的回傳不寫入磁碟
+            return
+        entry = {
+            "config_hash": self._config_hash(server_type),
+            "server_version": server_version,
+            "tools": [t.model_dump(mode="json", exclude_none=True) for t in tools],
+        }
+        previous = dict(self.store.get().get(server_type) or {})
+        previous.pop("updated_at", None)
+        if previous == entry:
+            return
+        if previous.get("server_version") not in (None, server_version):
+            logger.info("%s version changed %s -> %s, tool catalog replaced",
+                        server_type, previous.get("server_version"), server_version)
+        with self.store.batch() as cache:
+            cache[server_type] = dict(entry, updated_at=time.time())
+
+    def invalidate(self, server_type: str):
+        """Drop the cached catalog, e.g. on ``notifications/tools/list_changed``"""
+        with self._lock:
+            self._memory.pop(server_type, None)
+            self._confirmed.discard(server_type)
+        self.stats["invalidations"] += 1
+        if server_type in self.store.get():
+            with self.store.batch() as cache:
+                cache.pop(server_type, None)
+        logger.debug("[DEBUG] tool catalog for %s invalidated", server_type)
+
+    def tools_changed(self, server_type: str):
+        """``notifications/tools/list_changed``: drop the cache and fetch the new list in the background"""
+        self.invalidate(server_type)
+        self._refresh_in_background(server_type)
+
+    def add_refresh_listener(self, listener: Callable[[str, List[Any]], None]):
+        if listener not in self._listeners:
+            self._listeners.append(listener)
+
+    def remove_refresh_listener(self, listener: Callable[[str, List[Any]], None]):
+        if listener in self._listeners:
+            self._listeners.remove(listener)
+
+    async def refresh(self, server_type: str) -> List[Any]:
+        """Fetch the tool list from the server and update the cache"""
+        snapshot = await self.pool.fetch_tool_catalog(server_type)
+        self.stats["refreshes"] += 1
+        tools = snapshot["tools"]
+        self.put(server_type, tools, snapshot.get("server_version"))
+        signature = _tools_signature(tools)
+        with self._lock:
+            previous = self._signatures.get(server_type)
+            self._signatures[server_type] = signature
+        if previous is not None and previous != signature:
+            logger.info("tool list of %s changed, notifying %d listener(s)", server_type, len(self._listeners))
+            for listener in list(self._listeners):
+                try:
+                    listener(server_type, tools)
+                except Exception as e:
+                    logger.warning("[WARNING] tool catalog listener failed for %s: %s", server_type, e)
+        return tools
+
+    def _refresh_in_background(self, server_type: str):
+        from background_loop import get_background_loop
+
+        with self._lock:
+            if server_type in self._confirmed or server_type in self._refreshing:
+                return
+            self._refreshing.add(server_type)
+
+        async def run():
+            try:
+                await self.refresh(server_type)
+            except Exception as e:
+                logger.warning("[WARNING] background tool catalog refresh for %s failed: %s", server_type, e)
+            finally:
+                with self._lock:
+                    self._refreshing.discard(server_type)
+
+        # 背景刷新不屬於目前的 trace，用空的 context 排程
+        contextvars.Context().run(get_background_loop().submit, run())
+
+    async def list_tools(self, server_type: str) -> List[Any]:
+        """Tools of ``server_type``, from cache when possible"""
+        with span("catalog.list_tools", server=server_type) as catalog_span:
+            cached = self.get(server_type) if self.enabled else None
+            if catalog_span is not None:
+                catalog_span.set(hit=cached is not None)
+            if cached is not None:
+                self.stats["hits"] += 1
+                self._refresh_in_background(server_type)
+                return cached
+            self.stats["misses"] += 1
+            return await self.refresh(server_type)
+
+
+_catalog: Optional[ToolCatalog] = None
+_catalog_lock = threading.Lock()
+
+
+def get_tool_catalog(config_path: str = "config.json") -> ToolCatalog:
+    """Return the process-wide catalog, subscribed to the session pool's list_changed events"""
+    global _catalog
+    with _catalog_lock:
+        if _catalog is None:
+            from mcpsession_pool import get_session_pool
+
+            settings = get_config_store(config_path).section("Tool_Catalog")
+            pool = get_session_pool(config_path)
+            _catalog = ToolCatalog(
+                pool,
+                cache_path=settings.get("CACHE_FILE", "tool_catalog.json"),
+                config_path=config_path,
+                enabled=settings.get("ENABLED", True),
+            )
+            pool.add_tools_changed_listener(_catalog.tools_changed)
+        return _catalog
+
+
+def sync_tool_manager(tool_manager, servers: List[str], make_call_tool: Callable[[str], Callable],
+                      loop=None, catalog: Optional[ToolCatalog] = None):
+    """
+    Keep ``tool_manager``'s tools of ``servers`` in step with catalog refreshes
+    (background refresh after a warm start, ``tools/list_changed``).
+    ``make_call_tool(server)`` returns the function to register. Pass the
+    agent's ``loop`` if it is not the background loop the refresh runs on.
+    The listener goes away with the tool manager.
+    """
+    catalog = catalog or get_tool_catalog()
+    manager_ref = weakref.ref(tool_manager)
+
+    def apply(server_type, tools):
+        manager = manager_ref()
+        if manager is None:
+            return
+        registered, removed = manager.sync_server_tools(server_type, tools, make_call_tool(server_type))
+        logger.info("tools of %s updated: %d registered, %d removed", server_type, len(registered), len(removed))
+
+    def listener(server_type, tools):
+        if manager_ref() is None:
+            catalog.remove_refresh_listener(listener)
+            return
+        if server_type not in servers:
+            return
+        if loop is None:
+            apply(server_type, tools)
+        else:
+            loop.call_soon_threadsafe(apply, server_type, tools)
+
+    catalog.add_refresh_listener(listener)
+    return listener
@@ -0,0 +1,161 @@
+import json
+import os
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from config_store import get_config_store
+
+# 只有列在這裡（或 config 的 READ_ONLY_TOOLS）的工具會被快取，其餘一律視為會修改狀態
+DEFAULT_READ_ONLY_TOOLS = [
+    "read_file", "read_text_file", "read_media_file", "read_multiple_files",
+    "list_directory", "list_directory_with_sizes", "directory_tree",
+    "get_file_info", "search_files", "list_allowed_directories",
+    "excel_describe_sheets", "excel_read_sheet",
+]
+DEFAULT_PATH_ARGUMENTS = [
+    "path", "paths", "fileAbsolutePath", "file_path", "filepath", "file", "filePath",
+]
+
+
+def _is_error(result: Any) -> bool:
+    if isinstance(result, dict):
+        return result.get("status") == "error"
+    return bool(getattr(result, "isError", False))
+
+
+def _result_size(result: Any) -> int:
+    if hasattr(result, "model_dump_json"):
+        return len(result.model_dump_json())
+    try:
+        return len(json.dumps(result, ensure_ascii=False, default=str))
+    except (TypeError, ValueError):
+        return len(str(result))
+
+
+def _mtime(path: str) -> Optional[int]:
+    try:
+        return os.stat(path).st_mtime_ns
+    except (OSError, ValueError):
+        return None
+
+
+class ToolResultCache:
+    """
+    LRU cache of read-only MCP tool results, bounded by total result size.
+
+    A cached result is dropped when
+      - a mutating tool (anything not in ``read_only_tools``) runs on the same server
+      - the mtime of a path named in the arguments changed since it was cached
+    Paths are stat'ed locally, so mtime checks only help for servers that see
+    the same filesystem (stdio servers); ``directory_tree`` only notices changes
+    to the top directory.
+    """
+
+    def __init__(self, max_bytes: int = 8 * 1024 * 1024,
+                 read_only_tools: Iterable[str] = DEFAULT_READ_ONLY_TOOLS,
+                 path_arguments: Iterable[str] = DEFAULT_PATH_ARGUMENTS):
+        self.max_bytes = max_bytes
+        self.read_only_tools = set(read_only_tools)
+        self.path_arguments = list(path_arguments)
+        self.stats = {"hits": 0, "misses": 0, "evictions": 0, "invalidations": 0, "bytes": 0}
+        # key -> (result, size, {path: mtime})
+        self._entries: "OrderedDict[Tuple, Tuple[Any, int, Dict[str, Optional[int]]]]" = OrderedDict()
+        # 每個 server 的世代編號；mutating 工具執行時遞增，避免同時進行的讀取寫回舊結果
+        self._generations: Dict[Optional[str], int] = {}
+
+    @classmethod
+    def from_settings(cls, settings: Dict[str, Any]):
+        """Create from the ``Tool_Cache`` section of config.json"""
+        return cls(
+            max_bytes=settings.get("MAX_BYTES", 8 * 1024 * 1024),
+            read_only_tools=settings.get("READ_ONLY_TOOLS", DEFAULT_READ_ONLY_TOOLS),
+            path_arguments=settings.get("PATH_ARGUMENTS", DEFAULT_PATH_ARGUMENTS),
+        )
+
+    def is_read_only(self, name: str) -> bool:
+        return name in self.read_only_tools
+
+    @staticmethod
+    def _key(server: Optional[str], name: str, arguments: Dict[str, Any]) -> Tuple:
+        return (server, name, json.dumps(arguments or {}, sort_keys=True, ensure_ascii=False, default=str))
+
+    def _paths(self, arguments: Dict[str, Any]) -> List[str]:
+        paths = []
+        for key in self.path_arguments:
+            value = (arguments or {}).get(key)
+            if isinstance(value, str):
+                paths.append(value)
+            elif isinstance(value, list):
+                paths.extend(v for v in value if isinstance(v, str))
+        return paths
+
+    def _drop(self, key):
+        _, size, _ = self._entries.pop(key)
+        self.stats["bytes"] -= size
+
+    def lookup(self, server: Optional[str], name: str, arguments: Dict[str, Any]) -> Tuple[bool, Any]:
+        """Return ``(True, result)`` on a valid hit, else ``(False, None)``"""
+        if not self.is_read_only(name):
+            return False, None
+        key = self._key(server, name, arguments)
+        entry = self._entries.get(key)
+        if entry is not None:
+            result, _, mtimes = entry
+            if all(_mtime(path) == mtime for path, mtime in mtimes.items()):
+                self._entries.move_to_end(key)
+                self.stats["hits"] += 1
+                return True, result
+            self._drop(key)
+            self.stats["invalidations"] += 1
+        self.stats["misses"] += 1
+        return False, None
+
+    def begin(self, server: Optional[str], name: str, arguments: Dict[str, Any]) -> Tuple:
+        """
+        Call before running a tool; pass the returned token to ``store``.
+        Path mtimes are taken before the call so a change during it is not missed.
+        """
+        if not self.is_read_only(name):
+            self.invalidate_server(server)
+            return (None, {})
+        mtimes = {path: _mtime(path) for path in self._paths(arguments)}
+        return (self._generations.get(server, 0), mtimes)
+
+    def store(self, server: Optional[str], name: str, arguments: Dict[str, Any], result: Any, token: Tuple):
+        """Cache a read-only result, or invalidate the server after a mutating call"""
+        if not self.is_read_only(name):
+            self.invalidate_server(server)
+            return
+        generation, mtimes = token
+        if _is_error(result) or generation != self._generations.get(server, 0):
+            return
+        size = _result_size(result)
+        if size > self.max_bytes:
+            return
+        key = self._key(server, name, arguments)
+        if key in self._entries:
+            self._drop(key)
+        self._entries[key] = (result, size, mtimes)
+        self.stats["bytes"] += size
+        while self.stats["bytes"] > self.max_bytes:
+            self._drop(next(iter(self._entries)))
+            self.stats["evictions"] += 1
+
+    def invalidate_server(self, server: Optional[str]):
+        """Drop every cached result of ``server``"""
+        self._generations[server] = self._generations.get(server, 0) + 1
+        for key in [k for k in self._entries if k[0] == server]:
+            self._drop(key)
+            self.stats["invalidations"] += 1
+
+    def clear(self):
+        for server in {k[0] for k in self._entries}:
+            self.invalidate_server(server)
+
+
+def result_cache_from_config(config_path: str = "config.json") -> Optional[ToolResultCache]:
+    """A new cache if ``Tool_Cache.ENABLED`` is true in config.json, else None"""
+    settings = get_config_store(config_path).section("Tool_Cache")
+    if not settings.get("ENABLED", False):
+        return None
+    return ToolResultCache.from_settings(settings)
@@ -0,0 +1,144 @@
+import math
+import re
+from collections import Counter
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import ollama
+
+from debug_logging import get_logger
+from history_manager import CHARS_PER_TOKEN
+
+logger = get_logger("tool_selector_debug")
+
+_WORD = re.compile(r"[A-Z]+(?![a-z])|[A-Z]?[a-z]+|[0-9]+|[一-鿿]")
+# 描述裡常見但對挑選工具沒有幫助的字
+STOPWORDS = {"a", "an", "and", "are", "as", "at", "be", "by", "for", "from", "in", "is", "it", "me",
+             "of", "on", "or", "that", "the", "this", "to", "with", "you", "your", "please", "can"}
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase words; splits snake_case and camelCase (``read_file`` -> read, file)"""
+    words = (w.lower() for w in _WORD.findall(text or ""))
+    return [w for w in words if w not in STOPWORDS]
+
+
+def _tool_text(tool) -> str:
+    """Text indexed for one tool: name, description and parameter names/descriptions"""
+    parts = [tool.remote_name or tool.name, tool.name, tool.description or ""]
+    for param, schema in (tool.properties or {}).items():
+        parts.append(param)
+        if isinstance(schema, dict):
+            parts.append(str(schema.get("description", "")))
+    return " ".join(parts)
+
+
+def spec_tokens(specs_json: str) -> int:
+    """Rough prompt-token cost of serialized tool specs (same estimate as the history budget)"""
+    return len(specs_json) // CHARS_PER_TOKEN
+
+
+class BM25Index:
+    """Okapi BM25 over a small set of documents"""
+
+    def __init__(self, documents: Dict[str, str], k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.terms = {name: Counter(tokenize(text)) for name, text in documents.items()}
+        self.lengths = {name: sum(counts.values()) for name, counts in self.terms.items()}
+        self.avg_length = (sum(self.lengths.values()) / len(self.lengths)) if self.lengths else 0
+        df = Counter(term for counts in self.terms.values() for term in counts)
+        n = len(documents)
+        self.idf = {term: math.log(1 + (n - freq + 0.5) / (freq + 0.5)) for term, freq in df.items()}
+
+    def scores(self, query: str) -> Dict[str, float]:
+        query_terms = [t for t in tokenize(query) if t in self.idf]
+        result = {}
+        for name, counts in self.terms.items():
+            norm = self.k1 * (1 - self.b + self.b * self.lengths[name] / (self.avg_length or 1))
+            score = 0.0
+            for term in query_terms:
+                tf = counts.get(term, 0)
+                if tf:
+                    score += self.idf[term] * tf * (self.k1 + 1) / (tf + norm)
+            result[name] = score
+        return result
+
+
+def _cosine(a: List[float], b: List[float]) -> float:
+    dot = sum(x * y for x, y in zip(a, b))
+    norm = math.sqrt(sum(x * x for x in a)) * math.sqrt(sum(y * y for y in b))
+    return dot / norm if norm else 0.0
+
+
+class ToolSelector:
+    """
+    Picks the ``top_k`` registered tools most relevant to a user message so
+    only their schemas are sent to the model. Falls back to every tool when
+    there are few tools or nothing in the message matches any tool.
+
+    ``method`` is "bm25" (in-memory, no extra requests) or "embeddings"
+    (``ollama.embed`` with ``embedding_model``; falls back to BM25 on error).
+    """
+
+    def __init__(self, top_k: int = 6, method: str = "bm25", embedding_model: Optional[str] = None,
+                 always_include: Iterable[str] = ()):
+        self.top_k = top_k
+        self.method = method
+        self.embedding_model = embedding_model
+        self.always_include = set(always_include)
+        self._signature = None
+        self._bm25: Optional[BM25Index] = None
+        self._embeddings: Dict[str, List[float]] = {}
+
+    @classmethod
+    def from_settings(cls, settings: Dict[str, Any]):
+        """Create from the ``Tool_Selection`` section of config.json"""
+        return cls(
+            top_k=settings.get("TOP_K", 6),
+            method=settings.get("METHOD", "bm25"),
+            embedding_model=settings.get("EMBEDDING_MODEL"),
+            always_include=settings.get("ALWAYS_INCLUDE", []),
+        )
+
+    def _index(self, tools: Dict[str, Any]):
+        signature = tuple(sorted((name, tool.description) for name, tool in tools.items()))
+        if signature != self._signature:
+            self._signature = signature
+            self._bm25 = BM25Index({name: _tool_text(tool) for name, tool in tools.items()})
+            self._embeddings = {}
+
+    async def _embedding_scores(self, tools: Dict[str, Any], query: str) -> Dict[str, float]:
+        client = ollama.AsyncClient()
+        missing = [name for name in tools if name not in self._embeddings]
+        if missing:
+            response = await client.embed(model=self.embedding_model, input=[_tool_text(tools[n]) for n in missing])
+            self._embeddings.update(zip(missing, response.embeddings))
+        query_embedding = (await client.embed(model=self.embedding_model, input=query)).embeddings[0]
+        return {name: _cosine(query_embedding, self._embeddings[name]) for name in tools}
+
+    async def select(self, tools: Dict[str, Any], query: str) -> Tuple[Optional[List[str]], str]:
+        """
+        Return ``(names, method)``; ``names`` is None when every tool should be
+        sent. ``method`` tells which ranking was used (or why it fell back).
+        """
+        if len(tools) <= self.top_k:
+            return None, "all"
+        self._index(tools)
+        scores = None
+        method = self.method
+        if self.method == "embeddings" and self.embedding_model:
+            try:
+                scores = await self._embedding_scores(tools, query)
+            except Exception as e:
+                logger.warning("[WARNING] embedding tool selection failed, using bm25: %s", e)
+                method = "bm25"
+        if scores is None:
+            method = "bm25"
+            scores = self._bm25.scores(query)
+            if not any(scores.values()):
+                # 訊息和任何工具都對不上（例如只有中文），送出全部工具
+                return None, "fallback"
+        ranked = sorted(tools, key=lambda name: scores.get(name, 0.0), reverse=True)
+        selected = ranked[:self.top_k]
+        selected += [name for name in tools if name in self.always_include and name not in selected]
+        return selected, method
@@ -0,0 +1,268 @@
+import json
+import math
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterable, List, Optional
+
+from config_store import get_config_store
+
+
+class Span:
+    """One timed operation inside a trace"""
+    __slots__ = ("trace", "name", "span_id", "parent_id", "start", "end", "attributes")
+
+    def __init__(self, trace: "Trace", name: str, parent_id: Optional[str], attributes: Dict[str, Any]):
+        self.trace = trace
+        self.name = name
+        self.span_id = uuid.uuid4().hex[:16]
+        self.parent_id = parent_id
+        self.start = time.perf_counter()
+        self.end: Optional[float] = None
+        self.attributes = dict(attributes)
+
+    def set(self, **attributes):
+        """Add or update attributes, e.g. token counts known only at the end"""
+        self.attributes.update(attributes)
+
+    @property
+    def duration_ms(self) -> Optional[float]:
+        return None if self.end is None else (self.end - self.start) * 1000
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "start_ms": round((self.start - self.trace.root.start) * 1000, 3),
+            "duration_ms": round(self.duration_ms or 0.0, 3),
+            "attributes": self.attributes,
+        }
+
+
+class Trace:
+    """All spans recorded for one turn (or one initialization)"""
+
+    def __init__(self, name: str, attributes: Dict[str, Any]):
+        self.trace_id = uuid.uuid4().hex
+        self.started_at = datetime.now(timezone.utc).isoformat()
+        self.spans: List[Span] = []
+        self._lock = threading.Lock()
+        self.root = Span(self, name, None, attributes)
+        self.spans.append(self.root)
+
+    def add(self, span: Span):
+        # 工具呼叫可能在其他 thread（session pool loop）上記錄 span
+        with self._lock:
+            self.spans.append(span)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "trace_id": self.trace_id,
+            "name": self.root.name,
+            "started_at": self.started_at,
+            "duration_ms": round(self.root.duration_ms or 0.0, 3),
+            "attributes": self.root.attributes,
+            "spans": [span.to_dict() for span in self.spans],
+        }
+
+
+_current_trace: ContextVar[Optional[Trace]] = ContextVar("current_trace", default=None)
+_current_span: ContextVar[Optional[Span]] = ContextVar("current_span", default=None)
+
+
+def _reset(var: ContextVar, token, previous):
+    try:
+        var.reset(token)
+    except ValueError:
+        # async generator 被其他 context 關閉時 token 不能 reset，改為直接還原
+        var.set(previous)
+
+
+DEFAULT_MAX_BYTES = 5 * 1024 * 1024
+
+
+class Tracer:
+    """
+    Records nested spans with contextvars and appends one JSON line per
+    finished trace to ``path``. Spans opened outside a trace are no-ops.
+    When the file grows past ``max_bytes`` it is moved to ``path + ".1"``
+    (replacing the previous backup) and a new file is started.
+    """
+
+    def __init__(self, path: str = "traces.jsonl", enabled: bool = True, max_bytes: int = DEFAULT_MAX_BYTES):
+        self.path = path
+        self.enabled = enabled
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def trace(self, name: str, **attributes):
+        """Start a new trace whose root span covers the ``with`` block"""
+        if not self.enabled:
+            yield None
+            return
+        trace = Trace(name, attributes)
+        previous_trace, previous_span = _current_trace.get(), _current_span.get()
+        trace_token = _current_trace.set(trace)
+        span_token = _current_span.set(trace.root)
+        try:
+            yield trace.root
+        except BaseException as e:
+            trace.root.set(error=type(e).__name__)
+            raise
+        finally:
+            trace.root.end = time.perf_counter()
+            _reset(_current_span, span_token, previous_span)
+            _reset(_current_trace, trace_token, previous_trace)
+            self.export(trace)
+
+    @contextmanager
+    def span(self, name: str, **attributes):
+        """Record a child span of the current span"""
+        trace = _current_trace.get()
+        if trace is None:
+            yield None
+            return
+        parent = _current_span.get()
+        span = Span(trace, name, parent.span_id if parent else None, attributes)
+        trace.add(span)
+        token = _current_span.set(span)
+        try:
+            yield span
+        except BaseException as e:
+            span.set(error=type(e).__name__)
+            raise
+        finally:
+            span.end = time.perf_counter()
+            _reset(_current_span, token, parent)
+
+    def export(self, trace: Trace):
+        line = json.dumps(trace.to_dict(), ensure_ascii=False, default=str)
+        try:
+            with self._lock:
+                with open(self.path, "a", encoding="utf-8") as f:
+                    f.write(line + "\n")
+                    size = f.tell()
+                if self.max_bytes and size > self.max_bytes:
+                    os.replace(self.path, self.path + ".1")
+        except OSError:
+            pass
+
+
+_tracer: Optional[Tracer] = None
+_tracer_lock = threading.Lock()
+
+
+def get_tracer() -> Tracer:
+    """Return the process-wide tracer configured by the ``Tracing`` section"""
+    global _tracer
+    with _tracer_lock:
+        if _tracer is None:
+            settings = get_config_store().section("Tracing")
+            _tracer = Tracer(settings.get("TRACE_FILE", "traces.jsonl"), settings.get("ENABLED", True),
+                             settings.get("MAX_BYTES", DEFAULT_MAX_BYTES))
+        return _tracer
+
+
+def span(name: str, **attributes):
+    """Shortcut for ``get_tracer().span(...)``"""
+    return get_tracer().span(name, **attributes)
+
+
+# ---- 讀取與統計，供 Performance 頁面使用 ----
+
+def _tail_lines(path: str, count: int, block_size: int = 64 * 1024) -> List[bytes]:
+    """Last ``count`` lines of ``path``, reading backwards from the end in blocks"""
+    try:
+        f = open(path, "rb")
+    except OSError:
+        return []
+    with f:
+        end = f.seek(0, os.SEEK_END)
+        data = b""
+        while end > 0 and data.count(b"\n") <= count:
+            start = max(0, end - block_size)
+            f.seek(start)
+            data = f.read(end - start) + data
+            end = start
+    lines = data.splitlines()
+    if end > 0:
+        # 第一行可能只讀到一半
+        lines = lines[1:]
+    return lines[-count:] if count > 0 else []
+
+
+def load_traces(path: Optional[str] = None, limit: int = 50) -> List[Dict[str, Any]]:
+    """Return the last ``limit`` traces from the JSONL file (and its rotated backup), oldest first"""
+    path = path or get_tracer().path
+    lines = _tail_lines(path, limit)
+    if len(lines) < limit:
+        lines = _tail_lines(path + ".1", limit - len(lines)) + lines
+    traces = []
+    for line in lines:
+        try:
+            traces.append(json.loads(line))
+        except json.JSONDecodeError:
+            continue
+    return traces
+
+
+def percentile(values: List[float], p: float) -> Optional[float]:
+    """Nearest-rank percentile, ``p`` in 0..100"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = math.ceil(p / 100 * len(ordered))
+    return ordered[min(max(rank, 1), len(ordered)) - 1]
+
+
+def latency_by(traces: Iterable[Dict[str, Any]], span_name: str, attribute: str) -> List[Dict[str, Any]]:
+    """p50/p95 duration of ``span_name`` spans grouped by one attribute"""
+    groups: Dict[str, List[float]] = {}
+    for trace in traces:
+        for s in trace.get("spans", []):
+            if s["name"] == span_name:
+                key = str(s["attributes"].get(attribute, "?"))
+                groups.setdefault(key, []).append(s["duration_ms"])
+    return [
+        {
+            attribute: key,
+            "count": len(values),
+            "p50_ms": round(percentile(values, 50), 1),
+            "p95_ms": round(percentile(values, 95), 1),
+        }
+        for key, values in sorted(groups.items())
+    ]
+
+
+def waterfall_rows(trace: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Flatten one exported trace into rows for a waterfall chart, children indented under parents"""
+    spans = trace.get("spans", [])
+    by_id = {s["span_id"]: s for s in spans}
+
+    def depth(s):
+        d = 0
+        while s.get("parent_id") in by_id:
+            s = by_id[s["parent_id"]]
+            d += 1
+        return d
+
+    rows = []
+    for i, s in enumerate(sorted(spans, key=lambda s: s["start_ms"])):
+        attrs = s.get("attributes", {})
+        detail = attrs.get("tool") or attrs.get("server") or attrs.get("model") or ""
+        label = f"{i:02d} {'  ' * depth(s)}{s['name']}" + (f" {detail}" if detail else "")
+        rows.append({
+            "label": label,
+            "span": s["name"],
+            "start_ms": s["start_ms"],
+            "end_ms": s["start_ms"] + s["duration_ms"],
+            "duration_ms": s["duration_ms"],
+            "attributes": json.dumps(attrs, ensure_ascii=False, default=str),
+        })
+    return rows